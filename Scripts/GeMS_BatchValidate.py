@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+"""Batch Validate Databases
+
+Finds every file geodatabase and geopackage under a folder and validates each one
+with GeMS_ValidateDatabase.py. Databases are validated concurrently in a pool of
+worker processes, each in a fresh process and with its own output folder. When
+done, an index page lists the level of compliance of every database with links
+to the validation reports.
+
+The batch can be stopped and started again. Databases that were validated by an
+earlier run and have not changed since are not validated again.
+
+Usage:
+    At the command line with the arguments below.
+    Use '' or '#' for optional arguments that are not required.
+
+Args:
+    root (str) : Path to the folder to search for .gdb and .gpkg databases. Required.
+    out_dir (str) : Path to the output folder. A folder for each database is made
+      inside it. Optional. A folder called 'validate_batch' in root by default.
+    workers (int or str) : Number of databases to validate at the same time.
+      Optional. One less than the number of processors, up to 4, by default.
+    use_idfield (bool or str) : See GeMS_ValidateDatabase.py. Optional. False by
+      default.
+    skip_topology (bool or str) : See GeMS_ValidateDatabase.py. Optional. False
+      by default.
+    full_run (bool or str) : True or false whether to validate every database
+      again, even those that have not changed since the last batch. Optional.
+      False by default.
+
+Returns:
+    BatchValidation.html (file) : Index of level 2 and level 3 compliance of each
+      database with links to the reports. Written to out_dir.
+    BatchValidation.json (file) : State of the batch, the fingerprint and result of
+      each database, used to resume the batch. Written to out_dir.
+    <database folder>/ (folder) : Output of GeMS_ValidateDatabase.py for each
+      database.
+"""
+
+import json
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+from pathlib import Path
+from jinja2 import Environment, FileSystemLoader
+import GeMS_utilityFunctions as guf
+import fingerprints as fp
+
+version_string = "GeMS_BatchValidate.py, version of 3/28/2024"
+
+scripts_dir = Path(__file__).parent
+
+ap = guf.addMsgAndPrint
+
+# suffixes of the databases to validate
+db_suffixes = (".gdb", ".gpkg")
+
+# folders and databases written by GeMS_ValidateDatabase.py, never validated
+skip_names = ("validate", "Topology.gdb")
+
+
+def find_databases(root, out_dir):
+    """Every .gdb and .gpkg under root, in sorted order, skipping out_dir and the
+    output folders of GeMS_ValidateDatabase.py"""
+    dbs = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        here = Path(dirpath)
+        keep = []
+        for d in sorted(dirnames):
+            p = here / d
+            if p == out_dir or d in skip_names or d.endswith("_Validation.gdb"):
+                continue
+            if p.suffix.lower() == ".gdb":
+                dbs.append(p)
+            else:
+                keep.append(d)
+        # do not look inside file geodatabases
+        dirnames[:] = keep
+        for f in sorted(filenames):
+            if Path(f).suffix.lower() == ".gpkg":
+                dbs.append(here / f)
+
+    return sorted(dbs)
+
+
+def db_fingerprint(db_path):
+    """[size, latest modification time] of a geopackage or of all the files in
+    a file geodatabase"""
+    if db_path.is_file():
+        return fp.file_fingerprint(db_path)
+
+    size = 0
+    mtime = 0
+    for f in db_path.iterdir():
+        # lock files come and go while the database is being read
+        if f.suffix.lower() == ".lock" or not f.is_file():
+            continue
+        stat = f.stat()
+        size += stat.st_size
+        mtime = max(mtime, stat.st_mtime_ns)
+    return [size, mtime]
+
+
+def db_workdir(root, out_dir, db_path):
+    """Output folder of one database, named after its path relative to root"""
+    rel = db_path.relative_to(root)
+    name = "__".join(rel.parent.parts + (rel.name.replace(".", "_"),))
+    return out_dir / name
+
+
+def validate(task):
+    """Validate one database in a worker process. Returns (database, result) where
+    result is the entry for the database in the batch state"""
+    db_path, workdir, use_idfield, skip_topology, fingerprint = task
+    start = time.time()
+    result = {"fingerprint": fingerprint, "workdir": workdir.name}
+    try:
+        # imported here so that the parent process does not need arcpy
+        import GeMS_ValidateDatabase as vd
+
+        workdir.mkdir(parents=True, exist_ok=True)
+        # one worker for the rules, databases are already checked in parallel
+        argv = [
+            "GeMS_ValidateDatabase.py",
+            str(db_path),
+            "#",
+            "#",
+            str(workdir),
+            "#",
+            "false",
+            str(use_idfield),
+            str(skip_topology),
+            "false",
+            "false",
+            "false",
+            "false",
+            "1",
+            "false",
+        ]
+        vd.main(argv)
+
+        summary = workdir / f"{db_path.name}-Validation.json"
+        with open(summary, encoding="utf-8") as f:
+            doc = json.load(f)
+        result.update(
+            status="done",
+            level=doc["level"],
+            # rules that could not be checked have no errors, only a note
+            errors=sum(r["errors"] for r in doc["rules"] if r["checked"]),
+            report=f"{workdir.name}/{doc['report']}",
+            errors_report=f"{workdir.name}/{doc['errors_report']}",
+        )
+    except (Exception, SystemExit):
+        # guf.forceExit raises arcpy.ExecuteError, an Exception, and some failures
+        # exit. KeyboardInterrupt is left to stop the worker
+        result.update(status="failed", message=traceback.format_exc(limit=3))
+
+    result["seconds"] = round(time.time() - start, 1)
+    return str(db_path), result
+
+
+def write_index(out_dir, root, dbs, state):
+    """Write BatchValidation.html"""
+    rows = []
+    for db in dbs:
+        entry = state.get(str(db), {"status": "not validated"})
+        rows.append({"database": str(db.relative_to(root)), **entry})
+
+    environment = Environment(loader=FileSystemLoader(scripts_dir))
+    template = environment.get_template("batch_template.jinja")
+    with open(out_dir / "BatchValidation.html", mode="w", encoding="utf-8") as f:
+        f.write(
+            template.render(
+                root=str(root),
+                rows=rows,
+                datetime=time.asctime(time.localtime(time.time())),
+                version_string=version_string,
+            )
+        )
+
+
+def main(argv):
+    args_len = len(argv)
+    root = Path(argv[1]).resolve()
+
+    if 2 < args_len and not argv[2] in ("#", ""):
+        out_dir = Path(argv[2]).resolve()
+    else:
+        out_dir = root / "validate_batch"
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    workers = max(1, min(4, (os.cpu_count() or 1) - 1))
+    if 3 < args_len and not argv[3] in ("#", ""):
+        workers = max(1, int(argv[3]))
+
+    use_idfield = guf.eval_bool(argv[4]) if 4 < args_len else False
+    skip_topology = guf.eval_bool(argv[5]) if 5 < args_len else False
+    full_run = guf.eval_bool(argv[6]) if 6 < args_len else False
+
+    state_path = out_dir / "BatchValidation.json"
+    state = {} if full_run else fp.read_manifest(state_path)
+
+    dbs = find_databases(root, out_dir)
+    ap(f"Found {len(dbs)} databases under {root}")
+
+    # resume: skip databases that were validated and have not changed since
+    tasks = []
+    for db in dbs:
+        fingerprint = db_fingerprint(db)
+        entry = state.get(str(db))
+        if (
+            entry
+            and entry["status"] == "done"
+            and entry["fingerprint"] == fingerprint
+            and (out_dir / entry["report"]).exists()
+        ):
+            continue
+        workdir = db_workdir(root, out_dir, db)
+        tasks.append((db, workdir, use_idfield, skip_topology, fingerprint))
+    if len(tasks) < len(dbs):
+        ap(f"{len(dbs) - len(tasks)} databases have not changed since the last batch")
+
+    if tasks:
+        guf.set_pool_executable()
+        # every database is validated in a new process because
+        # GeMS_ValidateDatabase.py keeps its results in module-level variables
+        with multiprocessing.Pool(
+            min(workers, len(tasks)), maxtasksperchild=1
+        ) as pool:
+            for i, (db, result) in enumerate(
+                pool.imap_unordered(validate, tasks), start=1
+            ):
+                state[db] = result
+                # saved after every database so that the batch can be resumed
+                fp.write_manifest(state_path, state)
+                ap(f"{i}/{len(tasks)} {db}: {result['status']}")
+
+    write_index(out_dir, root, dbs, state)
+    ap(f"Index written to {out_dir / 'BatchValidation.html'}")
+    ap("DONE")
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -6,6 +6,8 @@
 
 import arcpy, os, os.path, sys
 from GeMS_utilityFunctions import *
+import bulk_read as br
+import string_checks as sc
 
 versionString = "GeMS_FixStrings.py, version of 10/5/23"
 rawurl = "https://raw.githubusercontent.com/DOI-USGS/gems-tools-pro/master/Scripts/GeMS_FixStrings.py"
@@ -28,28 +30,26 @@ def fixTableStrings(fc, ws, whereclause):
     for f in fields1:
         fields.append(f.name)
 
+    # find the values to fix a whole column at a time, then only open an edit
+    # session and update the rows that need it
+    table = br.read_columns(os.path.join(ws,fc), fields, whereclause)
+    columns = [table[f].tolist() for f in fields]
+    fixes = {}
+    for i, column in enumerate(columns[1:], start=1):
+        for n, f in sc.fixes(column).items():
+            fixes.setdefault(columns[0][n], {})[i] = f
+    if not fixes:
+        return
+
     edit = arcpy.da.Editor(ws)
     edit.startEditing(False, True)
     edit.startOperation()    
     with arcpy.da.UpdateCursor(os.path.join(ws,fc), fields, where_clause = whereclause) as cursor:
         for row in cursor:
-            trash = ""
-            updateRowFlag = False
-            row1 = [row[0]]
-            for f in row[1:]:
-                updateFieldFlag = False
-                f0 = f
-                if f != None:
-                    if f != f.strip():
-                        f = f.strip()
-                        updateFieldFlag = True
-                    if f.lower() == "<null>" or f == "":
-                        f = None
-                        updateFieldFlag = True
-                    if updateFieldFlag:
-                        updateRowFlag = True
-                row1.append(f)
-            if updateRowFlag:
+            if row[0] in fixes:
+                row1 = list(row)
+                for i, f in fixes[row[0]].items():
+                    row1[i] = f
                 try:
                     addMsgAndPrint(str(row1))
                     cursor.updateRow(row1)
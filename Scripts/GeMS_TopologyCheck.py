@@ -2,9 +2,19 @@
 Reports on certain aspects of geologic-map topology
 
 Inputs:
-    fds with CAF and MUP,
+    fds with CAF and MUP, several such fds separated by ;, or a geodatabase, in
+       which case every fds with a CAF is checked. Several fds are checked at the
+       same time, each in its own process and written to its own _TopologyCheck.gdb,
+       and their reports are joined in <gdb>_TopologyCheck.html, GeologicMap first
     HKey cutoff value for covering units
        (used to calculate whether a concealed continuation should be shown)
+    map name, for enterprise geodatabases
+    optional, command line only: shapely, to planarize CAF and find the map units
+       to either side of each arc in memory with shapely instead of with
+       FeatureToLine and Identity; or compare, to planarize both ways and report
+       the numbers of nodes, bad nodes, fault-flip nodes, missing concealed-arc
+       nodes, and connectFIDs of each side by side. Run compare on a map before
+       relying on shapely for it
 
 Outputs:
     feature class of bad nodes. Includes:
@@ -54,13 +64,20 @@ Significant assumptions:
 #   expanded all commas and plus signs with no spaces for readability (mine, at least!)
 #   increased length of Type field in _Topology geodatabase from 100 to 500 to accommodate longer concatenations
 
-import arcpy, os, sys, math, os.path, operator, time
+import arcpy, os, sys, os.path, operator, time, io, multiprocessing, traceback
+import numpy as np
 from GeMS_utilityFunctions import *
+import node_topology as nt
+
+try:
+    import shapely
+    import shapely_planarize
+except ImportError:
+    shapely = None
 
 # see gems-tools-pro version<=2.2.2 to get earlier TopologyCheck tool
 versionString = "GeMS_TopologyCheck.py, modified versions from 7/3/2024-3"
 rawurl = "https://raw.githubusercontent.com/DOI-USGS/gems-tools-pro/master/Scripts/GeMS_TopologyCheck.py"
-checkVersion(versionString, rawurl, "gems-tools-pro")
 
 htmlStart = """<html>\n
     <head>\n
@@ -213,27 +230,6 @@ def arcOrder(i):
         return 1, [0, 2]
 
 
-def ptsGeographicAzimuth(pt1, pt2):
-    dx = pt2[0] - pt1[0]
-    dy = pt2[1] - pt1[1]
-    azi = math.atan2(dy, dx)
-    azi = 90 - math.degrees(azi)
-    if azi < 0:
-        azi = azi + 360
-    return azi
-
-
-def startEndGeogDirections(lineSeg):
-    firstPoint = [lineSeg[0].X, lineSeg[0].Y]
-    secondPoint = [lineSeg[1].X, lineSeg[1].Y]
-    lpt = len(lineSeg) - 1
-    ntlPoint = [lineSeg[lpt - 1].X, lineSeg[lpt - 1].Y]
-    lastPoint = [lineSeg[lpt].X, lineSeg[lpt].Y]
-    return ptsGeographicAzimuth(firstPoint, secondPoint), ptsGeographicAzimuth(
-        lastPoint, ntlPoint
-    )
-
-
 def makeNodeFC(fd, fc):
     addMsgAndPrint("Building feature class " + fc)
     fdfc = os.path.join(fd, fc)
@@ -296,7 +292,7 @@ def youngestMapUnit(mapUnits, hKeyDict):
     return ymu
 
 
-def isCoveringUnit(mu, hKeyDict):
+def isCoveringUnit(mu, hKeyDict, hKeyTestValue):
     if mu == None or mu == "":  # stuff outside map, unmapped areas
         return False
     elif hKeyDict[mu] < hKeyTestValue:
@@ -305,172 +301,207 @@ def isCoveringUnit(mu, hKeyDict):
         return False
 
 
-def processNodes(nodeList, hKeyDict):
+def nodeRules(nodeList):
+    # evaluates the node rules that only compare the arcs at each node for all
+    # nodes at once. Returns the number of arcs at each node and the rule results
+    nArcs = [len(node[2]) for node in nodeList]
+    arcs = [a for node in nodeList for a in node[2]]
+    faultTypes = {t: isFault(t) for t in set(a.Type for a in arcs)}
+    rules = nt.node_rules(
+        nArcs,
+        np.array([faultTypes[a.Type] for a in arcs], dtype=bool),
+        # a null IsConcealed counts as not concealed, as in the per-node checks
+        np.array([(a.IsConc or "").lower() == "y" for a in arcs], dtype=bool),
+        nt.codes([a.IsConc for a in arcs]),
+        nt.codes([a.Type for a in arcs]),
+        nt.codes(
+            [(a.Type, a.IsConc, a.ExConf, a.IdConf, a.LCM, a.DSID, a.Notes) for a in arcs]
+        ),
+        np.array([a.ToFrom == "From" for a in arcs], dtype=bool),
+    )
+    return np.array(nArcs, dtype=np.intp), rules
+
+
+def processNodes(nodeList, hKeyDict, hKeyTestValue):
     # nodes is a list of nodes (points at which one or more arcs begins or ends)
+    # rules that only compare the arcs at a node are evaluated for all nodes at
+    # once; 3- and 4-arc nodes that pass them are then checked one at a time.
+    # Every result is kept with the index of its node so that the lists come
+    # out in node order
     addMsgAndPrint("Processing nodes")
     badNodes = []
     connectFIDs = []  # pairs of OIDs denoting arcs that should be merged
     missingConcealedArcNodes = []
     faultFlipNodes = []
-    count1 = 0
-    count2 = 0
-    count3 = 0
-    count4 = 0
-    count5 = 0
-    for node in nodeList:
+    nArcs, rules = nodeRules(nodeList)
+    nCon = rules["n_concealed"]
+
+    def flag(mask, note, results):
+        for i in np.flatnonzero(mask).tolist():
+            node = nodeList[i]
+            if note:
+                node.append(note(node) if callable(note) else note)
+            results.append((i, node))
+
+    ######################  1-arc nodes
+    flag(
+        rules["dangle"],
+        lambda node: "dangling concealed contact"
+        if node[2][0].isConcealed()
+        else "dangling contact",
+        badNodes,
+    )
+    ######################  2-arc nodes
+    flag(rules["type_mismatch"], "mismatched Type values", badNodes)
+    flag(rules["concealed_mismatch"], "one arc concealed, one not", badNodes)
+    for i in np.flatnonzero(rules["same_attributes"]).tolist():
+        arcs = nodeList[i][2]
+        connectFIDs.append((i, [arcs[0].OFID, arcs[1].OFID]))
+    flag(
+        rules["fault_flip"],
+        lambda node: node[2][0].ToFrom + ", " + node[2][1].ToFrom,
+        faultFlipNodes,
+    )
+    ######################  3-arc nodes
+    three = nArcs == 3
+    badConcealed = three & ((nCon == 1) | (nCon == 2))
+    flag(badConcealed, "impossible number of concealed arcs", badNodes)
+    flag(
+        three & ~badConcealed & ~rules["same_type"],
+        "at least 2 arcs must be same Type",
+        badNodes,
+    )
+    ######################  4-arc nodes
+    four = nArcs == 4
+    flag(four & (nCon > 2), "too many concealed arcs", badNodes)
+    flag(four & (nCon == 0), "4 unconcealed arcs", badNodes)
+    ######################  5+ arc nodes
+    flag(nArcs > 4, "too many arcs", badNodes)
+
+    ######################  3- and 4-arc nodes that need the map units or geometry
+    checkOneByOne = (three & ~badConcealed & rules["same_type"]) | (
+        four & ((nCon == 1) | (nCon == 2))
+    )
+    for i in np.flatnonzero(checkOneByOne).tolist():
+        node = nodeList[i]
         arcs = node[2]
-        nArcs = len(arcs)
-        ######################
-        if nArcs == 1:
-            count1 += 1
-            if not isFault(arcs[0].Type):  # is a contact
-                if arcs[0].isConcealed():
-                    node.append("dangling concealed contact")
-                    badNodes.append(node)
-                else:  # dangling contact
-                    node.append("dangling contact")
-                    badNodes.append(node)
-        ######################
-        elif nArcs == 2:
-            count2 += 1
-            if arcs[0].Type != arcs[1].Type:
-                node.append("mismatched Type values")
-                badNodes.append(node)
-            if arcs[0].IsConc != arcs[1].IsConc:
-                node.append("one arc concealed, one not")
-                badNodes.append(node)
-            if sameArcAttributes(arcs[0], arcs[1]):
-                connectFIDs.append([arcs[0].OFID, arcs[1].OFID])
-            if (
-                isFault(arcs[0].Type)
-                and isFault(arcs[1].Type)
-                and sameToFrom(arcs[0], arcs[1])
-            ):
-                node.append(arcs[0].ToFrom + ", " + arcs[1].ToFrom)
-                faultFlipNodes.append(node)
-        ######################
-        elif nArcs == 3:
-            count3 += 1
-            nCon, conIndx = concealedArcs(arcs)
+        if len(arcs) == 3:
             same, diff = sameTypeIndices(arcs)
             mapUnits = adjoiningMapUnits(
                 arcs
             )  # map units are ordered by not-adjacent arcs
-            if nCon in (1, 2):  # 1 or 2 arcs are concealed
-                node.append("impossible number of concealed arcs")
-                badNodes.append(node)
-            elif len(same) < 2:  # no two arcs have same type
-                node.append("at least 2 arcs must be same Type")
-                badNodes.append(node)
-            else:  # all arcs or none are concealed, at least two are of same type
-                if nCon == 3:
-                    if mapUnits[0] != mapUnits[1] or mapUnits[1] != mapUnits[2]:
-                        node.append(
-                            "all arcs concealed but bounding map units not all the same"
+            # all arcs or none are concealed, at least two are of same type
+            if nCon[i] == 3:
+                if mapUnits[0] != mapUnits[1] or mapUnits[1] != mapUnits[2]:
+                    node.append(
+                        "all arcs concealed but bounding map units not all the same"
+                    )
+                    badNodes.append((i, node))
+            if len(same) == 2:  # only two arcs have same Type
+                if isFault(arcs[same[0]].Type):
+                    if sameToFrom(arcs[same[0]], arcs[same[1]]):
+                        faultFlipNodes.append((i, node))
+                    elif sameArcAttributes(arcs[same[0]], arcs[same[1]]):
+                        connectFIDs.append(
+                            (i, [arcs[same[0]].OFID, arcs[same[1]].OFID])
                         )
-                        badNodes.append(node)
-                if len(same) == 2:  # only two arcs have same Type
-                    if isFault(arcs[same[0]].Type):
-                        if sameToFrom(arcs[same[0]], arcs[same[1]]):
-                            faultFlipNodes.append(node)
-                        elif sameArcAttributes(arcs[same[0]], arcs[same[1]]):
-                            connectFIDs.append([arcs[same[0]].OFID, arcs[same[1]].OFID])
-                    else:  # two arcs with same Type are not-faults; their shared adjacent poly should be youngest
-                        if youngestMapUnit(mapUnits, hKeyDict) == mapUnits[diff]:
-                            # if same arc attributes, flag for merge
-                            if sameArcAttributes(arcs[same[0]], arcs[same[1]]):
-                                connectFIDs.append(
-                                    [arcs[same[0]].OFID, arcs[same[1]].OFID]
-                                )
-                            # test to see if we could add a concealed extension
-                            if isCoveringUnit(
-                                youngestMapUnit(mapUnits, hKeyDict), hKeyDict
-                            ):
-                                missingConcealedArcNodes.append(node)
-                        else:
-                            node.append(
-                                "# "
-                                + str(mapUnits[diff])
-                                + " is not youngest unit in "
-                                + str(mapUnits)
-                            )
-                            badNodes.append(node)
-                else:  # all 3 arcs have same Type
-                    if isFault(arcs[same[0]].Type):
-                        if sameToFrom(arcs[0], arcs[1], arcs[2]):
-                            faultFlipNodes.append(node)
-                    else:  # all arcs are not-faults
-                        # find the arcs that bound the youngest map unit
-                        ymu = youngestMapUnit(mapUnits, hKeyDict)
-                        youngArcs = [0, 1, 2]
-                        youngArcs.remove(mapUnits.index(ymu))
-                        if sameArcAttributes(arcs[youngArcs[0]], arcs[youngArcs[1]]):
+                else:  # two arcs with same Type are not-faults; their shared adjacent poly should be youngest
+                    if youngestMapUnit(mapUnits, hKeyDict) == mapUnits[diff]:
+                        # if same arc attributes, flag for merge
+                        if sameArcAttributes(arcs[same[0]], arcs[same[1]]):
                             connectFIDs.append(
-                                [arcs[youngArcs[0]].OFID, arcs[youngArcs[1]].OFID]
+                                (i, [arcs[same[0]].OFID, arcs[same[1]].OFID])
                             )
-                        if isCoveringUnit(ymu, hKeyDict) == True:
-                            missingConcealedArcNodes.append(node)
-        ######################
-        elif nArcs == 4:
-            nCon, conIndx = concealedArcs(arcs)
-            if nCon != 0:
-                opp, adj = arcOrder(conIndx[0])
-            if nCon > 2:
-                node.append("too many concealed arcs")
-                badNodes.append(node)
-            elif nCon == 2:
+                        # test to see if we could add a concealed extension
+                        if isCoveringUnit(
+                            youngestMapUnit(mapUnits, hKeyDict),
+                            hKeyDict,
+                            hKeyTestValue,
+                        ):
+                            missingConcealedArcNodes.append((i, node))
+                    else:
+                        node.append(
+                            "# "
+                            + str(mapUnits[diff])
+                            + " is not youngest unit in "
+                            + str(mapUnits)
+                        )
+                        badNodes.append((i, node))
+            else:  # all 3 arcs have same Type
+                if isFault(arcs[same[0]].Type):
+                    if sameToFrom(arcs[0], arcs[1], arcs[2]):
+                        faultFlipNodes.append((i, node))
+                else:  # all arcs are not-faults
+                    # find the arcs that bound the youngest map unit
+                    ymu = youngestMapUnit(mapUnits, hKeyDict)
+                    youngArcs = [0, 1, 2]
+                    youngArcs.remove(mapUnits.index(ymu))
+                    if sameArcAttributes(arcs[youngArcs[0]], arcs[youngArcs[1]]):
+                        connectFIDs.append(
+                            (i, [arcs[youngArcs[0]].OFID, arcs[youngArcs[1]].OFID])
+                        )
+                    if isCoveringUnit(ymu, hKeyDict, hKeyTestValue) == True:
+                        missingConcealedArcNodes.append((i, node))
+        else:  # 4 arcs, 1 or 2 of them concealed
+            conIndx = concealedArcs(arcs)[1]
+            opp, adj = arcOrder(conIndx[0])
+            if nCon[i] == 2:
                 if (
                     arcs[conIndx[0]].Type != arcs[conIndx[1]].Type
                     or arcs[adj[0]].Type != arcs[adj[1]].Type
                 ):
                     node.append("opposite arcs must have same Type")
-                    badNodes.append(node)
+                    badNodes.append((i, node))
                 elif not arcs[
                     opp
                 ].isConcealed():  # thus the 2nd concealed arc must be adjacent
                     node.append("adjacent arcs concealed")
-                    badNodes.append(node)
+                    badNodes.append((i, node))
                 else:  #  geometry is OK. Test for arcs to be merged
                     if sameArcAttributes(arcs[adj[0]], arcs[adj[1]]):
-                        connectFIDs.append([arcs[adj[0]].OFID, arcs[adj[1]].OFID])
+                        connectFIDs.append((i, [arcs[adj[0]].OFID, arcs[adj[1]].OFID]))
                     if isFault(arcs[conIndx[0]].Type) and sameToFrom(
                         arcs[conIndx[0]], arcs[opp]
                     ):
-                        faultFlipNodes.append(node)
+                        faultFlipNodes.append((i, node))
                     elif sameArcAttributes(
                         arcs[conIndx[0]], arcs[opp]
                     ):  # don't merge arcs when one should be flipped
-                        connectFIDs.append([arcs[conIndx[0]].OFID, arcs[opp].OFID])
-            elif nCon == 1:
+                        connectFIDs.append(
+                            (i, [arcs[conIndx[0]].OFID, arcs[opp].OFID])
+                        )
+            else:
                 # adjacent arcs must be same-type contacts and opposite arc must be of same type
                 if isFault(arcs[adj[0]].Type):
                     node.append(
                         "arcs adjacent to single concealed arc must not be faults"
                     )
-                    badNodes.append(node)
+                    badNodes.append((i, node))
                 elif arcs[opp].Type != arcs[conIndx[0]].Type:
                     node.append(
                         "concealed arc and unconcealed continuation must be same Type"
                     )
-                    badNodes.append(node)
+                    badNodes.append((i, node))
                 else:
                     if sameArcAttributes(arcs[adj[0]], arcs[adj[1]]):
-                        connectFIDs.append([arcs[adj[0]].OFID, arcs[adj[1]].OFID])
-            else:  # nConc = 0
-                node.append("4 unconcealed arcs")
-                badNodes.append(node)
-            count4 += 1
-        ######################
-        else:  # 5 or more arcs at this node
-            count5 += 1
-            node.append("too many arcs")
-            badNodes.append(node)
-    addMsgAndPrint("  " + str(count1) + " 1-arc nodes")
-    addMsgAndPrint("  " + str(count2) + " 2-arc nodes")
-    addMsgAndPrint("  " + str(count3) + " 3-arc nodes")
-    addMsgAndPrint("  " + str(count4) + " 4-arc nodes")
-    addMsgAndPrint("  " + str(count5) + " 5+ arc nodes")
-    return badNodes, faultFlipNodes, missingConcealedArcNodes, connectFIDs
+                        connectFIDs.append((i, [arcs[adj[0]].OFID, arcs[adj[1]].OFID]))
+
+    counts = np.bincount(np.minimum(nArcs, 5), minlength=6)
+    addMsgAndPrint("  " + str(counts[1]) + " 1-arc nodes")
+    addMsgAndPrint("  " + str(counts[2]) + " 2-arc nodes")
+    addMsgAndPrint("  " + str(counts[3]) + " 3-arc nodes")
+    addMsgAndPrint("  " + str(counts[4]) + " 4-arc nodes")
+    addMsgAndPrint("  " + str(counts[5]) + " 5+ arc nodes")
+
+    def inNodeOrder(results):
+        return [r for i, r in sorted(results, key=operator.itemgetter(0))]
+
+    return (
+        inNodeOrder(badNodes),
+        inNodeOrder(faultFlipNodes),
+        inNodeOrder(missingConcealedArcNodes),
+        inNodeOrder(connectFIDs),
+    )
 
 
 def insertNodes(ptFc, nodeList):
@@ -503,48 +534,34 @@ def insertNodesXY(ptFc, nodeList):
         cursor.insertRow(row)
 
 
-def getNodes(arcEndPoints):
-    #  sorts arcEndPoints into a Python list of nodes
+def getNodes(arcEndPoints, zeroValue):
+    #  groups arcEndPoints, (x, y, CAF_arc) tuples, into a Python list of nodes.
+    #  Points within zeroValue of each other are one node
     addMsgAndPrint("Sorting segment endpoints into nodes")
-    addMsgAndPrint("  " + str(numberOfRows(arcEndPoints)) + " endpoints")
-    nodeList = []
-    # open searchCursor on arcEndPoints sorted by POINT_X and POINT_Y
-    sql = (None, "ORDER BY POINT_X, POINT_Y")
-    fieldNames = ["POINT_X", "POINT_Y"]
-    fieldNames.extend(CAF_arc.fieldList)
-    lastX = -99999
-    lastY = -99999
-    nodeArcs = []
-    with arcpy.da.SearchCursor(
-        arcEndPoints, fieldNames, None, None, False, sql
-    ) as cursor:
-        for row in cursor:
-            x = row[0]
-            y = row[1]
-            thisArc = CAF_arc(row[2:])
-            if abs(x - lastX) < zeroValue and abs(y - lastY) < zeroValue:
-                nodeArcs.append(thisArc)
-            else:
-                if len(nodeArcs) > 0:
-                    # note that we sort arcs by LineDir, so that they are in clockwise order
-                    nodeArcs.sort(key=operator.attrgetter("LineDir"))
-                    nodeList.append([lastX, lastY, nodeArcs])
-                lastX = x
-                lastY = y
-                nodeArcs = [thisArc]
-        nodeArcs.sort(key=operator.attrgetter("LineDir"))
-        nodeList.append([lastX, lastY, nodeArcs])
+    addMsgAndPrint("  " + str(len(arcEndPoints)) + " endpoints")
+    xs = [p[0] for p in arcEndPoints]
+    ys = [p[1] for p in arcEndPoints]
+    lineDirs = [p[2].LineDir for p in arcEndPoints]
+    nodeOfPoint, nodeXY = nt.snap_points(xs, ys, zeroValue)
+    # note that we sort arcs by LineDir, so that they are in clockwise order
+    nodeList = [[x, y, []] for x, y in nodeXY.tolist()]
+    nodeOfPoint = nodeOfPoint.tolist()
+    for i in nt.node_order(nodeOfPoint, lineDirs).tolist():
+        nodeList[nodeOfPoint[i]][2].append(arcEndPoints[i][2])
     addMsgAndPrint("  " + str(len(nodeList)) + " nodes")
     return nodeList
 
 
 def planarizeAndGetArcEndPoints(fds, caf, mup, fdsToken):
-    # returns a feature class of endpoints of all caf lines, two per planarized line segment
+    # returns the planarized caf and a list of (x, y, CAF_arc) endpoints of all
+    # caf lines, two per planarized line segment
     addMsgAndPrint(
         "Planarizing " + os.path.basename(caf) + " and getting segment endpoints"
     )
-    #   add LineID (so we can recover lines after planarization)
-    arcpy.AddField_management(caf, "LineID", "LONG")
+    #   add LineID (so we can recover lines after planarization), once if both
+    #   backends planarize the same caf
+    if not "LineID" in fieldNameList(caf):
+        arcpy.AddField_management(caf, "LineID", "LONG")
     arcpy.CalculateField_management(caf, "LineID", "!OBJECTID!", "PYTHON_9.3")
     # planarize CAF by FeatureToLine
     addMsgAndPrint("  planarizing caf")
@@ -566,84 +583,198 @@ def planarizeAndGetArcEndPoints(fds, caf, mup, fdsToken):
                 if hf in fns:
                     deleteFields.append(hf)
     arcpy.DeleteField_management(cafp, deleteFields)
-    #   calculate azimuths startDir and endDir
-    addMsgAndPrint("  adding StartAzimuth and EndAzimuth")
-    for f in ("LineDir", "StartAzimuth", "EndAzimuth"):
-        arcpy.AddField_management(cafp, f, "FLOAT")
+    #   read the line ends and the vertices next to them in one pass
+    addMsgAndPrint("  reading line ends")
+    arcpy.AddField_management(cafp, "LineDir", "FLOAT")
     arcpy.AddField_management(cafp, "ToFrom", "TEXT", "", "", 4)
-    fields = ["SHAPE@", "StartAzimuth", "EndAzimuth"]
-    with arcpy.da.UpdateCursor(cafp, fields) as cursor:
+    # CAF_arc attributes other than LineDir, ToFrom, and ORIG_FID
+    arcFields = CAF_arc.fieldList[:7] + CAF_arc.fieldList[9:11]
+    fields = ["SHAPE@", "OID@"] + arcFields
+    # per line: first vertex, second vertex, last vertex, next-to-last vertex
+    endXY = []
+    attribs = []
+    with arcpy.da.SearchCursor(cafp, fields) as cursor:
         for row in cursor:
             lineSeg = row[0].getPart(0)
-            row[1], row[2] = startEndGeogDirections(lineSeg)
-            cursor.updateRow(row)
-    #   make endpoint feature class
-    addMsgAndPrint("  converting line ends to points")
-    arcEndPoints = (
-        fds + "/" + fdsToken + "xxx_EndPoints"
-    )  # will be a feature class in fds
-    arcEndPoints2 = arcEndPoints + "_end"
-    testAndDelete(arcEndPoints)
-    arcpy.FeatureVerticesToPoints_management(cafp, arcEndPoints, "START")
-    arcpy.CalculateField_management(arcEndPoints, "LineDir", "!StartAzimuth!", "PYTHON")
-    arcpy.CalculateField_management(arcEndPoints, "ToFrom", '"From"', "PYTHON")
-    testAndDelete(arcEndPoints2)
-    arcpy.FeatureVerticesToPoints_management(cafp, arcEndPoints2, "END")
-    arcpy.CalculateField_management(arcEndPoints2, "LineDir", "!EndAzimuth!", "PYTHON")
-    arcpy.CalculateField_management(arcEndPoints2, "ToFrom", '"To"', "PYTHON")
-    arcpy.Append_management(arcEndPoints2, arcEndPoints)
-    testAndDelete(arcEndPoints2)
-    #  delete some more fields
-    deleteFields = [
-        "EndAzimuth",
-        "StartAzimuth",
-        "LEFT_MapUnitPolys",
-        "RIGHT_MapUnitPolys",
-    ]
-    arcpy.DeleteField_management(arcEndPoints, deleteFields)
-    addMsgAndPrint("  adding POINT_X and POINT_Y")
-    arcpy.AddXY_management(arcEndPoints)
+            lpt = len(lineSeg) - 1
+            endXY.append(
+                [[lineSeg[i].X, lineSeg[i].Y] for i in (0, 1, lpt, lpt - 1)]
+            )
+            attribs.append((list(row[2:9]), list(row[9:11]), row[1]))
+    arcEndPoints = arcEndPointsFrom(endXY, attribs)
     testAndDelete(planCaf)
     return cafp, arcEndPoints
 
 
-def unplanarize(cafp, caf, connectFIDs):
+def arcEndPointsFrom(endXY, attribs):
+    # (x, y, CAF_arc) of the start and end of every planarized line. endXY holds
+    # the first, second, last, and next-to-last vertex of each line, attribs
+    # (CAF attributes, [RIGHT_MapUnit, LEFT_MapUnit], ORIG_FID) of each line
+    #   azimuths of the start and end of every line at once
+    addMsgAndPrint("  calculating start and end azimuths")
+    endXY = np.array(endXY, dtype=float).reshape(-1, 4, 2)
+    startAzi = nt.azimuths(endXY[:, 0, 0], endXY[:, 0, 1], endXY[:, 1, 0], endXY[:, 1, 1])
+    endAzi = nt.azimuths(endXY[:, 2, 0], endXY[:, 2, 1], endXY[:, 3, 0], endXY[:, 3, 1])
+    arcEndPoints = []
+    for xy, (arcAttribs, mapUnits, oid), sAzi, eAzi in zip(
+        endXY.tolist(), attribs, startAzi.tolist(), endAzi.tolist()
+    ):
+        fromArc = CAF_arc(arcAttribs + [sAzi, "From"] + mapUnits + [oid])
+        toArc = CAF_arc(arcAttribs + [eAzi, "To"] + mapUnits + [oid])
+        arcEndPoints.append((xy[0][0], xy[0][1], fromArc))
+        arcEndPoints.append((xy[2][0], xy[2][1], toArc))
+    return arcEndPoints
+
+
+def planarizeWithShapely(fds, caf, mup, fdsToken, zeroValue):
+    # same as planarizeAndGetArcEndPoints, but the lines are split and the map
+    # units on either side of them found in memory with shapely (GEOS) instead of
+    # by FeatureToLine and Identity. Returns the planarized caf and the endpoints
+    addMsgAndPrint(
+        "Planarizing " + os.path.basename(caf) + " with shapely and getting segment endpoints"
+    )
+    #   add LineID (so we can recover lines after planarization), once if both
+    #   backends planarize the same caf
+    if not "LineID" in fieldNameList(caf):
+        arcpy.AddField_management(caf, "LineID", "LONG")
+    arcpy.CalculateField_management(caf, "LineID", "!OBJECTID!", "PYTHON_9.3")
+    #   read both feature classes into memory
+    addMsgAndPrint("  reading caf and mup")
+    cafFields = [
+        f.name
+        for f in arcpy.ListFields(caf)
+        if f.editable and not f.type in ("Geometry", "OID") and f.name != "Shape_Length"
+    ]
+    with arcpy.da.SearchCursor(caf, ["SHAPE@WKB", "OID@"] + cafFields) as cursor:
+        cafRows = [row for row in cursor if row[0] is not None]
+    with arcpy.da.SearchCursor(mup, ["SHAPE@WKB", "OID@", "MapUnit"]) as cursor:
+        mupRows = [row for row in cursor if row[0] is not None]
+    lines = shapely.from_wkb([bytes(row[0]) for row in cafRows])
+    polys = shapely.from_wkb([bytes(row[0]) for row in mupRows])
+    addMsgAndPrint("  splitting " + str(len(lines)) + " lines")
+    pieces = shapely_planarize.planarize(lines, polys, zeroValue)
+    #   write the pieces to a new feature class with the fields of caf and of Identity
+    addMsgAndPrint("  writing planarized caf")
+    cafp = caf + "_planarized"
+    testAndDelete(cafp)
+    arcpy.CreateFeatureclass_management(
+        fds, os.path.basename(cafp), "POLYLINE", caf, spatial_reference=caf
+    )
+    for f in ("RIGHT_MapUnit", "LEFT_MapUnit"):
+        arcpy.AddField_management(cafp, f, "TEXT", "", "", 255)
+    for f in ("LEFT_MapUnitPolys", "RIGHT_MapUnitPolys"):
+        arcpy.AddField_management(cafp, f, "LONG")
+    arcpy.AddField_management(cafp, "ORIG_FID", "LONG")
+    arcpy.AddField_management(cafp, "LineDir", "FLOAT")
+    arcpy.AddField_management(cafp, "ToFrom", "TEXT", "", "", 4)
+    # CAF_arc attributes other than LineDir, ToFrom, RIGHT_ and LEFT_MapUnit, and ORIG_FID
+    arcFields = CAF_arc.fieldList[:7]
+    arcIndex = [cafFields.index(f) + 2 if f in cafFields else None for f in arcFields]
+    mupOIDs = [row[1] for row in mupRows] + [-1]
+    mapUnits = [row[2] for row in mupRows] + [""]
+    fields = [
+        "SHAPE@WKB",
+        "RIGHT_MapUnit",
+        "LEFT_MapUnit",
+        "RIGHT_MapUnitPolys",
+        "LEFT_MapUnitPolys",
+        "ORIG_FID",
+    ] + cafFields
+    #   first, second, last, and next-to-last vertex of every piece
+    geoms = pieces["geometry"]
+    endXY = np.stack(
+        [shapely.get_coordinates(shapely.get_point(geoms, i)) for i in (0, 1, -1, -2)],
+        axis=1,
+    )
+    attribs = []
+    with arcpy.da.InsertCursor(cafp, fields) as cursor:
+        # polygon index -1, no polygon, is the last item of mupOIDs and mapUnits
+        for wkb, source, left, right in zip(
+            shapely.to_wkb(geoms).tolist(),
+            pieces["source"].tolist(),
+            pieces["left"].tolist(),
+            pieces["right"].tolist(),
+        ):
+            row = cafRows[source]
+            units = [mapUnits[right], mapUnits[left]]
+            oid = cursor.insertRow(
+                [bytearray(wkb)]
+                + units
+                + [mupOIDs[right], mupOIDs[left], row[1]]
+                + list(row[2:])
+            )
+            arcAttribs = [row[i] if i is not None else None for i in arcIndex]
+            attribs.append((arcAttribs, units, oid))
+    addMsgAndPrint("  " + str(len(attribs)) + " planarized lines")
+    arcEndPoints = arcEndPointsFrom(endXY, attribs)
+    return cafp, arcEndPoints
+
+
+def nodeCounts(arcEndPoints, hKeyDict, hKeyTestValue, zeroValue):
+    # numbers of planarized lines, nodes, and nodes of each kind found from the
+    # endpoints of one backend
+    nodeList = getNodes(arcEndPoints, zeroValue)
+    badNodes, faultFlipNodes, missingConcealedArcNodes, connectFIDs = processNodes(
+        nodeList, hKeyDict, hKeyTestValue
+    )
+    return [
+        ("Planarized lines", len(arcEndPoints) // 2),
+        ("Nodes", len(nodeList)),
+        ("Bad nodes", len(badNodes)),
+        ("Fault-flip nodes", len(faultFlipNodes)),
+        ("Missing concealed-arc nodes", len(missingConcealedArcNodes)),
+        ("ConnectFIDs", len(connectFIDs)),
+    ]
+
+
+def compareBackends(fds, caf, mup, fdsToken, hKeyDict, hKeyTestValue, zeroValue):
+    # planarizes caf with FeatureToLine and Identity and with shapely, and reports
+    # the node counts of each side by side. The shapely result is kept as
+    # <caf>_shapely_planarized to look at where they differ. Returns the names of
+    # the counts that differ
+    addMsgAndPrint("Comparing planarization with FeatureToLine and Identity and with shapely")
+    cafp, arcEndPoints = planarizeWithShapely(fds, caf, mup, fdsToken, zeroValue)
+    shapelyCafp = caf + "_shapely_planarized"
+    testAndDelete(shapelyCafp)
+    arcpy.Rename_management(cafp, shapelyCafp)
+    shapelyCounts = nodeCounts(arcEndPoints, hKeyDict, hKeyTestValue, zeroValue)
+    cafp, arcEndPoints = planarizeAndGetArcEndPoints(fds, caf, mup, fdsToken)
+    esriCounts = nodeCounts(arcEndPoints, hKeyDict, hKeyTestValue, zeroValue)
+    testAndDelete(cafp)
+    addMsgAndPrint("  count: FeatureToLine and Identity, shapely")
+    differ = []
+    for (name, esri), (_, geos) in zip(esriCounts, shapelyCounts):
+        note = ""
+        if esri != geos:
+            differ.append(name)
+            note = "  DIFFERENT"
+        addMsgAndPrint("  " + name + ": " + str(esri) + ", " + str(geos) + note)
+    if differ:
+        addMsgAndPrint("  shapely differs in: " + ", ".join(differ))
+    else:
+        addMsgAndPrint("  shapely gives the same counts")
+    return differ
+
+
+def unplanarize(cafp, caf, connectFIDs, txtPath):
     addMsgAndPrint("Unplanarizing " + os.path.basename(cafp))
     # add NewLineID to cafp
     arcpy.AddField_management(cafp, "NewLineID", "LONG")
     # go through connectFIDs to set NewLineID values
     addMsgAndPrint("  building newLineIDs dictionary")
-    newLineIDs = {}
-    for pair in connectFIDs:
-        f1 = pair[0]
-        f2 = pair[1]
-        if f1 in newLineIDs:
-            if f2 in newLineIDs:  # both keys in dict, set all values of f2 = f1
-                for i in list(newLineIDs.keys()):
-                    if newLineIDs[i] == f2:
-                        newLineIDs[i] = newLineIDs[f1]
-            else:  # only f1 is in newLineIDs.keys()
-                newLineIDs[f2] = newLineIDs[f1]
-        elif f2 in newLineIDs:  # only f2 in newLineIDs.keys()
-            newLineIDs[f1] = newLineIDs[f2]
-        else:  # neither f1 nor f2 in newLineIDs.keys()
-            newLineIDs[f1] = f1
-            newLineIDs[f2] = f1
+    newLineIDs = nt.merge_groups(connectFIDs)
     addMsgAndPrint("  " + str(len(newLineIDs)) + " entries in newLineIDs")
     # update cursor on cafp, if newLineIDs.has_key(caf.OFID): NewLineID = newLineIDs(caf.OFID) else NewLineID = caf.OFID
     addMsgAndPrint("  setting NewLineID values")
     with arcpy.da.UpdateCursor(cafp, ["OBJECTID", "NewLineID"]) as cursor:
         for row in cursor:
-            if row[0] in newLineIDs:
-                row[1] = newLineIDs[row[0]]
-            else:
-                row[1] = row[0]
+            row[1] = newLineIDs.get(row[0], row[0])
             cursor.updateRow(row)
     # dissolve cafp on GeMS attribs and NewLineID to get cafu
     cafu = cafp.replace("planarized", "unplanarized")
     addMsgAndPrint("  dissolving to get " + os.path.basename(cafu))
     testAndDelete(cafu)
-    dissolveFields = gemsFields
+    dissolveFields = list(gemsFields)
     if "Notes" in fieldNameList(cafp):
         dissolveFields.append("Notes")
     dissolveFields.append("NewLineID")
@@ -654,7 +785,6 @@ def unplanarize(cafp, caf, connectFIDs):
     addMsgAndPrint(str(numberOfRows(cafp)) + " arcs in " + os.path.basename(cafp))
     addMsgAndPrint(str(numberOfRows(cafu)) + " arcs in " + os.path.basename(cafu))
 
-    txtPath = os.path.join(outWksp, "connectedFIDs.txt")
     outTxt = open(txtPath, "w")
     connectFIDs.sort()
     for aline in connectFIDs:
@@ -765,8 +895,7 @@ def adjacencyTables(cafp, sortedUnits, outHtml):
     internalContacts = []
     badConcealed = []
 
-    fields = CAF_arc.fieldList
-    fields.remove("ORIG_FID")
+    fields = [f for f in CAF_arc.fieldList if f != "ORIG_FID"]
     fields.extend(["OBJECTID", "Shape_Length"])
     with arcpy.da.SearchCursor(cafp, fields) as cursor:
         for row in cursor:
@@ -838,7 +967,7 @@ def contactListWrite(conList, outHtml, tagRoot):
     outHtml.write("  </body></table>\n")
 
 
-def findDupPts(inFds, outFds):
+def findDupPts(inFds, outFds, input_mapname):
     addMsgAndPrint("Looking for duplicate points")
     duplicatePoints = []
     arcpy.env.workspace = os.path.dirname(inFds)
@@ -948,251 +1077,337 @@ def esriTopology(outFds, caf, mup):
 
 ################################
 
-addMsgAndPrint(versionString)
-#### get inputs
-inFds = arcpy.GetParameterAsText(0)
-hKeyTestValue = arcpy.GetParameterAsText(1)
-input_mapname = arcpy.GetParameterAsText(2)
-
-inGdb = os.path.dirname(inFds)
-
-if getGDBType(inGdb) == 'EGDB' and input_mapname == '':
-    input_mapname = 'FullEGDB'
-
-if getGDBType(inGdb) == 'FileGDB':
-    outWksp = inGdb[:-4] + "_Topology"
-elif getGDBType(inGdb) == 'EGDB':
-    outWksp = os.path.dirname(inGdb) + '\\' + input_mapname + "_Topology"
-    
-if not os.path.exists(outWksp):
-    addMsgAndPrint("Making directory " + outWksp)
-    os.mkdir(outWksp)
-else:
-    if not os.path.isdir(outWksp):
-        addMsgAndPrint("Oops, " + md + " exists but is a file")
-        forceExit()
-
-inCaf = getCaf(inFds)
-fdsToken = os.path.basename(inCaf).replace("ContactsAndFaults", "").replace('.','_')
-inMup = inCaf.replace("ContactsAndFaults", "MapUnitPolys")
-zeroValue = 2 * arcpy.Describe(inCaf).spatialReference.XYTolerance
-# hKeyTestValue = '2'
-DMU = inGdb + "/DescriptionOfMapUnits"
-if getGDBType(inGdb) == 'FileGDB':
+def checkFds(task):
+    # checks one feature dataset, in this process or in a worker process of the
+    # pool, and returns its part of the html report
+    inFds, hKeyTestValue, input_mapname, outWksp, separateGdbs, backend = task
+    inGdb = os.path.dirname(inFds)
+    connectedFIDsTxt = "connectedFIDs.txt"
+    if separateGdbs:
+        connectedFIDsTxt = os.path.basename(inFds).replace('.','_') + "_connectedFIDs.txt"
+
+    inCaf = getCaf(inFds)
+    fdsToken = os.path.basename(inCaf).replace("ContactsAndFaults", "").replace('.','_')
+    inMup = inCaf.replace("ContactsAndFaults", "MapUnitPolys")
+    zeroValue = 2 * arcpy.Describe(inCaf).spatialReference.XYTolerance
+    # hKeyTestValue = '2'
     DMU = inGdb + "/DescriptionOfMapUnits"
-    outGdbName = os.path.basename(inGdb)[:-4] + "_TopologyCheck.gdb"
-elif getGDBType(inGdb) == 'EGDB':
-    input_schema = os.path.basename(inFds).split('.')[0] + '.' + os.path.basename(inFds).split('.')[1]
-    DMU = inGdb + "/" + input_schema + ".DescriptionOfMapUnits"
-    outGdbName = input_schema.replace('.','_') + '_' + input_mapname + "_TopologyCheck.gdb"
-outGdb = os.path.join(outWksp, outGdbName)
-outFdsName = os.path.basename(inFds).replace('.','_')
-outFds = os.path.join(outGdb, outFdsName)
-addMsgAndPrint(" ")
-addMsgAndPrint(
-    "Writing to "
-    + outGdb
-    + ". Note that nodes within "
-    + str(zeroValue)
-    + " map units of each other are considered identical."
-)
-addMsgAndPrint(" ")
-
-outHtml = open(os.path.join(outWksp, outFdsName + ".html"), "w")
-if getGDBType(inGdb) == 'FileGDB' or input_mapname == 'FullEGDB':
-    hKeyDict, sortedUnits = buildHKeyDict(DMU, "OBJECTID > -1")
-elif getGDBType(inGdb) == 'EGDB':
-    hKeyDict, sortedUnits = buildHKeyDict(DMU, "MapName = '" + input_mapname + "'")
-
-### copy inputs to new gdb/feature dataset
-if not arcpy.Exists(outWksp):
-    os.mkdir(outWksp)
-if not arcpy.Exists(outGdb):
-    arcpy.CreateFileGDB_management(outWksp, outGdbName)
-if not arcpy.Exists(outFds):
-    arcpy.CreateFeatureDataset_management(outGdb, outFdsName, inFds)
-
-arcpy.env.workspace = outFds
-topologies = arcpy.ListDatasets("", "Topology")
-for t in topologies:
-    testAndDelete(t)
-
-for infc in (inCaf, inMup):
-    outfc = os.path.join(outFds, os.path.basename(infc).replace('.','_'))
-    testAndDelete(outfc)
+    if getGDBType(inGdb) == 'FileGDB':
+        DMU = inGdb + "/DescriptionOfMapUnits"
+        outGdbName = os.path.basename(inGdb)[:-4] + "_TopologyCheck.gdb"
+    elif getGDBType(inGdb) == 'EGDB':
+        input_schema = os.path.basename(inFds).split('.')[0] + '.' + os.path.basename(inFds).split('.')[1]
+        DMU = inGdb + "/" + input_schema + ".DescriptionOfMapUnits"
+        outGdbName = input_schema.replace('.','_') + '_' + input_mapname + "_TopologyCheck.gdb"
+    outFdsName = os.path.basename(inFds).replace('.','_')
+    if separateGdbs:
+        # each feature dataset checked in its own process writes to its own gdb
+        outGdbName = outGdbName.replace("_TopologyCheck.gdb", "_" + outFdsName + "_TopologyCheck.gdb")
+    outGdb = os.path.join(outWksp, outGdbName)
+    outFds = os.path.join(outGdb, outFdsName)
+    addMsgAndPrint(" ")
+    addMsgAndPrint(
+        "Writing to "
+        + outGdb
+        + ". Note that nodes within "
+        + str(zeroValue)
+        + " map units of each other are considered identical."
+    )
+    addMsgAndPrint(" ")
+
+    outHtml = io.StringIO()
     if getGDBType(inGdb) == 'FileGDB' or input_mapname == 'FullEGDB':
-        arcpy.Copy_management(infc, outfc)
+        hKeyDict, sortedUnits = buildHKeyDict(DMU, "OBJECTID > -1")
     elif getGDBType(inGdb) == 'EGDB':
-        arcpy.management.MakeFeatureLayer(infc, 'in_layer', "MapName = '" + input_mapname + "'")
-        arcpy.management.CopyFeatures('in_layer', outfc)    
-    if infc == inCaf:
-        caf = outfc
+        hKeyDict, sortedUnits = buildHKeyDict(DMU, "MapName = '" + input_mapname + "'")
+
+    ### copy inputs to new gdb/feature dataset
+    if not arcpy.Exists(outGdb):
+        arcpy.CreateFileGDB_management(outWksp, outGdbName)
+    if not arcpy.Exists(outFds):
+        arcpy.CreateFeatureDataset_management(outGdb, outFdsName, inFds)
+
+    arcpy.env.workspace = outFds
+    topologies = arcpy.ListDatasets("", "Topology")
+    for t in topologies:
+        testAndDelete(t)
+
+    for infc in (inCaf, inMup):
+        outfc = os.path.join(outFds, os.path.basename(infc).replace('.','_'))
+        testAndDelete(outfc)
+        if getGDBType(inGdb) == 'FileGDB' or input_mapname == 'FullEGDB':
+            arcpy.Copy_management(infc, outfc)
+        elif getGDBType(inGdb) == 'EGDB':
+            arcpy.management.MakeFeatureLayer(infc, 'in_layer', "MapName = '" + input_mapname + "'")
+            arcpy.management.CopyFeatures('in_layer', outfc)    
+        if infc == inCaf:
+            caf = outfc
+        else:
+            mup = outfc
+
+    ### TOPOLOGY (no mup gaps or overlaps;
+    #    no line overlaps, self-overlaps, or self-intersections; mup boundaries covered by CAF lines
+    topoStuff = esriTopology(outFds, caf, mup)
+
+    ### NODES
+    if backend == "compare":
+        compareBackends(
+            outFds, caf, mup, fdsToken, hKeyDict, hKeyTestValue, zeroValue
+        )
+    if backend == "shapely":
+        planarizedCAF, arcEndPoints = planarizeWithShapely(
+            outFds, caf, mup, fdsToken, zeroValue
+        )
     else:
-        mup = outfc
-
-### TOPOLOGY (no mup gaps or overlaps;
-#    no line overlaps, self-overlaps, or self-intersections; mup boundaries covered by CAF lines
-topoStuff = esriTopology(outFds, caf, mup)
-
-### NODES
-planarizedCAF, arcEndPoints = planarizeAndGetArcEndPoints(outFds, caf, mup, fdsToken)
-
-# sort arcEndPoints into list of nodes
-nodeList = getNodes(arcEndPoints)
-
-addMsgAndPrint(str(hKeyDict))
-# assign nodes to various groups
-badNodes, faultFlipNodes, missingConcealedArcNodes, connectFIDs = processNodes(
-    nodeList, hKeyDict
-)
-addMsgAndPrint("Bad nodes: " + str(len(badNodes)))
-addMsgAndPrint("Fault-flip nodes: " + str(len(faultFlipNodes)))
-addMsgAndPrint("Missing concealed-arc nodes: " + str(len(missingConcealedArcNodes)))
-addMsgAndPrint("ConnectFIDs: " + str(len(connectFIDs)))
-testAndDelete(arcEndPoints)
-
-### MAKE OUTPUT FEATURE CLASSES
-badNodesFC = makeNodeFC(outFds, "errors_" + fdsToken + "_BadNodes")
-insertNodes(badNodesFC, badNodes)
-
-missingConcealedFC = makeNodeFCXY(outFds, fdsToken + "MissingConcealedCAF_nodes")
-insertNodesXY(missingConcealedFC, missingConcealedArcNodes)
-faultFlipFC = makeNodeFCXY(outFds, "errors_" + fdsToken + "_FaultFlipNodes")
-insertNodesXY(faultFlipFC, faultFlipNodes)
-
-### UNPLANARIZE
-unplanarizedCAF = unplanarize(planarizedCAF, inCaf, connectFIDs)
-
-### ARC ADJACENCY
-(
-    badConcealed,
-    internalContacts,
-    concealedLinesDict,
-    contactLinesDict,
-    faultLinesDict,
-) = adjacencyTables(planarizedCAF, sortedUnits, outHtml)
-
-### DUPLICATE POINTS
-dupPoints = findDupPts(inFds, outFds)
-
-### WRITE OUTPUT
-addMsgAndPrint("Writing output")
-outHtml.write(htmlStart)
-outHtml.write("<h2>Topology Check</h2>\n")
-outHtml.write(
-    "<h2>"
-    + os.path.basename(inGdb)
-    + ", <i>feature dataset</i> "
-    + outFdsName
-    + "</h2>\n"
-)
-outHtml.write(
-    "File written by " + versionString + " at " + str(time.ctime()) + "<br>\n"
-)
-outHtml.write("Input database: <b>" + inGdb + "</b><br>\n")
-outHtml.write(
-    "Output database: <b>"
-    + outGdbName
-    + "</b> within folder <b>"
-    + outWksp
-    + "</b>.<br>\n"
-)
-outHtml.write("<blockquote><i>" + ValidateTopologyNote + "</blockquote></i>\n")
-
-outHtml.write("<h3>ESRI Line-Polygon Topology</h3>\n")
-for a in topoStuff:
-    outHtml.write(a + "<br>\n")
-
-outHtml.write("<h3>Node Topology</h3>\n")
-outHtml.write(str(len(badNodes)) + " nodes that may have bad geometry<br>\n")
-outHtml.write(
-    space4
-    + " See <b>"
-    + os.path.join(outFdsName, os.path.basename(badNodesFC))
-    + "</b><br>\n"
-)
-outHtml.write(
-    str(len(faultFlipNodes))
-    + " nodes where fault direction changes. These are likely to be errors<br>\n"
-)
-outHtml.write(
-    space4
-    + " See <b>"
-    + os.path.join(outFdsName, os.path.basename(faultFlipFC))
-    + "</b><br>\n"
-)
-outHtml.write(
-    str(len(missingConcealedArcNodes))
-    + " nodes where a concealed contact or fault continuation could be added<br>\n"
-)
-outHtml.write(
-    space4
-    + " See <b>"
-    + os.path.join(outFdsName, os.path.basename(missingConcealedFC))
-    + "</b><br>\n"
-)
-
-outHtml.write("<h3>MapUnits Adjacent to CAF Lines</h3>\n")
-outHtml.write(
-    "See feature class <b>"
-    + os.path.join(outFdsName, os.path.basename(planarizedCAF))
-    + "</b> for ContactsAndFaults arcs attributed with adjacent polygon information.<br>\n"
-)
-outHtml.write(
-    "<i>In tables below, upper cell value is number of arcs. Lower cell value is cumulative arc length in map units.</i><br><br>\n"
-)
-writeLineAdjacencyTable(
-    "Concealed contacts and faults",
-    outHtml,
-    concealedLinesDict,
-    sortedUnits,
-    "badConcealed",
-)
-outHtml.write("<br>\n")
-writeLineAdjacencyTable(
-    "Contacts (not concealed)",
-    outHtml,
-    contactLinesDict,
-    sortedUnits,
-    "internalContacts",
-)
-outHtml.write("<br>\n")
-writeLineAdjacencyTable(
-    "Faults (not concealed)", outHtml, faultLinesDict, sortedUnits, ""
-)
-outHtml.write("<br><b>Bad concealed contacts and faults</b><br>\n")
-if len(badConcealed) > 0:
+        planarizedCAF, arcEndPoints = planarizeAndGetArcEndPoints(outFds, caf, mup, fdsToken)
+
+    # sort arcEndPoints into list of nodes
+    nodeList = getNodes(arcEndPoints, zeroValue)
+
+    addMsgAndPrint(str(hKeyDict))
+    # assign nodes to various groups
+    badNodes, faultFlipNodes, missingConcealedArcNodes, connectFIDs = processNodes(
+        nodeList, hKeyDict, hKeyTestValue
+    )
+    addMsgAndPrint("Bad nodes: " + str(len(badNodes)))
+    addMsgAndPrint("Fault-flip nodes: " + str(len(faultFlipNodes)))
+    addMsgAndPrint("Missing concealed-arc nodes: " + str(len(missingConcealedArcNodes)))
+    addMsgAndPrint("ConnectFIDs: " + str(len(connectFIDs)))
+
+    ### MAKE OUTPUT FEATURE CLASSES
+    badNodesFC = makeNodeFC(outFds, "errors_" + fdsToken + "_BadNodes")
+    insertNodes(badNodesFC, badNodes)
+
+    missingConcealedFC = makeNodeFCXY(outFds, fdsToken + "MissingConcealedCAF_nodes")
+    insertNodesXY(missingConcealedFC, missingConcealedArcNodes)
+    faultFlipFC = makeNodeFCXY(outFds, "errors_" + fdsToken + "_FaultFlipNodes")
+    insertNodesXY(faultFlipFC, faultFlipNodes)
+
+    ### UNPLANARIZE
+    unplanarize(
+        planarizedCAF, inCaf, connectFIDs, os.path.join(outWksp, connectedFIDsTxt)
+    )
+
+    ### ARC ADJACENCY
+    (
+        badConcealed,
+        internalContacts,
+        concealedLinesDict,
+        contactLinesDict,
+        faultLinesDict,
+    ) = adjacencyTables(planarizedCAF, sortedUnits, outHtml)
+
+    ### DUPLICATE POINTS
+    dupPoints = findDupPts(inFds, outFds, input_mapname)
+
+    ### WRITE OUTPUT
+    addMsgAndPrint("Writing output")
+    outHtml.write(
+        "<h2>"
+        + os.path.basename(inGdb)
+        + ", <i>feature dataset</i> "
+        + outFdsName
+        + "</h2>\n"
+    )
+    outHtml.write(
+        "File written by " + versionString + " at " + str(time.ctime()) + "<br>\n"
+    )
+    outHtml.write("Input database: <b>" + inGdb + "</b><br>\n")
+    outHtml.write(
+        "Output database: <b>"
+        + outGdbName
+        + "</b> within folder <b>"
+        + outWksp
+        + "</b>.<br>\n"
+    )
+    outHtml.write("<blockquote><i>" + ValidateTopologyNote + "</blockquote></i>\n")
+
+    outHtml.write("<h3>ESRI Line-Polygon Topology</h3>\n")
+    for a in topoStuff:
+        outHtml.write(a + "<br>\n")
+
+    outHtml.write("<h3>Node Topology</h3>\n")
+    outHtml.write(str(len(badNodes)) + " nodes that may have bad geometry<br>\n")
     outHtml.write(
         space4
-        + "See feature class <b>"
-        + os.path.join(outFdsName, os.path.basename(planarizedCAF))
+        + " See <b>"
+        + os.path.join(outFdsName, os.path.basename(badNodesFC))
         + "</b><br>\n"
     )
-    contactListWrite(badConcealed, outHtml, "badConcealed")
-else:
-    outHtml.write(space4 + "No bad concealed contacts or faults")
-outHtml.write("<br><b>Internal Contacts</b><br>\n")
-if len(internalContacts) > 0:
+    outHtml.write(
+        str(len(faultFlipNodes))
+        + " nodes where fault direction changes. These are likely to be errors<br>\n"
+    )
     outHtml.write(
         space4
-        + "See feature class <b>"
-        + os.path.join(outFdsName, os.path.basename(planarizedCAF))
+        + " See <b>"
+        + os.path.join(outFdsName, os.path.basename(faultFlipFC))
         + "</b><br>\n"
     )
-    contactListWrite(internalContacts, outHtml, "internalContacts")
-else:
-    outHtml.write(space4 + "No internal contacts")
-
-outHtml.write("<h3>Duplicate Points</h3>\n")
-if len(dupPoints) == 0:
-    outHtml.write("No duplicate points found<br>\n")
-else:
-    for a in dupPoints:
-        outHtml.write(a + "<br>\n")
+    outHtml.write(
+        str(len(missingConcealedArcNodes))
+        + " nodes where a concealed contact or fault continuation could be added<br>\n"
+    )
+    outHtml.write(
+        space4
+        + " See <b>"
+        + os.path.join(outFdsName, os.path.basename(missingConcealedFC))
+        + "</b><br>\n"
+    )
+
+    outHtml.write("<h3>MapUnits Adjacent to CAF Lines</h3>\n")
+    outHtml.write(
+        "See feature class <b>"
+        + os.path.join(outFdsName, os.path.basename(planarizedCAF))
+        + "</b> for ContactsAndFaults arcs attributed with adjacent polygon information.<br>\n"
+    )
+    outHtml.write(
+        "<i>In tables below, upper cell value is number of arcs. Lower cell value is cumulative arc length in map units.</i><br><br>\n"
+    )
+    writeLineAdjacencyTable(
+        "Concealed contacts and faults",
+        outHtml,
+        concealedLinesDict,
+        sortedUnits,
+        "badConcealed",
+    )
+    outHtml.write("<br>\n")
+    writeLineAdjacencyTable(
+        "Contacts (not concealed)",
+        outHtml,
+        contactLinesDict,
+        sortedUnits,
+        "internalContacts",
+    )
+    outHtml.write("<br>\n")
+    writeLineAdjacencyTable(
+        "Faults (not concealed)", outHtml, faultLinesDict, sortedUnits, ""
+    )
+    outHtml.write("<br><b>Bad concealed contacts and faults</b><br>\n")
+    if len(badConcealed) > 0:
+        outHtml.write(
+            space4
+            + "See feature class <b>"
+            + os.path.join(outFdsName, os.path.basename(planarizedCAF))
+            + "</b><br>\n"
+        )
+        contactListWrite(badConcealed, outHtml, "badConcealed")
+    else:
+        outHtml.write(space4 + "No bad concealed contacts or faults")
+    outHtml.write("<br><b>Internal Contacts</b><br>\n")
+    if len(internalContacts) > 0:
+        outHtml.write(
+            space4
+            + "See feature class <b>"
+            + os.path.join(outFdsName, os.path.basename(planarizedCAF))
+            + "</b><br>\n"
+        )
+        contactListWrite(internalContacts, outHtml, "internalContacts")
+    else:
+        outHtml.write(space4 + "No internal contacts")
+
+    outHtml.write("<h3>Duplicate Points</h3>\n")
+    if len(dupPoints) == 0:
+        outHtml.write("No duplicate points found<br>\n")
+    else:
+        for a in dupPoints:
+            outHtml.write(a + "<br>\n")
+
+    return outHtml.getvalue()
+
+
+def runCheckFds(task):
+    # checkFds for the pool; failures are reported in the html of the feature dataset
+    try:
+        return checkFds(task)
+    except Exception:
+        message = traceback.format_exc()
+        addMsgAndPrint(message)
+        return "<h2>" + os.path.basename(task[0]) + "</h2>\n<pre>" + message + "</pre>\n"
+
+
+def featureDatasets(inGdb):
+    # feature datasets with a ContactsAndFaults feature class, GeologicMap first,
+    # then the others (cross sections) in order of name
+    arcpy.env.workspace = inGdb
+    fdsList = []
+    for fd in arcpy.ListDatasets("", "Feature"):
+        if arcpy.ListFeatureClasses("*ContactsAndFaults", "Line", fd):
+            fdsList.append(os.path.join(inGdb, fd))
+    fdsList.sort(key=lambda fd: (not fd.endswith("GeologicMap"), fd.lower()))
+    return fdsList
+
+
+################################
 
-outHtml.write(htmlEnd)
-outHtml.close()
-addMsgAndPrint("DONE!")
+if __name__ == "__main__":
+    checkVersion(versionString, rawurl, "gems-tools-pro")
+    addMsgAndPrint(versionString)
+    #### get inputs
+    # a feature dataset, several feature datasets separated by ;, or a geodatabase
+    # to check every feature dataset with a ContactsAndFaults feature class
+    inFds = arcpy.GetParameterAsText(0)
+    hKeyTestValue = arcpy.GetParameterAsText(1)
+    input_mapname = arcpy.GetParameterAsText(2)
+    # optional, from the command line only: "shapely" to planarize in memory with
+    # shapely instead of with FeatureToLine and Identity, "compare" to do both and
+    # report their node counts side by side before the report is made the usual way
+    backend = arcpy.GetParameterAsText(3).lower() if len(sys.argv) > 4 else ""
+    if backend in ("shapely", "compare") and shapely is None:
+        addMsgAndPrint("shapely is not installed, planarizing with FeatureToLine and Identity")
+        backend = ""
+
+    if inFds.lower().endswith(".gdb") or inFds.lower().endswith(".sde"):
+        fdsList = featureDatasets(inFds)
+        inGdb = inFds
+    else:
+        fdsList = [fd.strip("'\"") for fd in inFds.split(";")]
+        inGdb = os.path.dirname(fdsList[0])
+    if not fdsList:
+        addMsgAndPrint("No feature dataset with a ContactsAndFaults feature class in " + inFds)
+        forceExit()
+
+    if getGDBType(inGdb) == 'EGDB' and input_mapname == '':
+        input_mapname = 'FullEGDB'
+
+    if getGDBType(inGdb) == 'FileGDB':
+        outWksp = inGdb[:-4] + "_Topology"
+    elif getGDBType(inGdb) == 'EGDB':
+        outWksp = os.path.dirname(inGdb) + '\\' + input_mapname + "_Topology"
+
+    if not os.path.exists(outWksp):
+        addMsgAndPrint("Making directory " + outWksp)
+        os.mkdir(outWksp)
+    else:
+        if not os.path.isdir(outWksp):
+            addMsgAndPrint("Oops, " + outWksp + " exists but is a file")
+            forceExit()
+
+    if len(fdsList) == 1:
+        fragments = [checkFds((fdsList[0], hKeyTestValue, input_mapname, outWksp, False, backend))]
+        htmlName = os.path.basename(fdsList[0]).replace('.','_') + ".html"
+    else:
+        # every feature dataset is checked in its own process, and writes to its
+        # own gdb, so that the check takes the time of the largest one
+        addMsgAndPrint("Checking " + str(len(fdsList)) + " feature datasets")
+        tasks = [
+            (fd, hKeyTestValue, input_mapname, outWksp, True, backend) for fd in fdsList
+        ]
+        workers = max(1, min(len(tasks), (os.cpu_count() or 1) - 1))
+        set_pool_executable()
+        with multiprocessing.Pool(workers, maxtasksperchild=1) as pool:
+            # imap returns the fragments in the order of fdsList
+            fragments = list(pool.imap(runCheckFds, tasks))
+        htmlName = os.path.basename(inGdb).rsplit(".", 1)[0] + "_TopologyCheck.html"
+
+    outHtml = open(os.path.join(outWksp, htmlName), "w")
+    outHtml.write(htmlStart)
+    outHtml.write("<h2>Topology Check</h2>\n")
+    for fragment in fragments:
+        outHtml.write(fragment)
+    outHtml.write(htmlEnd)
+    outHtml.close()
+    addMsgAndPrint("DONE!")
 
 
 
@@ -3,8 +3,8 @@
 
 Audits a geodatabase for conformance with the GeMS schema and reports compliance 
 as "may be LEVEL 1 COMPLIANT", "is LEVEL 2 COMPLIANT", or "is LEVEL 3 COMPLIANT". 
-It also runs mp (metadata parser) to check for formal errors in geodatabase-level 
-FGDC metadata. 
+It also checks geodatabase-level FGDC metadata for formal errors against the FGDC 
+schema and the rules of mp (metadata parser), see fgdc_validator.py. 
 
 Usage:
     Use parameter form in ArcGIS Pro or at command line with the arguments below. 
@@ -37,6 +37,18 @@ Args:
       Not applicable to geopackages. Optional. False by default.
     open_report (bool or str) : True or false whether to open the html validation file 
       upone completion. Optional. False by default.
+    workers (int or str) : Number of worker processes in which to check rules 2.4 - 3.13
+      concurrently. Only used on databases with more than 100,000 rows. Optional. 
+      One less than the number of processors, up to 4, by default.
+    full_run (bool or str) : True or false whether to check every rule again. If
+      false, rules that only read tables that have not changed since the last
+      validation written to workdir reuse the results of that validation. Optional.
+      False by default.
+    topology_engine (str) : How topology is checked in feature datasets without a
+      topology of their own. 'arcpy' builds a topology in Topology.gdb, 'shapely'
+      checks the rules with shapely, and 'compare' does both and prints the number
+      of errors of each rule found by each. Optional. 'arcpy' by default, or
+      'shapely' for geopackages and without a Standard or Advanced license.
     
       
 Returns:
@@ -45,6 +57,24 @@ Returns:
     <gdb name>-ValidationErrors.html (file) : Detailed list of errors and warnings
       by table, field, ObjectID, etc. Written to workdir.
     <gdb name>_Validation.gdb (file gdb)
+    <gdb name>-Validation.json (file) : Level of compliance and the number of errors
+      and warnings of each rule, for collecting the results of many validations.
+      Written to workdir.
+    <gdb name>-ValidationFindings.ndjson (file) : Every error and warning, one json
+      object per line with the rule, table, field, id, and value. Written to workdir.
+    <gdb name>-ValidationDetails (folder) : Full lists of errors or warnings of rules
+      with more than 1,000, in html pages linked from -ValidationErrors.html.
+      Written to workdir, replacing the pages of the last validation.
+    <gdb name>-Catalog.pickle (file) : Tables, feature classes, and fields of the
+      database, used until the database changes. Written to workdir.
+    <gdb name>-ValidationTimes.json (file) : Time, rows read, cursors opened, and
+      peak memory of each step of the validation. Written to workdir.
+    TopologyErrors.gpkg (file) : Error features of each topology rule, one layer
+      per rule and error geometry, when topology is checked with an ArcGIS topology.
+      Written to workdir.
+    <gdb name>-ValidationCache.json (file) : Fingerprints of the tables and the
+      results of each rule, used to skip unchanged rules on the next validation.
+      Written to workdir.
 
 """
 
@@ -73,16 +103,34 @@ Returns:
 
 import arcpy
 import os
+import re
 import sys
 import time
 import copy
+import html
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
+from types import SimpleNamespace
 import GeMS_utilityFunctions as guf
 import GeMS_Definition as gdef
 import topology as tp
+import bulk_read as br
+import catalog as cat
+import fgdc_validator as fv
+import fingerprints as fp
+import geomaterials as gm
+import hierarchy_keys as hk
+import timings as tm
+import validation_results as vr
+import string_checks as sc
 import requests
 from jinja2 import Environment, FileSystemLoader
-from osgeo import ogr
+
+try:
+    import shapely_topology as stp
+except ImportError:
+    stp = None
 
 # for debugging
 # from importlib import reload
@@ -99,7 +147,8 @@ val["datetime"] = time.asctime(time.localtime(time.time()))
 
 rawurl = "https://raw.githubusercontent.com/DOI-USGS/gems-tools-pro/master/Scripts/GeMS_ValidateDatabase.py"
 
-scripts_dir = Path.cwd()
+# templates and GeoMaterialDict.csv are next to this script, wherever it is run from
+scripts_dir = Path(__file__).parent
 toolbox_dir = scripts_dir.parent
 resources_path = toolbox_dir / "Resources"
 
@@ -111,6 +160,11 @@ for f in gdef.standard_fields:
 
 use_idfield = False
 
+# columnar cache of field values, filled by load_tables() so that every table
+# is read only once no matter how many rules look at it
+table_cache = {}
+not_null_where = re.compile(r"\s*(\w+)\s+IS\s+NOT\s+NULL\s*", re.IGNORECASE)
+
 
 def check_sr(db_obj, db_dict):
     """Checks the datum of the spatial reference. Warning if not NAD83 or WGS84"""
@@ -146,6 +200,138 @@ def compare_sr(obj1, obj2, db_dict):
     return sr_warnings
 
 
+def plan_scan(db_dict):
+    """Collect every field of every table that one of the rules will read.
+    Returns {table: [field, field...]} so that each table can be read
+    in one pass by load_tables()"""
+    plan = {}
+    tables = [
+        k
+        for k, v in db_dict.items()
+        if v["dataType"] in ("Table", "FeatureClass")
+        and not "Annotation" in v["concat_type"]
+        and "fields" in v
+    ]
+    for table in tables:
+        fields = db_dict[table]["fields"]
+        f_names = [f.name for f in fields]
+        plan_fields = [f.name for f in fields if f.type == "OID"]
+
+        # the _ID field reported in place of OBJECTID when use_idfield is True
+        id_fld = which_id(db_dict, table)
+        if not id_fld in plan_fields:
+            plan_fields.append(id_fld)
+
+        # all text fields; rules 2.4-2.9, 3.4-3.13 only look at String fields
+        plan_fields.extend([f.name for f in fields if f.type == "String"])
+
+        # NoNulls fields for rule 3.3, which can be any type
+        gems_eq = db_dict[table]["gems_equivalent"]
+        if gems_eq in gdef.startDict:
+            plan_fields.extend(
+                [n[0] for n in gdef.startDict[gems_eq] if n[2] == "NoNulls"]
+            )
+
+        # non-spatial tables are dumped whole to the report by dump_tables
+        if db_dict[table]["concat_type"] == "Nonspatial Table":
+            plan_fields.extend(f_names)
+
+        # only keep fields that exist, in the order they were first asked for
+        plan_fields = [f for f in plan_fields if f in f_names]
+        plan[table] = list(dict.fromkeys(plan_fields))
+
+        # geometry stand-ins so that the fingerprints of the feature classes
+        # checked by the topology rules change when shapes are edited
+        if gems_eq in ("MapUnitPolys", "ContactsAndFaults"):
+            plan[table].extend(["SHAPE@XY", "SHAPE@LENGTH"])
+            if db_dict[table].get("shapeType") == "Polygon":
+                plan[table].append("SHAPE@AREA")
+
+    return plan
+
+
+def load_tables(db_dict, plan):
+    """Read each table in the scan plan exactly once into table_cache
+    table_cache[table] = {field: [value, value...]} where every list is
+    in cursor order and the same length. Tables are read whole, a column at a
+    time, by bulk_read.read_columns()"""
+    for table, fields in plan.items():
+        if not fields:
+            continue
+        columns = br.read_columns(db_dict[table]["catalogPath"], fields)
+        table_cache[table] = {f: columns[f].tolist() for f in fields}
+        tm.count(rows=len(columns[fields[0]]), cursors=1)
+
+
+def cached_rows(table, fields, where=None):
+    """Rows of fields read from the table cache, optionally filtered by a
+    '<field> IS NOT NULL' where clause. Returns None if the request cannot be
+    served from the cache"""
+    if not table in table_cache:
+        return None
+    columns = table_cache[table]
+    if not all(f in columns for f in fields):
+        return None
+
+    not_null = None
+    if where:
+        m = not_null_where.fullmatch(where)
+        if not m or not m.group(1) in columns:
+            return None
+        not_null = columns[m.group(1)]
+
+    rows = zip(*[columns[f] for f in fields])
+    if not_null is None:
+        rows = list(rows)
+    else:
+        rows = [r for r, nn in zip(rows, not_null) if not nn is None]
+    tm.count(rows=len(rows))
+
+    return rows
+
+
+def table_columns(db_dict, table, fields):
+    """{field: [value, value...]} of fields in a table, from the table cache
+    when possible, otherwise read with a SearchCursor"""
+    columns = table_cache.get(table, {})
+    if all(f in columns for f in fields):
+        return {f: columns[f] for f in fields}
+
+    rows = table_rows(db_dict, table, fields)
+    return dict(zip(fields, [list(c) for c in zip(*rows)] or [[] for f in fields]))
+
+
+def sort_key(v):
+    """Sort None first, the way ORDER BY sorts NULLs in a file geodatabase"""
+    return (v is not None, v)
+
+
+def table_rows(db_dict, table, fields, where=None, order_by=None):
+    """List of row tuples of fields in a table. Served from the table cache
+    when possible, otherwise read with a SearchCursor"""
+    if order_by and not order_by in fields:
+        rows = cached_rows(table, fields + [order_by], where)
+    else:
+        rows = cached_rows(table, fields, where)
+    if not rows is None:
+        if order_by:
+            i = (fields + [order_by]).index(order_by)
+            rows.sort(key=lambda r: sort_key(r[i]))
+        return [r[: len(fields)] for r in rows]
+
+    sql = (None, f"ORDER BY {order_by}") if order_by else (None, None)
+    with arcpy.da.SearchCursor(
+        db_dict[table]["catalogPath"],
+        field_names=fields,
+        where_clause=where,
+        sql_clause=sql,
+    ) as cursor:
+        rows = [tuple(r) for r in cursor]
+    tm.count(rows=len(rows), cursors=1)
+
+    return rows
+
+
 def values(db_dict, table, field, what, where=None):
     """List or dictionary {[oid]: value} of values found in a field in a
     dictionary is {oid: value}"""
@@ -154,23 +340,10 @@ def values(db_dict, table, field, what, where=None):
         # fields = db_dict[table]["fields"]
         if what == "dictionary":
             oid = which_id(db_dict, table)
-
-            vals = {
-                r[0]: r[1]
-                for r in arcpy.da.SearchCursor(
-                    db_dict[table]["catalogPath"],
-                    field_names=[oid, field],
-                    where_clause=where,
-                    sql_clause=(None, f"ORDER BY {field}"),
-                )
-            }
+            rows = table_rows(db_dict, table, [oid, field], where, order_by=field)
+            vals = {r[0]: r[1] for r in rows}
         else:
-            vals = [
-                r[0]
-                for r in arcpy.da.SearchCursor(
-                    db_dict[table]["catalogPath"], field_names=field, where_clause=where
-                )
-            ]
+            vals = [r[0] for r in table_rows(db_dict, table, [field], where)]
     return vals
 
 
@@ -202,7 +375,12 @@ def rule2_1(db_dict, is_gpkg):
     if not is_gpkg:
         gmaps = [k for k, v in db_dict.items() if v["gems_equivalent"] == "GeologicMap"]
         if not gmaps:
-            errors.append(f'Feature dataset <span class="table">GeologicMap</span>')
+            errors.append(
+                vr.Finding(
+                    'Feature dataset <span class="table">GeologicMap</span>',
+                    table="GeologicMap",
+                )
+            )
         else:
             # check the spatial reference of each 'GeologicMap' feature dataset
             for gmap in gmaps:
@@ -228,8 +406,9 @@ def rule2_1(db_dict, is_gpkg):
             # warning about missing feature class:
             for n in pair[2:]:
                 if "_missing_" in n:
+                    n = n.replace("__missing__", "")
                     errors.append(
-                        f'Feature class <span class="table">{n.replace("__missing__", "")}</span>'
+                        vr.Finding(f'Feature class <span class="table">{n}</span>', table=n)
                     )
                 else:
                     if is_gpkg or db_dict[n]["feature_dataset"] == "":
@@ -249,15 +428,17 @@ def rule2_1(db_dict, is_gpkg):
                     tp_pairs.append(pair)
     else:
         for n in ("MapUnitPolys", "ContactsAndFaults"):
-            errors.append(f'Feature class <span class="table">{n}</span>')
+            errors.append(
+                vr.Finding(f'Feature class <span class="table">{n}</span>', table=n)
+            )
 
     # consider non-spatial tables
     db_tables = set(
         [k for k, v in db_dict.items() if v["gems_equivalent"] in gdef.required_tables]
     )
     if set(db_tables) != set(gdef.required_tables):
-        for n in set(gdef.required_tables).difference(set(db_tables)):
-            errors.append(f'<span class="table">{n}</span>')
+        for n in sorted(set(gdef.required_tables).difference(set(db_tables))):
+            errors.append(vr.Finding(f'<span class="table">{n}</span>', table=n))
 
     return (errors, tp_pairs, sr_warnings)
 
@@ -314,10 +495,10 @@ def check_fields(db_dict, level, schema_extensions):
             if not field[0] in f_field_names:
                 if not field[2] == "Optional":
                     html = f'<span class="table">{table}</span> missing field <span class="field">{field[0]}</span>'
-                    errors.append(html)
+                    errors.append(vr.Finding(html, table=table, field=field[0]))
                 else:
                     html = f'<span class="table">{table}</span> field <span class="field">{field[0]}</span>'
-                    fld_warnings.append(html)
+                    fld_warnings.append(vr.Finding(html, table=table, field=field[0]))
             else:
                 req_type = field[1]
 
@@ -327,7 +508,14 @@ def check_fields(db_dict, level, schema_extensions):
                     cur_field = cur_field[0]
                     html = f'<span class="table">{table}</span>, <span class="field">{cur_field.name}</span> should be'
                     if req_type != cur_field.type:
-                        errors.append(f"{html} type {req_type}")
+                        errors.append(
+                            vr.Finding(
+                                f"{html} type {req_type}",
+                                table=table,
+                                field=cur_field.name,
+                                value=cur_field.type,
+                            )
+                        )
 
         req_names = [f[0].lower() for f in req_fields]
         lower_standard = [n.lower() for n in gdef.standard_fields]
@@ -349,11 +537,48 @@ def check_fields(db_dict, level, schema_extensions):
     return errors, schema_extensions, fld_warnings
 
 
-def check_topology(db_dict, workdir, is_gpkg, topo_pairs):
+def topology_engine(option, is_gpkg):
+    """How topology is checked where a pair of feature classes has no topology of
+    its own: "arcpy", a topology built in Topology.gdb, "shapely", see
+    shapely_topology.py, or "compare", both, with the counts of each rule printed
+    side by side and the arcpy results reported. By default, shapely is only used
+    when an arcpy topology cannot be built: for geopackages, or without a Standard
+    or Advanced license"""
+    option = (option or "").strip().lower()
+    if option in ("shapely", "compare") and not stp:
+        ap("shapely cannot be imported, topology is checked with arcpy")
+        return "arcpy"
+    if option in ("arcpy", "shapely", "compare"):
+        return option
+    # topologies need a Standard (ArcEditor) or Advanced (ArcInfo) license
+    licensed = arcpy.ProductInfo() in ("ArcEditor", "ArcInfo", "ArcServer")
+    if stp and (is_gpkg or not licensed):
+        return "shapely"
+    return "arcpy"
+
+
+def xy_tolerance(db_dict, fc):
+    """XY tolerance of a feature class, in the units of its spatial reference"""
+    try:
+        return db_dict[fc]["spatialReference"].XYTolerance
+    except Exception:
+        return stp.tolerance
+
+
+def shapely_counts(db_dict, topo_pair, workers):
+    """Error counts {rule id: count} of a pair found by shapely_topology"""
+    db_path = stp.database_path(db_dict[topo_pair[2]]["catalogPath"])
+    tolerance = xy_tolerance(db_dict, topo_pair[2])
+    return stp.check_pair(db_path, topo_pair[2], topo_pair[3], workers, tolerance)
+
+
+def check_topology(db_dict, workdir, is_gpkg, topo_pairs, workers=1, engine="arcpy"):
     """2.3 GeologicMap topology: no internal gaps or overlaps in MapUnitPolys, boundaries of
     MapUnitPolys are covered by ContactsAndFaults 3.2 All map-like feature datasets obey
     topology rules. No MapUnitPolys gaps or overlaps. No ContactsAndFaults overlaps, self-overlaps,
-    or self-intersections. MapUnitPoly boundaries covered by ContactsAndFaults"""
+    or self-intersections. MapUnitPoly boundaries covered by ContactsAndFaults
+    Pairs without a topology of their own are checked in a topology built in
+    Topology.gdb, or with shapely, see topology_engine"""
     has_been_validated = False
     level_2_errors = [
         "topology errors",
@@ -367,9 +592,18 @@ def check_topology(db_dict, workdir, is_gpkg, topo_pairs):
         "topology3",
     ]
 
+    # error features of every topology are copied here for review
+    errors_gpkg = Path(workdir) / "TopologyErrors.gpkg"
+    if errors_gpkg.exists():
+        errors_gpkg.unlink()
+
     for topo_pair in topo_pairs:
         make_topology = False
         gmap = topo_pair[0]
+        # shapely needs both feature classes
+        use_stp = not engine == "arcpy" and not any(
+            "__missing__" in fc for fc in topo_pair[2:]
+        )
         if gmap:
             children = db_dict[gmap]["children"]
             tops = [c["name"] for c in children if c["dataType"] == "Topology"]
@@ -386,7 +620,26 @@ def check_topology(db_dict, workdir, is_gpkg, topo_pairs):
             if not is_gpkg:
                 ap(f"\tNo topology found in {gmap}")
 
-            top_path, has_been_validated = tp.make_topology(workdir, topo_pair, db_dict)
+            top_path = None
+            if not engine == "shapely" or not use_stp:
+                try:
+                    top_path, has_been_validated = tp.make_topology(
+                        workdir, topo_pair, db_dict
+                    )
+                except arcpy.ExecuteError:
+                    if not use_stp:
+                        raise
+                    ap(f"\t\tCould not build a topology: {arcpy.GetMessages(2)}")
+
+            if top_path is None:
+                ap("\t\tChecking topology rules with shapely")
+                counts = shapely_counts(db_dict, topo_pair, workers)
+                if not gmap:
+                    gmap = topo_pair[1].replace("|", "") or "GeologicMap"
+                level_2_errors, level_3_errors = tp.report_counts(
+                    counts, gmap, level_2_errors, level_3_errors
+                )
+                continue
 
         # evaluate the topology
         # eval_topology returns (level_2, level_3, missing_rules, top_errors)
@@ -404,8 +657,21 @@ def check_topology(db_dict, workdir, is_gpkg, topo_pairs):
         topo_gdb = Path(top_path).parent.parent
         top_name = Path(top_path).stem
         level_2_errors, level_3_errors = tp.eval_topology(
-            str(topo_gdb), top_name, db_dict, gmap, level_2_errors, level_3_errors
+            str(topo_gdb),
+            top_name,
+            db_dict,
+            gmap,
+            level_2_errors,
+            level_3_errors,
+            errors_gpkg,
         )
+        if errors_gpkg.exists():
+            ap(f"\t\tTopology errors copied to {errors_gpkg}")
+
+        if engine == "compare" and use_stp:
+            ap("\t\tChecking topology rules with shapely for comparison")
+            esri_counts = tp.rule_counts(str(topo_gdb), top_name, db_dict)
+            tp.compare_counts(gmap, esri_counts, shapely_counts(db_dict, topo_pair, workers))
 
     return level_2_errors, level_3_errors
 
@@ -426,7 +692,9 @@ def check_map_units(db_dict, level, all_map_units, fds_map_units):
     #     else:
     #         return missing, unused, None, None
 
-    dmu_units = list(set(values(db_dict, "DescriptionOfMapUnits", "MapUnit", "list")))
+    dmu_units = list(
+        dict.fromkeys(values(db_dict, "DescriptionOfMapUnits", "MapUnit", "list"))
+    )
     dmu_units = [u for u in dmu_units if not u == None]
     fds_map_units["DescriptionOfMapUnits"] = dmu_units
 
@@ -478,7 +746,7 @@ def check_map_units(db_dict, level, all_map_units, fds_map_units):
     ]
 
     # iterate through the tables
-    mu_tables = list(set(mu_tables))
+    mu_tables = list(dict.fromkeys(mu_tables))
     if mu_tables:
         for mu_table in mu_tables:
             # find out which feature dataset this table is in
@@ -499,21 +767,22 @@ def check_map_units(db_dict, level, all_map_units, fds_map_units):
             ]
 
             if mu_fields:
-                with arcpy.da.SearchCursor(
-                    db_dict[mu_table]["catalogPath"], mu_fields
-                ) as cursor:
-                    for row in cursor:
-                        for i, val in enumerate(row):
-                            if val:
-                                if not val in dmu_units:
-                                    html = f"""
-                                        <span class="table">{mu_table}</span>,
-                                        <span class="field">{mu_fields[i]}</span>,
-                                        <span class="value">{val}</span> 
-                                        """
-                                    missing.append(html)
-                                all_map_units.append(val)
-                                fds_map_units[fd].extend(row)
+                for row in table_rows(db_dict, mu_table, mu_fields):
+                    for i, val in enumerate(row):
+                        if val:
+                            if not val in dmu_units:
+                                html = f"""
+                                    <span class="table">{mu_table}</span>,
+                                    <span class="field">{mu_fields[i]}</span>,
+                                    <span class="value">{val}</span> 
+                                    """
+                                missing.append(
+                                    vr.Finding(
+                                        html, table=mu_table, field=mu_fields[i], value=val
+                                    )
+                                )
+                            all_map_units.append(val)
+                            fds_map_units[fd].extend(row)
 
             # reset mu_fields and check again
             # look at fields that have MapUnit in the name but are qualified
@@ -529,26 +798,28 @@ def check_map_units(db_dict, level, all_map_units, fds_map_units):
             ]
 
             if mu_fields:
-                with arcpy.da.SearchCursor(
-                    db_dict[mu_table]["catalogPath"], mu_fields
-                ) as cursor:
-                    for row in cursor:
-                        for i, val in enumerate(row):
-                            if not val in dmu_units and not val == None:
-                                html = f"""
-                                <span class="table">{mu_table}</span>,
-                                <span class="field">{mu_fields[i]}</span>,
-                                <span class="value">{val}</span>
-                                """
-                                mu_warnings.append(html)
+                for row in table_rows(db_dict, mu_table, mu_fields):
+                    for i, val in enumerate(row):
+                        if not val in dmu_units and not val == None:
+                            html = f"""
+                            <span class="table">{mu_table}</span>,
+                            <span class="field">{mu_fields[i]}</span>,
+                            <span class="value">{val}</span>
+                            """
+                            mu_warnings.append(
+                                vr.Finding(
+                                    html, table=mu_table, field=mu_fields[i], value=val
+                                )
+                            )
 
-            fds_map_units[fd] = list(set(fds_map_units[fd]))
+            fds_map_units[fd] = list(dict.fromkeys(fds_map_units[fd]))
 
-        all_map_units.extend(list(set(all_map_units)))
+        all_map_units.extend(list(dict.fromkeys(all_map_units)))
 
     missing = [i for n, i in enumerate(missing) if i not in missing[:n]]
 
-    unused.extend(list(set(dmu_units) - set(all_map_units)))
+    used_units = set(all_map_units)
+    unused.extend([u for u in dmu_units if not u in used_units])
 
     if level == 2:
         return (missing, all_map_units, fds_map_units)
@@ -631,7 +902,7 @@ def glossary_check(db_dict, level, all_gloss_terms):
                     vals = values(db_dict, table, field, "list", where)
 
                     # put all of these glossary terms in all_gloss_terms list
-                    field_vals = list(set(vals))
+                    field_vals = list(dict.fromkeys(vals))
                     if None in field_vals:
                         field_vals.remove(None)
                     all_gloss_terms.extend(field_vals)
@@ -648,7 +919,9 @@ def glossary_check(db_dict, level, all_gloss_terms):
                                 <span class="field">{field}</span>, 
                                 <span class="value">{el}</span>
                                 """
-                            missing.append(html)
+                            missing.append(
+                                vr.Finding(html, table=table, field=field, value=el)
+                            )
 
             if level == 3:
                 # also look for all non-GeMS field names in all tables ending in a controlled suffix, GeMS-sy fields
@@ -688,23 +961,28 @@ def glossary_check(db_dict, level, all_gloss_terms):
                             # listed as warnings, not errors
                             for g_field in gemsy_fields:
                                 vals = values(db_dict, table, g_field, "list")
-                                vals = list(set([el for el in vals if el]))
+                                vals = list(dict.fromkeys([el for el in vals if el]))
                                 all_gloss_terms.extend(vals)
                                 sorted_vals = [el for el in sorted(vals) if el]
 
                                 # look for missing values
                                 for el in sorted_vals:
                                     if not el in glossary_terms:
-                                        html = f"""
+                                        html = vr.Finding(
+                                            f"""
                                             <span class="table">{table}</span>, 
                                             <span class="field">{g_field}</span>, 
                                             <span class="value">{el}</span>
-                                            """
+                                            """,
+                                            table=table,
+                                            field=g_field,
+                                            value=el,
+                                        )
                                         # not sure why term_warnings gets duplicates...
                                         if not html in term_warnings:
                                             term_warnings.append(html)
 
-    missing_glossary_terms.extend(list(set(missing)))
+    missing_glossary_terms.extend(list(dict.fromkeys(missing)))
 
     if level == 2:
         return missing_glossary_terms, all_gloss_terms
@@ -755,7 +1033,9 @@ def sources_check(db_dict, level, all_sources):
         f"MissingDataSources{level}",
     ]
 
-    gems_sources = list(set(values(db_dict, "DataSources", "DataSources_ID", "list")))
+    gems_sources = list(
+        dict.fromkeys(values(db_dict, "DataSources", "DataSources_ID", "list"))
+    )
     missing = []
     for table in tables:
         # special case where DescriptionSourceID in DMU can be null:
@@ -783,18 +1063,47 @@ def sources_check(db_dict, level, all_sources):
                             if guf.is_bad_null(el):
                                 el = "NULL value or empty string (see Rule 3.13)"
                             missing.append(
-                                f"""
+                                vr.Finding(
+                                    f"""
                                     <span class="table">{table}</span>, 
                                     <span class="field">{ds_field}</span>, 
                                     <span class="value">{el}</span>
-                                    """
+                                    """,
+                                    table=table,
+                                    field=ds_field,
+                                    value=el,
+                                )
                             )
 
-    missing_source_ids.extend(list(set(missing)))
+    missing_source_ids.extend(list(dict.fromkeys(missing)))
 
     return missing_source_ids, all_sources
 
 
+def find_duplicates(db_dict, table, field):
+    """Rules 2.5, 2.7, and 2.9. Values that occur more than once in a field
+    along with the OBJECTIDs or _IDs of the rows in which they are found"""
+    id_fld = which_id(db_dict, table)
+    rows = table_rows(db_dict, table, [id_fld, field])
+    dups = guf.duplicate_index([r[1] for r in rows], [r[0] for r in rows])
+
+    html = []
+    for k in sorted(dups):
+        ids = ", ".join([str(i) for i in dups[k]])
+        html.append(
+            vr.Finding(
+                f'<span class="value">{k}</span>, <span class="field">{id_fld}</span> {ids}',
+                table=table,
+                field=field,
+                id_field=id_fld,
+                id=ids,
+                value=k,
+            )
+        )
+
+    return html
+
+
 def rule3_3(db_dict):
     """All NoNulls fields in all GeMS tables should be filled"""
     # find all gems_equivalent tables
@@ -830,14 +1139,18 @@ def rule3_3(db_dict):
 
             for k, v in vals.items():
                 if guf.empty(v) or guf.is_bad_null(v):
-                    html = f'<span class="table">{table}</span>, <span class="field">{field}</span>'
+                    html = vr.Finding(
+                        f'<span class="table">{table}</span>, <span class="field">{field}</span>',
+                        table=table,
+                        field=field,
+                    )
                     if field.lower() in ["fieldid"]:
                         warnings.append(html)
                     else:
                         errors.append(html)
 
-    missing_required_values.extend(list(set(errors)))
-    missing_warnings.extend(list(set(warnings)))
+    missing_required_values.extend(list(dict.fromkeys(errors)))
+    missing_warnings.extend(list(dict.fromkeys(warnings)))
 
     return missing_required_values, missing_warnings
 
@@ -846,7 +1159,7 @@ def rule3_5_and_7(db_dict, table, all_vals):
     """3.5 No unnecessary terms in Glossary
     3.7 No unnecessary sources in DataSources"""
     if table == "glossary":
-        terms = set(values(db_dict, "Glossary", "Term", "list"))
+        terms = dict.fromkeys(values(db_dict, "Glossary", "Term", "list"))
         unused = [
             "unnecessary term(s) in Glossary",
             "3.5 Terms in Glossary that are not used in geodatabase",
@@ -854,27 +1167,19 @@ def rule3_5_and_7(db_dict, table, all_vals):
         ]
 
     elif table == "datasources":
-        terms = set(values(db_dict, "DataSources", "DataSources_ID", "list"))
+        terms = dict.fromkeys(values(db_dict, "DataSources", "DataSources_ID", "list"))
         unused = [
             "unused source(s) in DataSources",
             "3.7 DataSources_IDs in DataSources that are not used in geodatabase",
             "UnusedSources",
         ]
 
-    unused.extend(list(terms - set(all_vals)))
+    used = set(all_vals)
+    unused.extend([t for t in terms if not t in used])
 
     return unused
 
 
-def piped(s, chrs):
-    # replace multiple delimiters with pipe
-    for c in chrs:
-        if c in s:
-            s = s.replace(c, "|")
-
-    return s
-
-
 def rule3_10(db_dict):
     """HierarchyKey values in DescriptionOfMapUnits are unique and well formed"""
     hkey_errors = [
@@ -893,114 +1198,87 @@ def rule3_10(db_dict):
         hkey_errors.append("No HierarchyKey values")
         return hkey_errors, hkey_warnings
 
-    # check for empty values
+    # split every key into fragments and index them, see hierarchy_keys.py
+    index = hk.analyze(hk_dict)
     id_fld = which_id(db_dict, "DescriptionOfMapUnits")
-    for k, v in hk_dict.items():
-        if guf.empty(v):
-            hkey_errors.append(
+
+    # check for empty values
+    for k in index["empty"]:
+        hkey_errors.append(
+            vr.Finding(
                 f"""
-                <span class="field">{id_fld}</span> 
-                <span class="value">{k}</span> 
-                has no <span class="field">HierarchyKey</span> value
-                """
+            <span class="field">{id_fld}</span> 
+            <span class="value">{k}</span> 
+            has no <span class="field">HierarchyKey</span> value
+            """,
+                table="DescriptionOfMapUnits",
+                field="HierarchyKey",
+                id_field=id_fld,
+                id=k,
             )
+        )
 
-    # find the delimiter
-    # make a list of all non-alphanumeric characters found in all hkeys
-    # if the length of the list is not 1, there are multiple delimiters.
-    # list of just the hkeys
-    delims = []
-    for hkey in hk_dict.values():
-        if not guf.empty(hkey):
-            for c in hkey:
-                delims.extend([c for c in hkey if c.isalnum() == False])
-    delims = list(set(delims))
-
-    frag_lengths = []
-    id_fld = which_id(db_dict, "DescriptionOfMapUnits")
-    if delims:
-        # dealing with a list of character-delimited keys
-        # look for multiple delimiters
-        if len(delims) > 1:
-            formatted = [f"<code>{c}</code>" for c in delims]
-            hkey_errors.append(f'Multiple delimiters found: {", ".join(formatted)}')
-
-        # turn each hk_dict value into a tuple (piped hkey, original hkey)
-        piped_dict = {
-            k: (piped(v, delims), v) for k, v in hk_dict.items() if not guf.empty(v)
-        }
+    # look for multiple delimiters
+    delims = index["delimiters"]
+    if len(delims) > 1:
+        formatted = [f"<code>{c}</code>" for c in delims]
+        hkey_errors.append(f'Multiple delimiters found: {", ".join(formatted)}')
 
-        # find duplicated pipe delim keys
-        pipe_keys = [v[0] for v in piped_dict.values()]
-        dupe_pipes = [hk for hk in pipe_keys if pipe_keys.count(hk) > 1]
-        dupe_pipes = set(dupe_pipes)
-
-        # iterate through dictionary items
-        for k, v in piped_dict.items():
-            new_key = v[0]
-            old_key = v[1]
-            # check for duplicated key
-            if new_key in dupe_pipes:
-                hkey_errors.append(
-                    f"""
-                    <span class="field">{id_fld}</span> 
-                    <span class="value">{k}</span> has duplicated key: 
-                    <span class="value">{old_key}</span> (ignore delimiter)
-                    """
-                )
+    # duplicated keys, ignoring the delimiter
+    for k, hkey in index["duplicates"].items():
+        hkey_errors.append(
+            vr.Finding(
+                f"""
+            <span class="field">{id_fld}</span> 
+            <span class="value">{k}</span> has duplicated key: 
+            <span class="value">{hkey}</span>{" (ignore delimiter)" if delims else ""}
+            """,
+                table="DescriptionOfMapUnits",
+                field="HierarchyKey",
+                id_field=id_fld,
+                id=k,
+                value=hkey,
+            )
+        )
 
-            # collect fragment length
-            for frag in new_key.split("|"):
-                if frag:
-                    frag_lengths.append(len(frag))
-
-                # look for non-numeric characters
-                for c in frag if c != "|" else c:
-                    if c.isnumeric() == False:
-                        hkey_warnings.append(
-                            f"""
-                            <span class="field">{id_fld}</span> 
-                            <span class="value>{k}</span>: 
-                            <span class="value">{old_key}</span> 
-                            includes non-numeric character <span class="value">{c}</span>. Please check!
-                            """
-                        )
-    else:
-        # dealing with a list of integers or single fragment values, that is,
-        # hkey values are not materialized paths, just numbers; 1,2,3,4...
-        # or 001, 002, 003
-
-        # look for duplicates
-        hks = list(hk_dict.values())
-        dupes = [hk for hk in hks if hks.count(hk) > 1]
-        dupes = set(dupes)
-
-        # itrate through dictionary
-        for oid, hkey in hk_dict.items():
-            # look for duplicates
-            if hkey in dupes:
-                hkey_errors.append(f"{id_fld} {oid} has duplicated key: {hkey}")
-
-            # look for non-numeric characters
-            for c in hkey:
-                if c.isnumeric == False:
-                    hkey_warnings.append(
-                        f"""
-                        <span class="tab"></span>
-                        <span class="field">{id_fld}</span> 
-                        <span class="value">{oid}</span>: 
-                        <span class="value">{hkey}</span> 
-                        includes non-numeric character <span class="value">{c}</span>. Please check!
-                        """
-                    )
+    # look for non-numeric characters
+    for k, hkey, c in index["non_numeric"]:
+        hkey_warnings.append(
+            vr.Finding(
+                f"""
+            <span class="field">{id_fld}</span> 
+            <span class="value">{k}</span>: 
+            <span class="value">{hkey}</span> 
+            includes non-numeric character <span class="value">{c}</span>. Please check!
+            """,
+                table="DescriptionOfMapUnits",
+                field="HierarchyKey",
+                id_field=id_fld,
+                id=k,
+                value=hkey,
+            )
+        )
 
-            # collect hkey length
-            if hkey:
-                frag_lengths.append(len(hkey))
+    # keys whose parent key is missing, 1-2-3 without 1-2
+    for k, hkey in index["orphans"].items():
+        hkey_warnings.append(
+            vr.Finding(
+                f"""
+            <span class="field">{id_fld}</span> 
+            <span class="value">{k}</span>: 
+            <span class="value">{hkey}</span> 
+            has no parent key in DescriptionOfMapUnits. Please check!
+            """,
+                table="DescriptionOfMapUnits",
+                field="HierarchyKey",
+                id_field=id_fld,
+                id=k,
+                value=hkey,
+            )
+        )
 
     # evaluate lengths
-    frag_lengths = set(frag_lengths)
-    if len(frag_lengths) != 1:
+    if len(index["widths"]) != 1:
         hkey_warnings.append(
             "Hierarchy keys/fragments are of inconsistent length. Please check!"
         )
@@ -1011,9 +1289,6 @@ def rule3_10(db_dict):
 def rule3_11(db_dict, ref_gmd):
     """All values of GeoMaterial are defined in GeoMaterialDict."""
     # return early if there is no GeoMaterialsDict
-    ref_gmd = str(ref_gmd)
-    gdb_gmd = db_dict["GeoMaterialDict"]["catalogPath"]
-
     if not "GeoMaterialDict" in db_dict:
         errors = '<span class="table">GeoMaterialDict</span> not found! See Rule 2.1'
         return errors
@@ -1026,44 +1301,52 @@ def rule3_11(db_dict, ref_gmd):
 
     # look for null values in GeoMaterialDict
     flds = ["HierarchyKey", "GeoMaterial", "IndentedName", "Definition"]
-    with arcpy.da.SearchCursor(gdb_gmd, flds) as cursor:
-        for row in cursor:
-            if any(n is None for n in row):
-                errors.append(
-                    f'There are null values in <span class="table">GeoMaterialDict</span>. Check "Refresh GeoMaterial Dict" on next validation'
+    for row in table_rows(db_dict, "GeoMaterialDict", flds):
+        if any(n is None for n in row):
+            errors.append(
+                vr.Finding(
+                    f'There are null values in <span class="table">GeoMaterialDict</span>. Check "Refresh GeoMaterial Dict" on next validation',
+                    table="GeoMaterialDict",
                 )
-                return errors
+            )
+            return errors
 
     # compare ref_gmd with gdb_gmd
-    ref_gmd_dict = {
-        # r[0].lower().strip(): r[1].lower().strip()
-        r[0]: r[1]
-        for r in arcpy.da.SearchCursor(ref_gmd, ["GeoMaterial", "Definition"])
-    }
+    ref = gm.load_reference(ref_gmd)
     gdb_gmd_dict = {
         # r[0].lower().strip(): r[1].lower().strip()
         r[0]: r[1]
-        for r in arcpy.da.SearchCursor(gdb_gmd, ["GeoMaterial", "Definition"])
+        for r in table_rows(db_dict, "GeoMaterialDict", ["GeoMaterial", "Definition"])
     }
     for k, v in gdb_gmd_dict.items():
         if k:
             # is the geomaterial in ref_gmd?
-            if k.lower().strip() in [n.lower().strip() for n in ref_gmd_dict.keys()]:
+            if gm.normalize(k) in ref["names"]:
                 if v:
                     # is the definition correct?
-                    if not v.lower().strip() == ref_gmd_dict[k].lower().strip():
+                    if not gm.normalize(v) == ref["definitions"][gm.normalize(k)]:
                         html = f'Definition of <span class="value">{k}</span> does not match GeMS standard'
-                        errors.append(html)
+                        errors.append(
+                            vr.Finding(
+                                html, table="GeoMaterialDict", field="Definition", value=k
+                            )
+                        )
                 else:
                     html = f'Definition for <span class="value">{k}</span> is missing. Check "Refresh GeoMaterial Dict" on next validation.'
-                    errors.append(html)
+                    errors.append(
+                        vr.Finding(
+                            html, table="GeoMaterialDict", field="Definition", value=k
+                        )
+                    )
 
             else:
                 html = f"""
                 <span class="value">{k}</span> in <span class="table">GeoMaterialDict</span> is not a valid GeoMaterial. 
                 Check "Refresh GeoMaterial Dict" on next validation and update any tables using this geomaterial.
                 """
-                errors.append(html)
+                errors.append(
+                    vr.Finding(html, table="GeoMaterialDict", field="GeoMaterial", value=k)
+                )
 
     # compare geomaterials in the tables to ref_gmd
     # exclude some gdb objects to look for GeoMaterial field
@@ -1084,55 +1367,58 @@ def rule3_11(db_dict, ref_gmd):
 
     # iterate through those tables
     msgs = []
-    # list of reference geomaterials
-    ref_geomats = [
-        r[0].lower().strip() for r in arcpy.da.SearchCursor(ref_gmd, "GeoMaterial")
-    ]
     for table in geomat_tables:
         # list of GeoMaterials in the table
-        tbl_geomats = list(set(values(db_dict, table, "GeoMaterial", "list")))
+        tbl_geomats = list(dict.fromkeys(values(db_dict, table, "GeoMaterial", "list")))
         if None in tbl_geomats:
             tbl_geomats = list(filter(None, tbl_geomats))
         if tbl_geomats:
             for geomat in tbl_geomats:
-                if not geomat.lower().strip() in ref_geomats and not guf.empty(geomat):
+                if not gm.normalize(geomat) in ref["names"] and not guf.empty(geomat):
                     html = f'<span class="value">{geomat}</span> in <span class="table">{table}</span> is not a valid GeoMaterial'
-                    msgs.append(html)
+                    msgs.append(
+                        vr.Finding(html, table=table, field="GeoMaterial", value=geomat)
+                    )
     if msgs:
-        msgs = list(set(msgs))
+        msgs = list(dict.fromkeys(msgs))
         errors.extend(msgs)
 
     return errors
 
 
-def rule3_12(db_dict, gdb_path):
+def rule3_12(db_dict):
     """No duplicate _ID values"""
     duplicate_ids = [
         "duplicated _ID value(s)",
         "3.12 Duplicated _ID Values. Missing value indicates an empty string, i.e., one or more space or tabs",
         "duplicate_ids",
     ]
-    ds = ogr.Open(gdb_path)
-    all_ids = [None]
-    set_ids = []
+    # index every _ID value in every table: {_ID value: [table, table...]}
+    ids = []
+    id_tables = []
     for k in db_dict:
         idf = f"{k}_ID"
-        sql = f"SELECT {idf} from {k}"
-        res = ds.ExecuteSQL(sql)
-        if res:
-            for row in res:
-                i = row.GetField(0)
-                if not i in all_ids:
-                    all_ids.append(i)
-                else:
-                    to_html = f"""
-                        <span class="table">{k}</span>, 
-                        <span class="field">{idf}</span>, 
-                        <span class="value">{i}</span>
-                        """
-                    set_ids.append(to_html)
+        if "fields" in db_dict[k] and idf in [f.name for f in db_dict[k]["fields"]]:
+            table_ids = [r[0] for r in table_rows(db_dict, k, [idf])]
+            ids.extend(table_ids)
+            id_tables.extend([k] * len(table_ids))
+
+    dup_ids = guf.duplicate_index(ids, id_tables)
+    set_ids = []
+    for i, tables in dup_ids.items():
+        for k in dict.fromkeys(tables):
+            to_html = f"""
+                <span class="table">{k}</span>, 
+                <span class="field">{k}_ID</span>, 
+                <span class="value">{i}</span>
+                """
+            set_ids.append(
+                vr.Finding(
+                    to_html, table=k, field=f"{k}_ID", id_field=f"{k}_ID", id=i, value=i
+                )
+            )
     if set_ids:
-        duplicate_ids.extend((list(set(set_ids))))
+        duplicate_ids.extend(set_ids)
 
     # db_tables = [
     #     k
@@ -1191,30 +1477,35 @@ def rule3_13(db_dict):
     for table in tables:
         id_fld = which_id(db_dict, table)
         text_fields = [f.name for f in db_dict[table]["fields"] if f.type == "String"]
+        if not text_fields:
+            continue
+        columns = table_columns(db_dict, table, [id_fld] + text_fields)
+        ids = columns[id_fld]
         for field in text_fields:
-            val_dict = values(db_dict, table, field, "dictionary")
-            for k, v in val_dict.items():
-                if v:
-                    if v.isspace() or v.lower() in ("&ltnull&gt", "<null>", ""):
-                        html = f"""
-                            <span class="table">{table}</span>, 
-                            <span class="field"> {field}</span>, 
-                            <span class="field">{id_fld}</span> 
-                            <span class="value">{str(k)}</span>
-                            """
-                        zero_length_strings.append(html)
+            # every value of the column is checked at once
+            bad, padded = sc.column_flags(columns[field])
+            for k in sc.flagged(ids, bad):
+                html = f"""
+                    <span class="table">{table}</span>, 
+                    <span class="field"> {field}</span>, 
+                    <span class="field">{id_fld}</span> 
+                    <span class="value">{str(k)}</span>
+                    """
+                zero_length_strings.append(
+                    vr.Finding(html, table=table, field=field, id_field=id_fld, id=k)
+                )
 
             # also collect leading_trailing_spaces for 'other stuff' report
-            for n in [
-                k for k, v in val_dict.items() if v and (len(v.strip()) != len(v))
-            ]:
+            for n in sc.flagged(ids, padded):
                 html = f"""
                     <span class="table">{table}</span>, 
                     <span class="field"> {field}</span>, 
                     <span class="field">{id_fld}</span> 
                     <span class="value">{str(n)}</span>
                     """
-                leading_trailing_spaces.append(html)
+                leading_trailing_spaces.append(
+                    vr.Finding(html, table=table, field=field, id_field=id_fld, id=n)
+                )
 
     return zero_length_strings, leading_trailing_spaces
 
@@ -1244,16 +1535,7 @@ def validate_online(metadata_file, workdir):
                 if not b"appears in unexpected order within" in line:
                     f.write(f"{line.decode('utf-8')}\n")
 
-        summary = r.json()["summary"]
-        if "No errors" in summary:
-            message = f"""
-                The database-level FGDC metadata are <a href="{metadata_errors.name}">formally correct</a> 
-                although the metadata record should be reviewed to verify that it is meaningful.<br>
-                """
-            ap("The metadata for this record are formally correct.")
-        else:
-            message = f'The metadata record for this database has <a href="{str(metadata_errors.name)}">formal errors</a>. Please fix!<br>'
-            ap(f"The metadata record for this database has errors. Please fix!")
+        message = metadata_message(r.json()["summary"], metadata_errors)
     else:
         message = (
             "There was a problem with the connection to the metadata validation service:<br>"
@@ -1264,18 +1546,103 @@ def validate_online(metadata_file, workdir):
     return message
 
 
+def metadata_message(summary, metadata_errors):
+    """html message for the report from the summary line of the errors file"""
+    if "No errors" in summary:
+        message = f"""
+            The database-level FGDC metadata are <a href="{metadata_errors.name}">formally correct</a> 
+            although the metadata record should be reviewed to verify that it is meaningful.<br>
+            """
+        ap("The metadata for this record are formally correct.")
+    else:
+        message = f'The metadata record for this database has <a href="{str(metadata_errors.name)}">formal errors</a>. Please fix!<br>'
+        ap(f"The metadata record for this database has errors. Please fix!")
+
+    return message
+
+
+def validate_metadata(metadata_file, workdir):
+    """validate the xml metadata locally against the FGDC schema and the rules of
+    fgdc_validator.py. The USGS metadata validation service is only used if the
+    local validation fails"""
+
+    metadata_errors = workdir / f"{metadata_file.stem}_errors.txt"
+    try:
+        lines = fv.validate(metadata_file)
+    except Exception as err:
+        ap(f"Could not validate the metadata locally: {err}")
+        return validate_online(metadata_file, workdir)
+
+    with open(metadata_errors, "wt", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+
+    return metadata_message(lines[-1], metadata_errors)
+
+
 def write_html(template, out_file):
     """Writes either the Validation or ValidationErrors file sending the val{}
-    dictionary as parameter
+    dictionary as parameter. The html is written as it is rendered, a piece at a
+    time, instead of being built in memory first
     """
     environment = Environment(loader=FileSystemLoader(scripts_dir))
     validation_template = environment.get_template(template)
     with open(out_file, mode="w", encoding="utf-8") as results:
-        results.write(validation_template.render(val=val))
+        results.writelines(validation_template.generate(val=val))
+
+
+def spill_findings(details_dir):
+    """Keep only the first inline_findings errors or warnings of each rule in val
+    so that the html reports stay small. The full lists are written to html pages
+    of page_findings lines in details_dir, linked from the last line of the
+    shortened list, after the pages of the last validation are deleted.
+    val["counts"] keeps the full number of errors or warnings of each rule for
+    the reports"""
+    # pages of rules that no longer have as many findings would still be there.
+    # .html.gz pages were written by earlier versions
+    if details_dir.is_dir():
+        for old in [*details_dir.glob("*.html"), *details_dir.glob("*.html.gz")]:
+            old.unlink()
+
+    val["counts"] = {}
+    for k, v in val.items():
+        if not isinstance(v, list):
+            continue
+        if re.match(r"rule\d_\d+$", k):
+            # [message, header, anchor, error, error...]
+            start = 3 if len(v) >= 3 else len(v)
+        elif k in vr.warning_outputs:
+            # [description, warning, warning...]
+            start = 1
+        else:
+            continue
+        n = len(v) - start
+        val["counts"][k] = n
+        if n <= inline_findings:
+            continue
+
+        details_dir.mkdir(exist_ok=True)
+        pages = []
+        for i in range(0, n, page_findings):
+            # plain html so that the pages open in a browser from the report
+            page = details_dir / f"{k}-{len(pages) + 1:03d}.html"
+            with open(page, "w", encoding="utf-8") as f:
+                f.write('<meta charset="utf-8">\n')
+                f.write(f"<h4>{v[start - 1] if start == 1 else v[1]}</h4>\n")
+                for line in v[start + i : start + i + page_findings]:
+                    f.write(f"{line}<br>\n")
+            pages.append(page)
+
+        links = ", ".join(
+            f'<a href="{html.escape(details_dir.name)}/{p.name}">page {i}</a>'
+            for i, p in enumerate(pages, start=1)
+        )
+        val[k] = v[: start + inline_findings] + [
+            f"<i>First {inline_findings} of {n} shown. All of them are listed in {links}</i>"
+        ]
 
 
-def determine_level(val):
-    """Determine level of compliance of the database depending on the length of
+def compliance_level(val):
+    """Level of compliance, 1, 2, or 3, of the database depending on the length of
     lists built for each of the rules. Must equal 3 items long to pass"""
     level2 = False
     level3 = False
@@ -1286,8 +1653,19 @@ def determine_level(val):
         level3 = True
 
     if level2 and level3:
-        level = 'This database is <a href=#Level3><font size="+1"><b>LEVEL 3 COMPLIANT.</b></a></font>\n'
+        return 3
     elif level2:
+        return 2
+    else:
+        return 1
+
+
+def determine_level(val):
+    """Determine level of compliance of the database, see compliance_level"""
+    level = compliance_level(val)
+    if level == 3:
+        level = 'This database is <a href=#Level3><font size="+1"><b>LEVEL 3 COMPLIANT.</b></a></font>\n'
+    elif level == 2:
         level = 'This database is <a href=#Level2><font size="+1"><b>LEVEL 2 COMPLIANT.</b></a></font>\n'
     else:
         level = 'This database may be <a href=#Level1><font size="+1"><b>LEVEL 1 COMPLIANT.</b></a></font>\n'
@@ -1350,22 +1728,19 @@ def build_tr(db_dict, tb):
     table.append("<//thead>")
 
     if tb == "DescriptionOfMapUnits":
-        sql = (None, "Order By HierarchyKey Asc")
+        order_by = "HierarchyKey"
     elif tb == "Glossary":
-        sql = (None, "Order By Term Asc")
+        order_by = "Term"
     elif tb == "DataSources":
-        sql = (None, "Order By DataSources_ID Asc")
+        order_by = "DataSources_ID"
     else:
-        sql = (None, None)
+        order_by = None
 
-    with arcpy.da.SearchCursor(
-        db_dict[tb]["catalogPath"], fields, sql_clause=sql
-    ) as cursor:
-        for row in cursor:
-            table.append("<tr>")
-            for val in row:
-                table.append(f"<td>{val}<//td>")
-            table.append("<//tr>")
+    for row in table_rows(db_dict, tb, fields, order_by=order_by):
+        table.append("<tr>")
+        for val in row:
+            table.append(f"<td>{val}<//td>")
+        table.append("<//tr>")
 
     table.append("</table>")
     table.append("</div>")
@@ -1404,8 +1779,33 @@ def raster_size(db_dict, name):
         return " cannot calculate size."
 
 
-def inventory(db_dict):
+def row_counts(db_dict, db_path):
+    """{table: number of rows} of every table and feature class, read in one pass,
+    see catalog.row_counts. The table cache is not used because rules 3.5 and 3.7
+    may have deleted rows since it was read"""
+    tables = [
+        k
+        for k, v in db_dict.items()
+        if any(w in v["concat_type"].lower() for w in ("feature class", "table"))
+    ]
+    try:
+        return cat.row_counts(db_path, tables)
+    except Exception as e:
+        ap(f"Could not count rows without arcpy: {e}")
+        return {}
+
+
+def get_count(counts, name, path):
+    """Number of rows in a table from counts or, failing that, from arcpy"""
+    if name in counts:
+        return counts[name]
+    return arcpy.GetCount_management(path)
+
+
+def inventory(db_dict, counts=None):
     # build inventory
+    # counts is {table: number of rows}, see row_counts
+    counts = counts or {}
     inv_list = []
 
     # first list nonspatial tables
@@ -1413,7 +1813,7 @@ def inventory(db_dict):
     tbs.sort()
     for tb in tbs:
         n_type = db_dict[tb]["concat_type"].lower()
-        count = arcpy.GetCount_management(db_dict[tb]["catalogPath"])
+        count = get_count(counts, tb, db_dict[tb]["catalogPath"])
         inv_list.append(f"{tb}, {n_type}, {count} rows")
 
     # list feature datasets and children
@@ -1426,7 +1826,7 @@ def inventory(db_dict):
                 tbs.append(child["name"])
                 n_type = child["concat_type"].lower()
                 if any(w in n_type for w in ("feature class", "table")):
-                    count = arcpy.GetCount_management(child["catalogPath"])
+                    count = get_count(counts, child["name"], child["catalogPath"])
                     inv_list.append(
                         f'<span class="tab"></span>{child["name"]}, {n_type}, {count} rows'
                     )
@@ -1444,7 +1844,7 @@ def inventory(db_dict):
     for el in els:
         n_type = db_dict[el]["concat_type"].lower()
         if any(w in n_type for w in ("feature class", "table")):
-            count = arcpy.GetCount_management(db_dict[el]["catalogPath"])
+            count = get_count(counts, el, db_dict[el]["catalogPath"])
             inv_list.append(f"{el}, {n_type}, {count} rows")
         elif n_type == "raster dataset":
             size = raster_size(db_dict, el)
@@ -1461,6 +1861,9 @@ def del_extra(db_dict, table, field, all_terms):
             if not row[0] in all_terms:
                 cursor.deleteRow()
 
+    # the cached copy of the table is now stale, read it again
+    load_tables(db_dict, {table: list(table_cache.get(table, {}))})
+
 def runDBStoredProcedure(conn, sql):
     egdb_conn = arcpy.ArcSDESQLExecute(conn)
     try:
@@ -1470,6 +1873,464 @@ def runDBStoredProcedure(conn, sql):
             arcpy.AddError(err)   
     del egdb_conn
     
+def topology_rules(
+    db_dict, workdir, is_gpkg, skip_topology, topo_pairs, workers=1, engine="arcpy"
+):
+    """Rules 2.3 and 3.2, returns (level_2_errors, level_3_errors)"""
+    if skip_topology:
+        level_2_errors = ["Topology check was skipped"]
+        level_3_errors = ["Topology check was skipped"]
+        ap("Topology check was skipped")
+    elif not topo_pairs:
+        level_2_errors = [
+            "No MapUnitPolys and ContactAndFaults pairs on which to check topology",
+            None,
+        ]
+        level_3_errors = [
+            "No MapUnitPolys and ContactAndFaults pairs on which to check topology",
+            None,
+        ]
+        ap("No MapUnitPolys and ContactAndFaults pairs on which to check topology")
+    else:
+        # returns (level_2_errors, level_3_errors
+        topo_results = check_topology(
+            db_dict, workdir, is_gpkg, topo_pairs, workers, engine
+        )
+        level_2_errors = topo_results[0]
+        level_3_errors = topo_results[1]
+
+    return level_2_errors, level_3_errors
+
+
+def unused_rows(db_dict, table, field, all_vals, delete_extra):
+    """Rules 3.5 and 3.7, optionally deleting the unused rows first"""
+    if delete_extra:
+        ap(f"\tRemoving unused rows from {table}")
+        del_extra(db_dict, table, field, all_vals)
+
+    return rule3_5_and_7(db_dict, table.lower(), all_vals)
+
+
+# Rules that only read from the table cache and can be checked in worker
+# processes. Each rule lists
+#   name - used to look up the rule in a worker process
+#   msg - message printed when the rule is checked
+#   requires - table without which the rule is not checked
+#   func - called with db_dict and then the inputs
+#   inputs - names of results from other rules that are needed
+#   outputs - names of the results returned by func
+#   missing - results used when the required table is not found
+#   tables - GeMS equivalents of the tables the rule reads, None for every table.
+#     The results are reused on the next run if none of these tables changed
+#   local - True if the rule has to run in this process
+#   phase - name of the rule in the Performance section of the report, optional
+# Rules that depend on the results of other rules have to be listed after them.
+rule_specs = [
+    {
+        "name": "2.4",
+        "msg": "2.4 All map units in MapUnitPolys have entries in DescriptionOfMapUnits table",
+        "requires": "DescriptionOfMapUnits",
+        "func": lambda db: check_map_units(db, 2, [], {}),
+        "inputs": [],
+        "outputs": ["rule2_4", "map_units_2", "fds_map_units_2"],
+        "tables": ["MapUnitPolys", "DescriptionOfMapUnits"],
+        "missing": (["DMU cannot be found. Rule not checked"], [], {}),
+    },
+    {
+        "name": "2.5",
+        "msg": "2.5 No duplicate MapUnit values in DescriptionOfMapUnits table",
+        "requires": "DescriptionOfMapUnits",
+        "func": lambda db: [
+            "duplicated MapUnit(s) in DMU",
+            "Duplicated MapUnit values in DescriptionOfMapUnits",
+            "DuplicatedMU",
+        ]
+        + find_duplicates(db, "DescriptionOfMapUnits", "MapUnit"),
+        "inputs": [],
+        "outputs": ["rule2_5"],
+        "tables": ["DescriptionOfMapUnits"],
+        "missing": (["DMU cannot be found. Rule not checked"],),
+    },
+    {
+        "name": "2.6",
+        "msg": "2.6 Certain field values within required elements have entries in Glossary table",
+        "requires": "Glossary",
+        "func": lambda db: glossary_check(db, 2, []),
+        "inputs": [],
+        "outputs": ["rule2_6", "gloss_terms_2"],
+        "tables": gdef.rule2_1_elements,
+        "missing": (["Glossary cannot be found. Rule not checked"], []),
+    },
+    {
+        "name": "2.7",
+        "msg": "2.7 No duplicate Term values in Glossary table",
+        "requires": "Glossary",
+        "func": lambda db: [
+            "duplicated terms in Glossary",
+            "2.7 Duplicated terms in Glossary",
+            "DuplicatedTerms",
+        ]
+        + find_duplicates(db, "Glossary", "Term"),
+        "inputs": [],
+        "outputs": ["rule2_7"],
+        "tables": ["Glossary"],
+        "missing": (["Glossary cannot be found. Rule not checked"],),
+    },
+    {
+        "name": "2.8",
+        "msg": "2.8 All xxxSourceID values in required elements have entries in DataSources table",
+        "requires": "DataSources",
+        "func": lambda db: sources_check(db, 2, []),
+        "inputs": [],
+        "outputs": ["rule2_8", "sources_2"],
+        "tables": gdef.rule2_1_elements,
+        "missing": (["DataSources cannot be found. Rule not checked"], []),
+    },
+    {
+        "name": "2.9",
+        "msg": "2.9 No duplicate DataSources_ID values in DataSources table",
+        "requires": "DataSources",
+        "func": lambda db: [
+            "duplicated source IDs in DataSources",
+            "Duplicated source_IDs in DataSources",
+            "DuplicatedIDs",
+        ]
+        + find_duplicates(db, "DataSources", "DataSources_ID"),
+        "inputs": [],
+        "outputs": ["rule2_9"],
+        "tables": ["DataSources"],
+        "missing": (["DataSources cannot be found. Rule not checked"],),
+    },
+    {
+        "name": "3.3",
+        "msg": "3.3 No missing required values",
+        "requires": "Glossary",
+        "func": rule3_3,
+        "inputs": [],
+        "outputs": ["rule3_3", "missing_warnings"],
+        "tables": None,
+        "missing": (["Glossary cannot be found. Rule not checked"], []),
+    },
+    {
+        "name": "3.4",
+        "msg": "3.4 No missing terms in Glossary",
+        "requires": "Glossary",
+        "func": lambda db, terms: glossary_check(db, 3, list(terms)),
+        "inputs": ["gloss_terms_2"],
+        "outputs": ["rule3_4", "all_gloss_terms", "term_warnings"],
+        "tables": None,
+        "missing": (["Glossary cannot be found. Rule not checked"], [], []),
+    },
+    {
+        "name": "3.6",
+        "msg": "3.6 No missing sources in DataSources",
+        "requires": "DataSources",
+        "func": lambda db, sources: sources_check(db, 3, list(sources)),
+        "inputs": ["sources_2"],
+        "outputs": ["rule3_6", "all_sources"],
+        "tables": None,
+        "missing": (["DataSources cannot be found. Rule not checked"], []),
+    },
+    {
+        "name": "3.8",
+        "msg": "3.8 No map units without entries in DescriptionOfMapUnits\n3.9 No unnecessary map units in DescriptionOfMapUnits",
+        "requires": "DescriptionOfMapUnits",
+        "func": lambda db, units, fds_units: check_map_units(
+            db, 3, list(units), dict(fds_units)
+        ),
+        "inputs": ["map_units_2", "fds_map_units_2"],
+        "outputs": [
+            "rule3_8",
+            "rule3_9",
+            "all_map_units",
+            "fds_map_units",
+            "mu_warnings",
+        ],
+        "tables": None,
+        "missing": (
+            ["DMU cannot be found. Rule not checked"],
+            ["DMU cannot be found. Rule not checked"],
+            [],
+            [],
+            [],
+        ),
+    },
+    {
+        "name": "3.10",
+        "msg": "3.10 HierarchyKey values in DescriptionOfMapUnits are unique and well formed",
+        "requires": "DescriptionOfMapUnits",
+        "func": rule3_10,
+        "inputs": [],
+        "outputs": ["rule3_10", "hkey_warnings"],
+        "tables": ["DescriptionOfMapUnits"],
+        "missing": (["DMU cannot be found. Rule not checked"], ["Hierarchy keys"]),
+    },
+    {
+        "name": "3.11",
+        "msg": "3.11 All values of GeoMaterial are defined in GeoMaterialDict. GeoMaterialDict is as specified in the GeMS standard",
+        "requires": None,
+        "func": lambda db: rule3_11(db, scripts_dir / "GeoMaterialDict.csv"),
+        "inputs": [],
+        "outputs": ["rule3_11"],
+        "tables": None,
+    },
+    {
+        "name": "3.12",
+        "msg": "3.12 No duplicate _ID values",
+        "requires": None,
+        "func": rule3_12,
+        "inputs": [],
+        "outputs": ["rule3_12"],
+        "tables": None,
+    },
+    {
+        "name": "3.13",
+        "msg": "3.13 No zero-length or whitespace-only strings",
+        "requires": None,
+        "func": rule3_13,
+        "inputs": [],
+        "outputs": ["rule3_13", "end_spaces"],
+        "tables": None,
+    },
+]
+
+# number of errors or warnings of each rule listed in the html reports and the
+# number on each page of the full lists, see spill_findings
+inline_findings = 1000
+page_findings = 50000
+
+# minimum number of rows in the table cache before rules are checked in
+# worker processes; below this, starting the processes takes longer than the rules
+parallel_min_rows = 100000
+
+# set in worker processes by init_worker
+worker_db_dict = None
+
+
+def portable_db_dict(db_dict):
+    """Copy of db_dict with only the plain values read by the rules in rule_specs
+    so that it can be sent to worker processes. arcpy Field objects are
+    replaced with namespaces with the same name, type, and domain attributes"""
+    keep = (
+        "name",
+        "dataType",
+        "concat_type",
+        "gems_equivalent",
+        "feature_dataset",
+        "catalogPath",
+    )
+    new_dict = {}
+    for k, v in db_dict.items():
+        new_dict[k] = {key: v[key] for key in keep if key in v}
+        if "fields" in v:
+            new_dict[k]["fields"] = [
+                SimpleNamespace(name=f.name, type=f.type, domain=f.domain)
+                for f in v["fields"]
+            ]
+
+    return new_dict
+
+
+def init_worker(db_dict, cache, idfield):
+    """Initializer for worker processes"""
+    global worker_db_dict, use_idfield
+    worker_db_dict = db_dict
+    table_cache.update(cache)
+    use_idfield = idfield
+
+
+def run_rule(name, inputs):
+    """Check one rule from rule_specs in a worker process.
+    Returns the result and the timing record of the rule"""
+    spec = [s for s in rule_specs if s["name"] == name][0]
+    with tm.phase(spec.get("phase", f"Rule {name}")) as record:
+        result = spec["func"](worker_db_dict, *inputs)
+    return result, record
+
+
+def start_pool(db_dict, workers):
+    """Pool of worker processes that have a copy of the table cache"""
+    guf.set_pool_executable()
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=init_worker,
+        initargs=(portable_db_dict(db_dict), table_cache, use_idfield),
+    )
+
+
+def store_results(results, spec, result, writer=None):
+    if len(spec["outputs"]) == 1:
+        result = (result,)
+    results.update(zip(spec["outputs"], result))
+    if writer:
+        for output in spec["outputs"]:
+            writer.write(output, results[output], spec["name"])
+
+
+def run_rules(db_dict, specs, workers, reuse=None, writer=None):
+    """Check each rule in specs as soon as the results it needs from other rules are
+    available. With more than one worker, rules that are not local are checked
+    concurrently in worker processes while local rules run in this process.
+    reuse is {rule name: {output name: result}} from the last run for rules whose
+    tables have not changed. Those results are used as long as the inputs of the
+    rule were also reused.
+    writer is a validation_results.FindingsWriter to which the findings of each
+    rule are written as soon as the rule finishes.
+    Returns a dictionary {output name: result} which the caller copies to val
+    in a fixed order, so the report does not depend on which rule finished first"""
+    reuse = reuse or {}
+    results = {}
+    reused = []
+    pending = []
+    for spec in specs:
+        if spec["requires"] and not spec["requires"] in db_dict:
+            ap(spec["msg"])
+            store_results(results, spec, spec["missing"], writer)
+        else:
+            pending.append(spec)
+
+    pool = None
+    if workers > 1 and any(
+        not s.get("local") and not s["name"] in reuse for s in pending
+    ):
+        try:
+            pool = start_pool(db_dict, workers)
+            ap(f"Checking rules in {workers} worker processes")
+        except Exception as e:
+            ap(f"Could not start worker processes, checking rules one at a time: {e}")
+
+    running = {}
+    try:
+        while pending or running:
+            ready = [s for s in pending if all(i in results for i in s["inputs"])]
+            if not ready and not running:
+                names = ", ".join([s["name"] for s in pending])
+                raise ValueError(f"Rules {names} are waiting on results never produced")
+
+            # use the results of the last run for rules that read unchanged tables
+            cached = [
+                s
+                for s in ready
+                if s["name"] in reuse and all(i in reused for i in s["inputs"])
+            ]
+            if cached:
+                for spec in cached:
+                    pending.remove(spec)
+                    ap(spec["msg"])
+                    ap("\tNo changes since last validation, using previous results")
+                    store_results(
+                        results,
+                        spec,
+                        [reuse[spec["name"]][o] for o in spec["outputs"]],
+                        writer,
+                    )
+                    reused.extend(spec["outputs"])
+                continue
+
+            # hand every rule that is ready to the pool
+            if pool:
+                for spec in [s for s in ready if not s.get("local")]:
+                    pending.remove(spec)
+                    ap(spec["msg"])
+                    inputs = [results[i] for i in spec["inputs"]]
+                    running[pool.submit(run_rule, spec["name"], inputs)] = spec
+
+            # then check the first local rule that is ready, and look again for
+            # rules that are waiting on its results
+            local = [s for s in ready if s.get("local") or not pool]
+            if local:
+                spec = local[0]
+                pending.remove(spec)
+                ap(spec["msg"])
+                inputs = [results[i] for i in spec["inputs"]]
+                with tm.phase(spec.get("phase", f"Rule {spec['name']}")):
+                    store_results(
+                        results, spec, spec["func"](db_dict, *inputs), writer
+                    )
+                continue
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                spec = running.pop(fut)
+                try:
+                    result, record = fut.result()
+                    tm.records.append(record)
+                except BrokenProcessPool:
+                    # a worker died. check this rule, and everything after it, here
+                    if pool:
+                        pool.shutdown(wait=False)
+                        pool = None
+                    inputs = [results[i] for i in spec["inputs"]]
+                    with tm.phase(spec.get("phase", f"Rule {spec['name']}")):
+                        result = spec["func"](db_dict, *inputs)
+                store_results(results, spec, result, writer)
+    finally:
+        if pool:
+            pool.shutdown()
+
+    return results
+
+
+def table_fingerprints(db_dict):
+    """Fingerprint of every table in the table cache
+    {table: {"rows": n, "max_oid": n, "hash": content and schema hash}}"""
+    fps = {}
+    for table, columns in table_cache.items():
+        fields = db_dict[table]["fields"]
+        oid = [f.name for f in fields if f.type == "OID"]
+        schema = [(f.name, f.type, f.domain) for f in fields]
+        fps[table] = fp.column_fingerprint(columns, oid[0] if oid else None, schema)
+
+    return fps
+
+
+def rule_signature(db_dict, spec, fps):
+    """Fingerprints of the tables read by a rule"""
+    if spec.get("tables") is None:
+        tables = list(fps)
+    else:
+        tables = [
+            k for k, v in db_dict.items() if v["gems_equivalent"] in spec["tables"]
+        ]
+
+    return {t: fps[t] for t in sorted(tables) if t in fps}
+
+
+def cached_results(cache, settings, db_dict, specs, fps):
+    """Results from the validation cache of the last run for each rule whose tables
+    have not changed. Returns {rule name: {output name: result}}"""
+    if not cache.get("settings") == settings:
+        return {}
+
+    reuse = {}
+    for spec in specs:
+        if not spec.get("cache", True):
+            continue
+        rule = cache.get("rules", {}).get(spec["name"])
+        if not rule or not rule["tables"] == rule_signature(db_dict, spec, fps):
+            continue
+        if all(o in rule["results"] for o in spec["outputs"]):
+            reuse[spec["name"]] = vr.from_json(rule["results"])
+
+    return reuse
+
+
+def save_results(cache_path, settings, db_dict, specs, fps, results):
+    """Write table fingerprints and the results of each rule to the validation cache"""
+    rules = {}
+    for spec in specs:
+        if spec.get("cache", True) and all(o in results for o in spec["outputs"]):
+            rules[spec["name"]] = {
+                "tables": rule_signature(db_dict, spec, fps),
+                "results": vr.to_json({o: results[o] for o in spec["outputs"]}),
+            }
+    cache = {"settings": settings, "tables": fps, "rules": rules}
+    try:
+        fp.write_manifest(cache_path, cache)
+    except (OSError, TypeError, ValueError) as e:
+        ap(f"Could not write validation cache {cache_path}: {e}")
+
+
 ##############start here##################
 # get inputs
 def main(argv):
@@ -1548,11 +2409,10 @@ def main(argv):
         use_idfield = False
 
     # skip topology?
+    # Topology.gdb is kept between runs and only updated when the feature
+    # classes change, see topology.make_topology
     if 8 < args_len:
         skip_topology = guf.eval_bool(argv[8])
-        top_db = workdir / "Topology.gdb"
-        if arcpy.Exists(str(top_db)):
-            arcpy.Delete_management(str(top_db))
     else:
         skip_topology = False
     val["parameters"].append(f"Skip topology check: {skip_topology}")
@@ -1586,13 +2446,41 @@ def main(argv):
     else:
         open_report = False
 
+    # number of worker processes in which to check rules
+    workers = max(1, min(4, (os.cpu_count() or 1) - 1))
+    if 13 < args_len and not argv[13] in ("#", ""):
+        workers = max(1, int(argv[13]))
+
+    # check every rule, even if the tables have not changed since the last run?
+    if 14 < args_len:
+        full_run = guf.eval_bool(argv[14])
+    else:
+        full_run = False
+    val["parameters"].append(f"Check all rules: {full_run}")
+
+    # how to check topology where there is no topology, see topology_engine
+    if 15 < args_len and not argv[15] in ("#", ""):
+        topo_engine = topology_engine(argv[15], is_gpkg)
+    else:
+        topo_engine = topology_engine("", is_gpkg)
+    if not skip_topology:
+        val["parameters"].append(f"Topology engine: {topo_engine}")
+
     val["report_path"] = workdir / f"{gdb_name}-Validation.html"
     val["report_name"] = f"{gdb_name}-Validation.html"
     val["errors_name"] = f"{gdb_name}-ValidationErrors.html"
     val["errors_path"] = str(workdir / f"{gdb_name}-ValidationErrors.html")
 
     # make the database dictionary
-    db_dict = guf.gdb_object_dict(str(gdb_path))
+    tm.reset()
+    # read without arcpy and kept in workdir until the database changes,
+    # see catalog.py
+    with tm.phase("Catalog"):
+        try:
+            db_dict = cat.object_dict(gdb_path, workdir)
+        except Exception as e:
+            ap(f"Could not read the catalog without arcpy, using arcpy: {e}")
+            db_dict = guf.gdb_object_dict(str(gdb_path))
     #ap(str(db_dict))
 
     # edit session?
@@ -1614,35 +2502,59 @@ def main(argv):
                 "\nGeoMaterialDict.csv is missing from scripts folder"
             )
         else:
-            ap("Refreshing GeoMaterialDict")
-            gmd = gdb_path / "GeoMaterialDict"
-            guf.testAndDelete(str(gmd))
-            arcpy.conversion.TableToTable(
-                str(ref_gmd), str(gdb_path), "GeoMaterialDict"
-            )
-
-            if not is_gpkg:
-                ap("Replacing GeoMaterial domain")
-                arcpy.management.TableToDomain(
-                    str(ref_gmd),
-                    "GeoMaterial",
-                    "IndentedName",
-                    str(gdb_path),
-                    "GeoMaterials",
-                    "",
-                    "REPLACE",
-                )
+            with tm.phase("Refresh GeoMaterialDict"):
+                ref = gm.load_reference(ref_gmd)
+                gmd = gdb_path / "GeoMaterialDict"
+                # only rewrite the table and domain if they differ from the reference
+                try:
+                    with arcpy.da.SearchCursor(str(gmd), list(gm.fields)) as cursor:
+                        current = gm.same_rows(cursor, ref)
+                except Exception:
+                    current = False
+
+                if current:
+                    ap("GeoMaterialDict already matches the reference table")
+                else:
+                    ap("Refreshing GeoMaterialDict")
+                    guf.testAndDelete(str(gmd))
+                    arcpy.conversion.TableToTable(
+                        str(ref_gmd), str(gdb_path), "GeoMaterialDict"
+                    )
 
-                ap("Assigning domain to GeoMaterial")
-                dmu_path = db_dict["DescriptionOfMapUnits"]["catalogPath"]
-                dmu_fields = db_dict["DescriptionOfMapUnits"]["fields"]
-                for f in dmu_fields:
-                    if f.name == "GeoMaterial" and not f.domain == "GeoMaterials":
-                        arcpy.management.AssignDomainToField(
-                            dmu_path, f.name, "GeoMaterials"
+                if not is_gpkg:
+                    domains = {
+                        d.name: d.codedValues
+                        for d in arcpy.da.ListDomains(str(gdb_path))
+                    }
+                    if domains.get("GeoMaterials") == ref["domain"]:
+                        ap("GeoMaterial domain already matches the reference table")
+                    else:
+                        ap("Replacing GeoMaterial domain")
+                        arcpy.management.TableToDomain(
+                            str(ref_gmd),
+                            "GeoMaterial",
+                            "IndentedName",
+                            str(gdb_path),
+                            "GeoMaterials",
+                            "",
+                            "REPLACE",
                         )
+
+                    ap("Assigning domain to GeoMaterial")
+                    dmu_path = db_dict["DescriptionOfMapUnits"]["catalogPath"]
+                    dmu_fields = db_dict["DescriptionOfMapUnits"]["fields"]
+                    for f in dmu_fields:
+                        if f.name == "GeoMaterial" and not f.domain == "GeoMaterials":
+                            arcpy.management.AssignDomainToField(
+                                dmu_path, f.name, "GeoMaterials"
+                            )
     val["gm_errors"] = geo_material_errors
 
+    # read every table the rules need once, up front
+    ap("Reading tables")
+    with tm.phase("Reading tables"):
+        load_tables(db_dict, plan_scan(db_dict))
+
     # look for geodatabase version
     # not implemented yet
     # if "PublicationTable" in db_dict.keys():
@@ -1653,6 +2565,11 @@ def main(argv):
     #     else:
     #         gdb_ver = ""
 
+    # findings are written to ndjson as each rule finishes
+    findings = vr.FindingsWriter(
+        workdir / f"{gdb_name}-ValidationFindings.ndjson", str(gdb_path)
+    )
+
     # level 2 compliance
     ap("\u200B")
     ap("Looking at level 2 compliance")
@@ -1662,9 +2579,12 @@ def main(argv):
         DescriptionOfMapUnits, GeoMaterialDict; feature dataset GeologicMap with 
         feature classes ContactsAndFaults and MapUnitPolys"""
     )
-    rule2_1_results = rule2_1(db_dict, is_gpkg)
+    with tm.phase("Rule 2.1"):
+        rule2_1_results = rule2_1(db_dict, is_gpkg)
     val["rule2_1"] = rule2_1_results[0]
     val["sr_warnings"] = rule2_1_results[2]
+    findings.write("rule2_1", val["rule2_1"])
+    findings.write("sr_warnings", val["sr_warnings"])
 
     # rule 2.2
     # Required fields within required elements are present and correctly defined
@@ -1673,245 +2593,131 @@ def main(argv):
     )
     schema_extensions = []
     # fld_warnings is not getting defined right now. Should we use it?
-    val["rule2_2"], schema_extensions, fld_warnings = check_fields(
-        db_dict, 2, schema_extensions
-    )
-
-    # rule 2.3 topology
-    ap(
-        """2.3 All MapUnitPolys and ContactsAndFaults based feature classes obey Level 2 topology rules: 
-        no internal gaps or overlaps in MapUnitPolys, boundaries of MapUnitPolys are covered by ContactsAndFaults"""
-    )
-
-    if skip_topology:
-        level_2_errors = ["Topology check was skipped"]
-        level_3_errors = ["Topology check was skipped"]
-        ap("Topology check was skipped")
-    elif not rule2_1_results[1]:
-        level_2_errors = [
-            "No MapUnitPolys and ContactAndFaults pairs on which to check topology",
-            None,
-        ]
-        level_3_errors = [
-            "No MapUnitPolys and ContactAndFaults pairs on which to check topology",
-            None,
-        ]
-        ap("No MapUnitPolys and ContactAndFaults pairs on which to check topology")
-    else:
-        # returns (level_2_errors, level_3_errors
-        topo_results = check_topology(db_dict, workdir, is_gpkg, rule2_1_results[1])
-        level_2_errors = topo_results[0]
-        level_3_errors = topo_results[1]
-
-    val["rule2_3"] = level_2_errors
-
-    # rule 2.4
-    # All map units in MapUnitPolys have entries in DescriptionOfMapUnits table
-    # make a list of MapUnits found in the DMU
-    # dmu_units = values("DescriptonOfMapUnits", "MapUnit", "list")
-    ap("2.4 All map units in MapUnitPolys have entries in DescriptionOfMapUnits table")
-    all_map_units = []
-    fds_map_units = {}
-    if "DescriptionOfMapUnits" in db_dict:
-        val["rule2_4"], all_map_units, fds_map_units = check_map_units(
-            db_dict, 2, all_map_units, fds_map_units
+    with tm.phase("Rule 2.2"):
+        val["rule2_2"], schema_extensions, fld_warnings = check_fields(
+            db_dict, 2, schema_extensions
         )
-    else:
-        val["rule2_4"] = ["DMU cannot be found. Rule not checked"]
-
-    # rule 2.5
-    # No duplicate MapUnit values in DescriptionOfMapUnit table
-    ap("2.5 No duplicate MapUnit values in DescriptionOfMapUnits table")
-    dmu_map_units_duplicates = [
-        "duplicated MapUnit(s) in DMU",
-        "Duplicated MapUnit values in DescriptionOfMapUnits",
-        "DuplicatedMU",
+    findings.write("rule2_2", val["rule2_2"])
+
+    # rules 2.3 - 2.9 and 3.2 - 3.13
+    # 3.5 and 3.7 may delete rows so they run here, not in a worker process
+    # the topology check runs here while other rules are being checked in workers
+    specs = [
+        {
+            "name": "2.3",
+            "msg": """2.3 All MapUnitPolys and ContactsAndFaults based feature classes obey Level 2 topology rules: 
+        no internal gaps or overlaps in MapUnitPolys, boundaries of MapUnitPolys are covered by ContactsAndFaults""",
+            "requires": None,
+            "func": lambda db: topology_rules(
+                db,
+                workdir,
+                is_gpkg,
+                skip_topology,
+                rule2_1_results[1],
+                workers,
+                topo_engine,
+            ),
+            "inputs": [],
+            "outputs": ["rule2_3", "rule3_2"],
+            "tables": ["MapUnitPolys", "ContactsAndFaults"],
+            "phase": "Topology, rules 2.3 and 3.2",
+            "local": True,
+        }
     ]
-    if "DescriptionOfMapUnits" in db_dict:
-        dmu_path = db_dict["DescriptionOfMapUnits"]["catalogPath"]
-        dmu_map_units_duplicates.extend(guf.get_duplicates(dmu_path, "MapUnit"))
-        val["rule2_5"] = dmu_map_units_duplicates
-    else:
-        val["rule2_5"] = ["DMU cannot be found. Rule not checked"]
-
-    # rule 2.6
-    # Certain field values within required elements have entries in Glossary table
-    ap(
-        "2.6 Certain field values within required elements have entries in Glossary table"
+    specs.extend(rule_specs)
+    specs.extend(
+        [
+            {
+                "name": "3.5",
+                "msg": "3.5 No unnecessary terms in Glossary",
+                "requires": "Glossary",
+                "func": lambda db, terms: unused_rows(
+                    db, "Glossary", "Term", terms, delete_extra
+                ),
+                "inputs": ["all_gloss_terms"],
+                "outputs": ["rule3_5"],
+                "missing": (["Glossary cannot be found. Rule not checked"],),
+                "tables": None,
+                "cache": not delete_extra,
+                "local": True,
+            },
+            {
+                "name": "3.7",
+                "msg": "3.7 No unnecessary sources in DataSources",
+                "requires": "DataSources",
+                "func": lambda db, sources: unused_rows(
+                    db, "DataSources", "DataSources_ID", sources, delete_extra
+                ),
+                "inputs": ["all_sources"],
+                "outputs": ["rule3_7"],
+                "missing": (["DataSources cannot be found. Rule not checked"],),
+                "tables": None,
+                "cache": not delete_extra,
+                "local": True,
+            },
+        ]
     )
-    all_gloss_terms = []
-    if "Glossary" in db_dict:
-        val["rule2_6"], all_gloss_terms = glossary_check(db_dict, 2, all_gloss_terms)
-    else:
-        val["rule2_6"], all_gloss_terms = [
-            "Glossary cannot be found. Rule not checked"
-        ], []
-
-    # rule 2.7
-    # No duplicate Term values in Glossary table
-    ap("2.7 No duplicate Term values in Glossary table")
-    glossary_term_duplicates = [
-        "duplicated terms in Glossary",
-        "2.7 Duplicated terms in Glossary",
-        "DuplicatedTerms",
-    ]
-    if "Glossary" in db_dict:
-        gloss_path = db_dict["Glossary"]["catalogPath"]
-        glossary_term_duplicates.extend(guf.get_duplicates(gloss_path, "Term"))
-        val["rule2_7"] = glossary_term_duplicates
-    else:
-        val["rule2_7"] = ["Glossary cannot be found. Rule not checked"]
 
-    # rule 2.8
-    # All xxxSourceID values in required elements have entries in DataSources table
-    ap(
-        "2.8 All xxxSourceID values in required elements have entries in DataSources table"
-    )
-    all_sources = []
-    if "DataSources" in db_dict:
-        val["rule2_8"], all_sources = sources_check(db_dict, 2, all_sources)
-    else:
-        val["rule2_8"], all_sources = [
-            "DataSources cannot be found. Rule not checked"
-        ], []
-
-    # rule 2.9
-    # No duplicate DataSources_ID values in DataSources table
-    ap("2.9 No duplicate DataSources_ID values in DataSources table")
-    duplicated_source_ids = [
-        "duplicated source IDs in DataSources",
-        "Duplicated source_IDs in DataSources",
-        "DuplicatedIDs",
-    ]
-    if "DataSources" in db_dict:
-        ds_path = db_dict["DataSources"]["catalogPath"]
-        duplicated_source_ids.extend(guf.get_duplicates(ds_path, "DataSources_ID"))
-        val["rule2_9"] = duplicated_source_ids
-    else:
-        val["rule2_9"] = ["DataSources cannot be found. Rule not checked"]
+    # only use worker processes on databases big enough to be worth it
+    n_rows = sum([len(next(iter(t.values()), [])) for t in table_cache.values()])
+    if n_rows < parallel_min_rows:
+        workers = 1
+
+    # reuse the results of rules whose tables have not changed since the last run
+    cache_path = workdir / f"{gdb_name}-ValidationCache.json"
+    fps = table_fingerprints(db_dict)
+    settings = {
+        "version": version_string,
+        "use_idfield": use_idfield,
+        "skip_topology": skip_topology,
+        "topology_engine": topo_engine,
+        "ref_gmd": fp.file_fingerprint(ref_gmd),
+    }
+    reuse = {}
+    if not full_run:
+        reuse = cached_results(
+            fp.read_manifest(cache_path), settings, db_dict, specs, fps
+        )
+        # topology errors are stored in Topology.gdb, check again if it is gone
+        topo_gdb = workdir / "Topology.gdb"
+        if (
+            not skip_topology
+            and not topo_engine == "shapely"
+            and not arcpy.Exists(str(topo_gdb))
+        ):
+            reuse.pop("2.3", None)
+    results = run_rules(db_dict, specs, workers, reuse, findings)
+    save_results(cache_path, settings, db_dict, specs, fps, results)
+
+    # copy results to val in rule order
+    for i in range(3, 10):
+        val[f"rule2_{i}"] = results[f"rule2_{i}"]
 
     ap("\u200B")
     ap("Looking at level 3 compliance")
     # rule 3.1
     # Table and field definitions conform to GeMS schema
     ap("3.1 Table and field definitions conform to GeMS schema")
-    val["rule3_1"], schema_extensions, val["fld_warnings"] = check_fields(
-        db_dict, 3, schema_extensions
-    )
-
-    # rule 3.2
-    ap(
-        """3.2 All MapUnitPolys and ContactsAndFaults based feature classes obey Level 3 topology rules: 
-        no overlaps, self-overlaps, or self-intersections in ContactsAndFaults."""
-    )
-    val["rule3_2"] = level_3_errors
-
-    # rule 3.3
-    # No missing required values
-    ap("3.3 No missing required values")
-    if "Glossary" in db_dict:
-        val["rule3_3"], val["missing_warnings"] = rule3_3(db_dict)
-    else:
-        val["rule3_3"], val["missing_warnings"] = [
-            "Glossary cannot be found. Rule not checked"
-        ], []
-
-    # rule 3.4
-    # No missing terms in Glossary
-    ap("3.4 No missing terms in Glossary")
-    if "Glossary" in db_dict:
-        val["rule3_4"], all_gloss_terms, val["term_warnings"] = glossary_check(
-            db_dict, 3, all_gloss_terms
+    with tm.phase("Rule 3.1"):
+        val["rule3_1"], schema_extensions, val["fld_warnings"] = check_fields(
+            db_dict, 3, schema_extensions
         )
-    else:
-        val["rule3_4"], all_gloss_terms, val["term_warnings"] = (
-            ["Glossary cannot be found. Rule not checked"],
-            [],
-            [],
-        )
-
-    # rule 3.5
-    # No unnecessary terms in Glossary
-    ap("3.5 No unnecessary terms in Glossary")
-    if delete_extra:
-        ap("\tRemoving unused terms from Glossary")
-        del_extra(db_dict, "Glossary", "Term", all_gloss_terms)
-
-    if "Glossary" in db_dict:
-        val["rule3_5"] = rule3_5_and_7(db_dict, "glossary", all_gloss_terms)
-    else:
-        val["rule3_5"] = ["Glossary cannot be found. Rule not checked"]
-
-    # rule 3.6
-    # No missing sources in DataSources
-    ap("3.6 No missing sources in DataSources")
-    if "DataSources" in db_dict:
-        val["rule3_6"], all_sources = sources_check(db_dict, 3, all_sources)
-    else:
-        val["rule3_6"], all_sources = [
-            "DataSources cannot be found. Rule not checked"
-        ], []
-
-    # rule 3.7
-    # No unnecessary sources in DataSources
-    ap("3.7 No unnecessary sources in DataSources")
-
-    if delete_extra:
-        ap("\tRemoving unused sources from DataSources")
-        del_extra(db_dict, "DataSources", "DataSources_ID", all_sources)
-
-    if "DataSources" in db_dict:
-        val["rule3_7"] = rule3_5_and_7(db_dict, "datasources", all_sources)
-    else:
-        val["rule3_7"] = ["DataSources cannot be found. Rule not checked"]
-
-    # rule 3.8
-    # No map units without entries in DescriptionOfMapUnits
-    # rule 3.9
-    # No unnecessary map units in DescriptionOfMapUnits
-    ap("3.8 No map units without entries in DescriptionOfMapUnits")
-    ap("3.9 No unnecessary map units in DescriptionOfMapUnits")
-    if "DescriptionOfMapUnits" in db_dict:
-        (
-            val["rule3_8"],
-            val["rule3_9"],
-            all_map_units,
-            fds_map_units,
-            val["mu_warnings"],
-        ) = check_map_units(db_dict, 3, all_map_units, fds_map_units)
-    else:
-        error_list = ["DMU cannot be found. Rule not checked"]
-        val["rule3_8"] = error_list
-        val["rule3_9"] = error_list
-        all_map_units = []
-        fds_map_units = []
-        val["mu_warnings"] = []
-
-    # rule 3.10
-    # HierarchyKey values in DescriptionOfMapUnits are unique and well formed
-    ap("3.10 HierarchyKey values in DescriptionOfMapUnits are unique and well formed")
-    if "DescriptionOfMapUnits" in db_dict:
-        val["rule3_10"], val["hkey_warnings"] = rule3_10(db_dict)
-    else:
-        val["rule3_10"], val["hkey_warnings"] = [
-            "DMU cannot be found. Rule not checked"
-        ]
-    # 3.11
-    # All values of GeoMaterial are defined in GeoMaterialDict.
-    ap(
-        "3.11 All values of GeoMaterial are defined in GeoMaterialDict. GeoMaterialDict is as specified in the GeMS standard"
-    )
-    val["rule3_11"] = rule3_11(db_dict, ref_gmd)
-
-    # 3.12
-    # No duplicate _ID values
-    ap("3.12 No duplicate _ID values")
-    val["rule3_12"] = rule3_12(db_dict, str(gdb_path))
-
-    # 3.13
-    # No zero-length or whitespace-only strings
-    ap("3.13 No zero-length or whitespace-only strings")
-    val["rule3_13"], val["end_spaces"] = rule3_13(db_dict)
+    findings.write("rule3_1", val["rule3_1"])
+    findings.write("fld_warnings", val["fld_warnings"])
+
+    for i in range(2, 14):
+        val[f"rule3_{i}"] = results[f"rule3_{i}"]
+
+    for k in (
+        "missing_warnings",
+        "term_warnings",
+        "mu_warnings",
+        "hkey_warnings",
+        "end_spaces",
+    ):
+        val[k] = results[k]
+    all_map_units = results["all_map_units"]
+    fds_map_units = results["fds_map_units"]
 
     # check for editor tracking
     val["et_warnings"] = ["Editor tracking enabled on:"]
@@ -1919,25 +2725,27 @@ def main(argv):
         if "editorTrackingEnabled" in v:
             if v["editorTrackingEnabled"]:
                 html = f'<span class="table">{k}</span>'
-                val["et_warnings"].append(html)
+                val["et_warnings"].append(vr.Finding(html, table=k))
+    findings.write("et_warnings", val["et_warnings"])
 
     # METADATA
-    if arc_md:
-        ap("Exporting embedded ArcGIS metadata to FGDC")
-        # export the metadata from Arc
-        # this method only exports good metadata if it has been written in ArcCatalog at the
-        # gdb level or imported from an xml such as that produced at the end of Build Metadata.
-        src_md = arcpy.metadata.Metadata(str(gdb_path))
-        src_md.exportMetadata(str(metadata_file), "FGDC_CSDGM")
-
-    if metadata_file:
-        if Path(metadata_file).exists:
-            md_summary = validate_online(metadata_file, workdir)
+    with tm.phase("Metadata"):
+        if arc_md:
+            ap("Exporting embedded ArcGIS metadata to FGDC")
+            # export the metadata from Arc
+            # this method only exports good metadata if it has been written in ArcCatalog at the
+            # gdb level or imported from an xml such as that produced at the end of Build Metadata.
+            src_md = arcpy.metadata.Metadata(str(gdb_path))
+            src_md.exportMetadata(str(metadata_file), "FGDC_CSDGM")
+
+        if metadata_file:
+            if Path(metadata_file).exists:
+                md_summary = validate_metadata(metadata_file, workdir)
+            else:
+                md_summary = f"{metadata_file} does not exist."
         else:
-            md_summary = f"{metadata_file} does not exist."
-    else:
-        ap("Check Metadata option was skipped")
-        md_summary = "<b>Check Metadata</b> option was skipped. Be sure to have prepared valid metadata and check this option to produce a complete report."
+            ap("Check Metadata option was skipped")
+            md_summary = "<b>Check Metadata</b> option was skipped. Be sure to have prepared valid metadata and check this option to produce a complete report."
 
     # now that rules have been checked, prepare some summary entries
     val["metadata_summary"] = md_summary
@@ -1948,13 +2756,14 @@ def main(argv):
     # other stuff
     # find extensions to schema
     ap("\tLooking for extensions to GeMS schema")
-    val["extras"] = extra_tables(db_dict, schema_extensions)
+    with tm.phase("Extensions to GeMS schema"):
+        val["extras"] = extra_tables(db_dict, schema_extensions)
 
     # prepare lists of units for Occurrence table
     if "DescriptionOfMapUnits" in db_dict:
         ap("\tFinding occurrences of map units")
         all_map_units.sort()
-        val["all_units"] = list(set(all_map_units))
+        val["all_units"] = list(dict.fromkeys(all_map_units))
         fds_map_units = sort_fds_units(fds_map_units)
         val["fds_units"] = fds_map_units
     else:
@@ -1963,22 +2772,51 @@ def main(argv):
 
     # prepare contents of non-spatial tables
     ap("\tStoring contents of non-spatial tables")
-    val["non_spatial"] = dump_tables(db_dict)
+    with tm.phase("Contents of non-spatial tables"):
+        val["non_spatial"] = dump_tables(db_dict)
 
     # build inventory
     ap("\tBuilding database inventory")
-    val["inventory"] = inventory(db_dict)
+    with tm.phase("Database inventory"):
+        val["inventory"] = inventory(db_dict, row_counts(db_dict, gdb_path))
 
     ### Compact DB option
     if compact_db == "true":
         ap("\u200B")
         ap(f"Compacting {gdb_name}")
-        arcpy.Compact_management(gdb_path)
+        with tm.phase("Compact"):
+            arcpy.Compact_management(gdb_path)
     else:
         pass
 
-    write_html("report_template.jinja", val["report_path"])
-    write_html("errors_template.jinja", val["errors_path"])
+    # long lists of errors are cut short in the reports and written in full to
+    # separate pages
+    spill_findings(workdir / f"{gdb_name}-ValidationDetails")
+
+    # the errors report is written first so that the time it takes to render is
+    # in the Performance section of the validation report
+    with tm.phase("Render errors report"):
+        write_html("errors_template.jinja", val["errors_path"])
+    val["performance"] = tm.records
+    with tm.phase("Render validation report"):
+        write_html("report_template.jinja", val["report_path"])
+    tm.write_json(
+        workdir / f"{gdb_name}-ValidationTimes.json",
+        database=str(gdb_path),
+        version=version_string,
+        workers=workers,
+    )
+
+    # machine-readable summary to go with the findings
+    findings.close()
+    vr.write_summary(
+        workdir / f"{gdb_name}-Validation.json",
+        val,
+        findings,
+        compliance_level(val),
+        report=val["report_name"],
+        errors_report=val["errors_name"],
+    )
 
     if open_report:
         os.startfile(val["report_path"])
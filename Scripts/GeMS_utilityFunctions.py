@@ -1,7 +1,6 @@
 # utility functions for scripts that work with GeMS geodatabase schema
 
-import arcpy, os.path, time, glob
-import GeMS_Definition as gdef
+import arcpy, os.path, sys, time, glob, multiprocessing
 
 
 editPrefixes = ("xxx", "edit_", "errors_", "ed_")
@@ -44,9 +43,25 @@ def is_bad_null(x):
         return False
 
 
+def duplicate_index(vals, ids=None):
+    """Returns a dictionary {value: [id, id...]} of every value found more than
+    once in vals. ids is an optional list, parallel to vals, of the OBJECTIDs or
+    _ID values that identify each value; list positions are used if it is not
+    supplied. None values are ignored. Works in one pass over the values
+    instead of counting every value against the whole list."""
+    if ids is None:
+        ids = range(len(vals))
+    index = {}
+    for v, i in zip(vals, ids):
+        if not v is None:
+            index.setdefault(v, []).append(i)
+
+    return {k: v for k, v in index.items() if len(v) > 1}
+
+
 def get_duplicates(table_path, field):
-    vals = [r[0] for r in arcpy.da.SearchCursor(table_path, field) if not r[0] is None]
-    dups = list(set([n for n in vals if vals.count(n) > 1]))
+    vals = [r[0] for r in arcpy.da.SearchCursor(table_path, field)]
+    dups = list(duplicate_index(vals))
     dups.sort()
 
     return dups
@@ -90,6 +105,13 @@ def forceExit():
     raise arcpy.ExecuteError
 
 
+def set_pool_executable():
+    # script tools run inside ArcGISPro.exe; worker processes have to be
+    # started with the python executable of the Pro python environment
+    if not os.path.basename(sys.executable).lower().startswith("python"):
+        multiprocessing.set_executable(os.path.join(sys.exec_prefix, "pythonw.exe"))
+
+
 def numberOfRows(aTable):
     return int(str(arcpy.GetCount_management(aTable)))
 
@@ -298,6 +320,8 @@ def gdb_object_dict(gdb_path):
     Works on geodatabases and geopackages!
     da.Describe is pretty fast (faster for gpkg, why?) and verbose
     """
+    import catalog
+
     desc = arcpy.da.Describe(gdb_path)
     if desc["children"]:
         children = {child["name"]: child for child in desc["children"]}
@@ -342,40 +366,8 @@ def gdb_object_dict(gdb_path):
 
         # for objects that are based on a GeMS object but have a
         # prefix or suffix, record the name of the required GeMS object
-        # on which they are based
-        # initialize gems_equivalent key to nothing
-        v["gems_equivalent"] = ""
-        tableDict_keys = list(gdef.tableDict.keys())
-        tableDict_keys.append("GeoMaterialDict")
-        if not any(el in v["concat_type"] for el in ("Topology", "Annotation")):
-            for a in tableDict_keys:
-                # if the CamelCase or snake_case version of a gems object
-                # is found in the table name
-                if (
-                    any(n in k.lower() for n in (a.lower(), camel_to_snake(a)))
-                    and gdef.shape_dict[a] in v["concat_type"].lower()
-                    # and not "cmu" in a.lower()
-                ):
-                    # set the gems_equivalent key to the GeMS CamelCase name
-                    v["gems_equivalent"] = a
-
-            # caveats
-            if k.lower().endswith("points") and v["gems_equivalent"] == "":
-                v["gems_equivalent"] = "GenericPoints"
-
-            if k.lower().endswith("samples") and v["gems_equivalent"] == "":
-                v["gems_equivalent"] = "GenericSamples"
-
-            if (
-                any(k.lower().endswith(n) for n in ("geologicmap", "geologic_map"))
-            ) and v["concat_type"] == "Feature Dataset":
-                v["gems_equivalent"] = "GeologicMap"
-
-            if any(k.lower().endswith(l) for l in ("label", "labels")):
-                v["gems_equivalent"] = ""
-
-            if "mapunitoverlaypolys" in k.lower():
-                v["gems_equivalent"] = "MapUnitOverlayPolys"
+        # on which they are based, see catalog.gems_equivalent
+        v["gems_equivalent"] = catalog.gems_equivalent(k, v["concat_type"])
 
     return new_dict
 
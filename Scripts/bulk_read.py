@@ -0,0 +1,151 @@
+"""Whole-table reads of file geodatabases and geopackages, a column at a time.
+
+read_columns() reads the fields of a table or feature class in one call and
+returns {field: numpy array}, in the order of the rows in the table. Only the
+requested fields are read and the where clause is applied by the reader.
+
+Tables are read through the Arrow stream of a GDAL layer (GDAL 3.6 or later),
+which fills the arrays in C, batch by batch. Values are the values a SearchCursor
+returns: strings, numbers, datetimes, and None for nulls. When GDAL is not
+available, or a field can only be read by arcpy (SHAPE@ tokens, for example),
+the table is read with one arcpy SearchCursor and the rows are turned into
+columns with zip().
+
+    columns = bulk_read.read_columns(catalog_path, ["OBJECTID", "MapUnit"])
+"""
+
+from pathlib import Path
+import numpy as np
+
+try:
+    from osgeo import ogr
+
+    use_gdal = hasattr(ogr.Layer, "GetArrowStreamAsNumPy")
+except ImportError:
+    use_gdal = False
+
+db_suffixes = (".gdb", ".gpkg")
+
+
+def split_path(table_path):
+    """(database path, layer name) of the catalog path of a table or feature
+    class, or (None, None) if the path is not inside a .gdb or .gpkg"""
+    p = Path(table_path)
+    for i, part in enumerate(p.parts):
+        if Path(part).suffix.lower() in db_suffixes and i < len(p.parts) - 1:
+            name = p.name
+            # arcpy names geopackage tables main.<table>
+            if name.lower().startswith("main."):
+                name = name[5:]
+            return Path(*p.parts[: i + 1]), name
+    return None, None
+
+
+def object_array(values):
+    """1-d object array of values, even if the values are tuples"""
+    a = np.empty(len(values), dtype=object)
+    a[:] = values
+    return a
+
+
+def as_values(a):
+    """Array from the Arrow stream as an array of cursor values"""
+    if isinstance(a, np.ma.MaskedArray):
+        mask = np.ma.getmaskarray(a)
+        if mask.any():
+            a = object_array(a.data.tolist())
+            a[mask] = None
+        else:
+            a = a.data
+    if a.dtype.kind == "S":
+        a = object_array([v.decode("utf-8") for v in a.tolist()])
+    elif a.dtype == object:
+        # any value may be bytes, however many nulls come before it
+        values = a.tolist()
+        if any(isinstance(v, bytes) for v in values):
+            a = object_array(
+                [v.decode("utf-8") if isinstance(v, bytes) else v for v in values]
+            )
+    if a.dtype.kind == "M":
+        a = object_array(a.tolist())
+    return a
+
+
+def ogr_columns(table_path, fields, where=None):
+    """{field: array} read from the Arrow stream of the GDAL layer. Raises
+    KeyError if a field is not an attribute of the layer"""
+    db_path, name = split_path(table_path)
+    if db_path is None:
+        raise KeyError(table_path)
+
+    # GDAL is left in whatever exception mode the calling tool uses
+    ds = ogr.Open(str(db_path), 0)
+    if ds is None:
+        raise KeyError(table_path)
+    layer = ds.GetLayerByName(name)
+    if layer is None:
+        raise KeyError(name)
+
+    defn = layer.GetLayerDefn()
+    names = [defn.GetFieldDefn(i).GetName() for i in range(defn.GetFieldCount())]
+    by_lower = {n.lower(): n for n in names}
+    fid = layer.GetFIDColumn() or "OGC_FID"
+
+    # requested field: name of the column in the stream
+    stream_names = {}
+    for f in fields:
+        if f.lower() == fid.lower():
+            stream_names[f] = fid
+        elif f.lower() in by_lower:
+            stream_names[f] = by_lower[f.lower()]
+        else:
+            raise KeyError(f)
+
+    wanted = set(stream_names.values())
+    layer.SetIgnoredFields([n for n in names if not n in wanted] + ["OGR_GEOMETRY"])
+    if where and layer.SetAttributeFilter(where) != 0:
+        raise KeyError(where)
+    options = [
+        f"INCLUDE_FID={'YES' if fid in wanted else 'NO'}",
+        "USE_MASKED_ARRAYS=YES",
+    ]
+
+    batches = {n: [] for n in wanted}
+    for batch in layer.GetArrowStreamAsNumPy(options=options):
+        for n in wanted:
+            batches[n].append(batch[n])
+
+    columns = {}
+    for f, n in stream_names.items():
+        parts = batches[n]
+        if not parts:
+            columns[f] = np.empty(0, dtype=object)
+        elif any(isinstance(p, np.ma.MaskedArray) for p in parts):
+            columns[f] = as_values(np.ma.concatenate(parts))
+        else:
+            columns[f] = as_values(np.concatenate(parts))
+
+    return columns
+
+
+def cursor_columns(table_path, fields, where=None):
+    """{field: array} read with one arcpy SearchCursor"""
+    import arcpy
+
+    with arcpy.da.SearchCursor(table_path, fields, where_clause=where) as cursor:
+        rows = list(cursor)
+    columns = list(zip(*rows)) or [() for f in fields]
+
+    return {f: object_array(c) for f, c in zip(fields, columns)}
+
+
+def read_columns(table_path, fields, where=None):
+    """{field: array} of the values of fields in a table, in row order"""
+    fields = list(fields)
+    if use_gdal and not any("@" in f for f in fields):
+        try:
+            return ogr_columns(table_path, fields, where)
+        except Exception:
+            pass
+
+    return cursor_columns(table_path, fields, where)
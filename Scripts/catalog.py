@@ -0,0 +1,504 @@
+"""Catalog of the tables, feature classes, and feature datasets in a file
+geodatabase or geopackage, read without arcpy.
+
+File geodatabases are read through the GDAL OpenFileGDB driver, from the GDB_Items
+system table and the layer definitions. Geopackages are read with the sqlite3
+module from gpkg_contents, gpkg_geometry_columns, and the table definitions.
+
+object_dict() returns a dictionary with the same keys that
+GeMS_utilityFunctions.gdb_object_dict builds from arcpy.da.Describe and keeps it
+on disk until any file of the database changes, so that opening the same
+database again costs one directory listing. Fields are namespaces with name,
+type, domain, length, isNullable, and editable attributes. The spatial reference
+of an object, and anything else only arcpy can supply, is looked up with arcpy
+when it is asked for.
+
+gems_equivalent() names the GeMS element on which a table is based, following the
+rules of gdb_object_dict with one precompiled regular expression.
+"""
+
+import hashlib
+import pickle
+import re
+import sqlite3
+import tempfile
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+from pathlib import Path
+from types import SimpleNamespace
+import GeMS_Definition as gdef
+
+try:
+    from osgeo import ogr
+
+    use_gdal = True
+except ImportError:
+    use_gdal = False
+
+# field types, by declared SQLite type, named as arcpy names them
+sqlite_types = {
+    "TEXT": "String",
+    "INTEGER": "Integer",
+    "INT": "Integer",
+    "MEDIUMINT": "Integer",
+    "SMALLINT": "SmallInteger",
+    "TINYINT": "SmallInteger",
+    "BOOLEAN": "SmallInteger",
+    "REAL": "Double",
+    "DOUBLE": "Double",
+    "FLOAT": "Single",
+    "DATE": "Date",
+    "DATETIME": "Date",
+    "BLOB": "Blob",
+}
+
+# shape types, by geopackage geometry type name, named as arcpy names them
+sqlite_shapes = {
+    "POINT": "Point",
+    "MULTIPOINT": "Multipoint",
+    "LINESTRING": "Polyline",
+    "MULTILINESTRING": "Polyline",
+    "POLYGON": "Polygon",
+    "MULTIPOLYGON": "Polygon",
+}
+
+# field types, by OGR field type, named as arcpy names them
+if use_gdal:
+    ogr_types = {
+        ogr.OFTString: "String",
+        ogr.OFTInteger: "Integer",
+        ogr.OFTInteger64: "BigInteger",
+        ogr.OFTReal: "Double",
+        ogr.OFTDate: "Date",
+        ogr.OFTDateTime: "Date",
+        ogr.OFTBinary: "Blob",
+    }
+
+    # shape types, by flattened OGR geometry type
+    ogr_shapes = {
+        ogr.wkbPoint: "Point",
+        ogr.wkbMultiPoint: "Multipoint",
+        ogr.wkbLineString: "Polyline",
+        ogr.wkbMultiLineString: "Polyline",
+        ogr.wkbPolygon: "Polygon",
+        ogr.wkbMultiPolygon: "Polygon",
+    }
+
+# dataType, as arcpy.da.Describe names it, of the item types in GDB_Items
+item_types = {
+    "{74737149-DCB5-4257-8904-B9724E32A530}": "FeatureDataset",
+    "{70737809-852C-4A03-9E22-2CECEA5B9BFA}": "FeatureClass",
+    "{CD06BC3B-789D-4C51-AAFA-A467912B8965}": "Table",
+    "{B606A7E1-FA5B-439C-849C-6E9C2481537B}": "RelationshipClass",
+    "{767152D3-ED66-4325-8774-420D46674E07}": "Topology",
+    "{5ED667A3-9CA9-44A2-8029-D95BF23704B9}": "RasterDataset",
+}
+
+# featureType and shapeType from the Definition xml of a feature class
+feature_types = {
+    "esriFTSimple": "Simple",
+    "esriFTAnnotation": "Annotation",
+    "esriFTDimension": "Dimension",
+}
+shape_types = {
+    "esriGeometryPoint": "Point",
+    "esriGeometryMultipoint": "Multipoint",
+    "esriGeometryPolyline": "Polyline",
+    "esriGeometryPolygon": "Polygon",
+    "esriGeometryMultiPatch": "MultiPatch",
+}
+
+# fields maintained by the geodatabase
+read_only_fields = ("shape_length", "shape_area", "shape.stlength()", "shape.starea()")
+
+# change when the contents of the catalog change so that old pickles are not used
+catalog_version = 1
+
+
+def camel_to_snake(s):
+    if "CMU" in s:
+        s = s[3:]
+        return f"cmu_{''.join(['_'+c.lower() if c.isupper() else c for c in s]).lstrip('_')}"
+    else:
+        return "".join(["_" + c.lower() if c.isupper() else c for c in s]).lstrip("_")
+
+
+def camel_to_space(s):
+    return "".join([" " + c.upper() if c.isupper() else c for c in s]).lstrip(" ")
+
+
+# GeMS element names in the order gdb_object_dict tries them; when more than one
+# is found in a table name, the last one wins
+gems_names = list(gdef.tableDict.keys()) + ["GeoMaterialDict"]
+
+# {lower case or snake_case name: [index in gems_names]}
+name_patterns = {}
+for i, a in enumerate(gems_names):
+    for p in dict.fromkeys((a.lower(), camel_to_snake(a))):
+        name_patterns.setdefault(p, []).append(i)
+
+# at each position in a table name, the longest pattern that starts there. every
+# shorter pattern that starts at the same position is a prefix of that one
+gems_pattern = re.compile(
+    "(?=("
+    + "|".join(re.escape(p) for p in sorted(name_patterns, key=len, reverse=True))
+    + "))"
+)
+pattern_prefixes = {
+    p: [n for n in name_patterns if p.startswith(n)] for p in name_patterns
+}
+
+
+@lru_cache(maxsize=None)
+def gems_equivalent(name, concat_type):
+    """Name of the GeMS element a table is based on, following the same rules as
+    gdb_object_dict in GeMS_utilityFunctions"""
+    if any(el in concat_type for el in ("Topology", "Annotation")):
+        return ""
+
+    lower = name.lower()
+    found = set()
+    for m in gems_pattern.finditer(lower):
+        for p in pattern_prefixes[m.group(1)]:
+            found.update(name_patterns[p])
+    shape = [i for i in found if gdef.shape_dict[gems_names[i]] in concat_type.lower()]
+    gems_eq = gems_names[max(shape)] if shape else ""
+
+    # caveats
+    if lower.endswith("points") and gems_eq == "":
+        gems_eq = "GenericPoints"
+    if lower.endswith("samples") and gems_eq == "":
+        gems_eq = "GenericSamples"
+    if (
+        any(lower.endswith(n) for n in ("geologicmap", "geologic_map"))
+        and concat_type == "Feature Dataset"
+    ):
+        gems_eq = "GeologicMap"
+    if any(lower.endswith(l) for l in ("label", "labels")):
+        gems_eq = ""
+    if "mapunitoverlaypolys" in lower:
+        gems_eq = "MapUnitOverlayPolys"
+
+    return gems_eq
+
+
+class CatalogEntry(dict):
+    """Dictionary of one object. Keys that only arcpy can supply, such as
+    spatialReference or bandCount, are looked up with arcpy.da.Describe of the
+    object the first time one of them is asked for"""
+
+    described = False
+
+    def __missing__(self, key):
+        if not self.described and "catalogPath" in self:
+            import arcpy
+
+            self.described = True
+            for k, v in arcpy.da.Describe(self["catalogPath"]).items():
+                self.setdefault(k, v)
+            if key in self:
+                return self[key]
+        raise KeyError(key)
+
+
+def field(name, f_type, domain="", length=0, nullable=True):
+    return SimpleNamespace(
+        name=name,
+        type=f_type,
+        domain=domain or "",
+        length=length,
+        isNullable=nullable,
+        editable=not f_type in ("OID", "Geometry", "GlobalID")
+        and not name.lower() in read_only_fields,
+    )
+
+
+def finish(d, name, data_type, concat_type, catalog_path, fd=""):
+    d.update(
+        name=name,
+        dataType=data_type,
+        concat_type=concat_type,
+        catalogPath=catalog_path,
+        feature_dataset=fd,
+    )
+    if data_type == "FeatureDataset":
+        d["children"] = []
+    d["gems_equivalent"] = gems_equivalent(name, concat_type)
+    return d
+
+
+def xml_text(root, tag):
+    """Text of a child element of the Definition xml, whatever its namespace"""
+    for el in root:
+        if el.tag.rsplit("}", 1)[-1] == tag:
+            return el.text
+    return None
+
+
+def layer_fields(layer):
+    """Fields of an OGR layer, with the OBJECTID and Shape fields that arcpy lists"""
+    fields = [field(layer.GetFIDColumn() or "OBJECTID", "OID", nullable=False)]
+    if layer.GetGeomType() != ogr.wkbNone:
+        fields.append(field(layer.GetGeometryColumn() or "Shape", "Geometry"))
+    defn = layer.GetLayerDefn()
+    for j in range(defn.GetFieldCount()):
+        f = defn.GetFieldDefn(j)
+        f_type = ogr_types.get(f.GetType(), "String")
+        if f.GetSubType() == ogr.OFSTInt16:
+            f_type = "SmallInteger"
+        elif f.GetSubType() == ogr.OFSTFloat32:
+            f_type = "Single"
+        elif f.GetSubType() == ogr.OFSTUUID:
+            f_type = "GUID"
+        fields.append(
+            field(
+                f.GetName(),
+                f_type,
+                f.GetDomainName(),
+                f.GetWidth(),
+                bool(f.IsNullable()),
+            )
+        )
+
+    return fields
+
+
+def gdb_object_dict(db_path):
+    """Catalog of a file geodatabase from GDB_Items"""
+    # GDAL is left in whatever exception mode the calling tool uses, so failures
+    # are found from the values returned
+    ds = ogr.GetDriverByName("OpenFileGDB").Open(str(db_path))
+    if ds is None:
+        raise ValueError(f"{db_path} could not be opened with OpenFileGDB")
+    items = []
+    l = ds.ExecuteSQL("SELECT Type, Name, Path, Definition FROM GDB_Items")
+    if not l is None:
+        items = [tuple(feat.GetField(i) for i in range(4)) for feat in l]
+        ds.ReleaseResultSet(l)
+
+    db_dict = {}
+    for uuid, name, path, definition in items:
+        data_type = item_types.get((uuid or "").upper())
+        if not data_type or not name:
+            continue
+        # \GeologicMap\MapUnitPolys
+        parts = (path or "").strip("\\").split("\\")
+        fd = parts[-2] if len(parts) > 1 else ""
+        catalog_path = str(Path(db_path, *parts))
+
+        d = CatalogEntry()
+        root = ET.fromstring(definition) if definition else []
+        if data_type == "FeatureClass":
+            d["featureType"] = feature_types.get(xml_text(root, "FeatureType"), "Simple")
+            d["shapeType"] = shape_types.get(xml_text(root, "ShapeType"), "")
+            concat_type = f"{d['featureType']} {d['shapeType']} Feature Class"
+        elif data_type == "Table":
+            concat_type = "Nonspatial Table"
+        else:
+            concat_type = camel_to_space(data_type)
+
+        if data_type in ("FeatureClass", "Table"):
+            d["editorTrackingEnabled"] = xml_text(root, "EditorTrackingEnabled") == "true"
+            # otherwise the fields are read by arcpy, see CatalogEntry
+            layer = ds.GetLayerByName(name)
+            if not layer is None:
+                try:
+                    d["fields"] = layer_fields(layer)
+                except Exception:
+                    pass
+
+        db_dict[name] = finish(d, name, data_type, concat_type, catalog_path, fd)
+
+    # children of feature datasets, as arcpy.da.Describe lists them
+    for v in db_dict.values():
+        if v["feature_dataset"] in db_dict:
+            db_dict[v["feature_dataset"]]["children"].append(v)
+
+    return db_dict
+
+
+def gpkg_object_dict(db_path):
+    """Catalog of a geopackage from gpkg_contents"""
+    uri = Path(db_path).resolve().as_uri() + "?mode=ro"
+    conn = sqlite3.connect(uri, uri=True)
+    try:
+        shapes = {
+            r[0]: (r[1], r[2])
+            for r in conn.execute(
+                "SELECT table_name, column_name, geometry_type_name FROM gpkg_geometry_columns"
+            )
+        }
+        db_dict = {}
+        for name, data_type in conn.execute(
+            "SELECT table_name, data_type FROM gpkg_contents ORDER BY table_name"
+        ):
+            d = CatalogEntry()
+            if data_type == "features" and name in shapes:
+                d["featureType"] = "Simple"
+                d["shapeType"] = sqlite_shapes.get(shapes[name][1].upper(), "")
+                data_type = "FeatureClass"
+                concat_type = f"Simple {d['shapeType']} Feature Class"
+            elif data_type == "attributes":
+                data_type = "Table"
+                concat_type = "Nonspatial Table"
+            else:
+                continue
+
+            fields = []
+            quoted = '"' + name.replace('"', '""') + '"'
+            for cid, f_name, decl, notnull, default, pk in conn.execute(
+                f"PRAGMA table_info({quoted})"
+            ):
+                if pk:
+                    f_type = "OID"
+                elif name in shapes and f_name == shapes[name][0]:
+                    f_type = "Geometry"
+                else:
+                    f_type = sqlite_types.get(re.split(r"\W", decl.upper())[0], "String")
+                m = re.search(r"\((\d+)\)", decl)
+                fields.append(
+                    field(f_name, f_type, "", int(m.group(1)) if m else 0, not notnull)
+                )
+            d["fields"] = fields
+
+            # arcpy names geopackage tables main.<table>
+            catalog_path = str(Path(db_path) / f"main.{name}")
+            db_dict[name] = finish(d, name, data_type, concat_type, catalog_path)
+    finally:
+        conn.close()
+
+    return db_dict
+
+
+def workspace_key(db_path):
+    """Hash of the names, sizes, and modification times of the files of a
+    database. Lock files are left out, they come and go while it is being read"""
+    db_path = Path(db_path)
+    files = [db_path] if db_path.is_file() else list(db_path.iterdir())
+    if db_path.is_file():
+        files.extend(
+            [db_path.with_name(f"{db_path.name}-{s}") for s in ("wal", "journal")]
+        )
+    stats = []
+    for f in sorted(files):
+        if f.suffix.lower() == ".lock" or not f.is_file():
+            continue
+        stat = f.stat()
+        stats.append((f.name, stat.st_size, stat.st_mtime_ns))
+
+    return hashlib.sha1(repr(stats).encode("utf-8")).hexdigest()
+
+
+def memo_path(db_path, memo_dir=None):
+    """Pickle in which the catalog of a database is kept"""
+    db_path = Path(db_path).resolve()
+    if memo_dir is None:
+        memo_dir = Path(tempfile.gettempdir()) / "gems_catalog"
+        name = hashlib.sha1(str(db_path).lower().encode("utf-8")).hexdigest()[:16]
+    else:
+        name = db_path.name
+    return Path(memo_dir) / f"{name}-Catalog.pickle"
+
+
+def object_dict(db_path, memo_dir=None):
+    """Catalog of a file geodatabase or geopackage, from the pickle in memo_dir
+    (a folder in the temp folder by default) if the database has not changed
+    since it was written"""
+    db_path = Path(db_path)
+    key = workspace_key(db_path)
+    memo = memo_path(db_path, memo_dir)
+    try:
+        with open(memo, "rb") as f:
+            cached = pickle.load(f)
+        if (
+            cached["version"] == catalog_version
+            and cached["path"] == str(db_path.resolve())
+            and cached["key"] == key
+        ):
+            return cached["catalog"]
+    except Exception:
+        pass
+
+    if db_path.suffix.lower() == ".gpkg":
+        db_dict = gpkg_object_dict(db_path)
+    elif use_gdal:
+        db_dict = gdb_object_dict(db_path)
+    else:
+        raise ValueError("GDAL is required to read the catalog of a file geodatabase")
+
+    try:
+        memo.parent.mkdir(parents=True, exist_ok=True)
+        tmp = memo.with_name(f"{memo.name}.tmp")
+        with open(tmp, "wb") as f:
+            pickle.dump(
+                {
+                    "version": catalog_version,
+                    "path": str(db_path.resolve()),
+                    "key": key,
+                    "catalog": db_dict,
+                },
+                f,
+            )
+        tmp.replace(memo)
+    except OSError:
+        pass
+
+    return db_dict
+
+
+def gpkg_count(db_path, name):
+    uri = Path(db_path).resolve().as_uri() + "?mode=ro"
+    conn = sqlite3.connect(uri, uri=True)
+    try:
+        quoted = '"' + name.replace('"', '""') + '"'
+        return conn.execute(f"SELECT COUNT(*) FROM {quoted}").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def row_counts(db_path, names, workers=4):
+    """{name: number of rows} of the tables and feature classes in names, read in
+    one pass. Geopackage counts come from gpkg_ogr_contents, and tables it does not
+    list are counted with SELECT COUNT(*) in a thread pool. File geodatabase counts
+    come from OGR, which reads them from the header of each table. Tables that
+    cannot be counted are left out"""
+    db_path = Path(db_path)
+    names = list(names)
+    counts = {}
+    if db_path.suffix.lower() == ".gpkg":
+        uri = db_path.resolve().as_uri() + "?mode=ro"
+        conn = sqlite3.connect(uri, uri=True)
+        try:
+            counts = {
+                r[0]: r[1]
+                for r in conn.execute(
+                    "SELECT table_name, feature_count FROM gpkg_ogr_contents"
+                )
+                if r[0] in names and r[1] is not None
+            }
+        except sqlite3.Error:
+            pass
+        finally:
+            conn.close()
+
+        rest = [n for n in names if not n in counts]
+        if rest:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                futures = {pool.submit(gpkg_count, db_path, n): n for n in rest}
+                for future in as_completed(futures):
+                    try:
+                        counts[futures[future]] = future.result()
+                    except sqlite3.Error:
+                        pass
+
+    elif use_gdal:
+        ds = ogr.GetDriverByName("OpenFileGDB").Open(str(db_path))
+        if ds is None:
+            return counts
+        for name in names:
+            layer = ds.GetLayerByName(name)
+            if not layer is None:
+                counts[name] = layer.GetFeatureCount()
+
+    return counts
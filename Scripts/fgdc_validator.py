@@ -0,0 +1,321 @@
+"""Local validation of FGDC CSDGM metadata, without mp.exe or the USGS metadata
+validation web service.
+
+Two kinds of checks are made:
+    the FGDC XML Schema, fgdc-std-001-1998.xsd, when it can be found. It is
+      downloaded once, with the files it includes, to Resources/fgdc_schema and
+      compiled once per process. Without it, only the rules below are checked.
+    rules like those checked by mp that a schema cannot express: required
+      elements, empty elements, the formats of dates and times, bounding
+      coordinates, enumerated values, and ranges.
+
+Schema errors about an element that a rule has already reported, a missing
+required element or a bad value, are dropped so that each problem is counted
+once, as in the mp report.
+
+Errors and warnings are written in the style of the mp error report, one per line,
+"Error (line 12): ...", followed by a summary line, for example "No errors" or
+"3 errors, 1 warning".
+
+Usage:
+    python fgdc_validator.py <path to metadata xml> [<path to errors txt>]
+"""
+
+import re
+import sys
+from datetime import date
+from functools import lru_cache
+from pathlib import Path
+from urllib.parse import urljoin
+from lxml import etree
+
+schema_url = "https://www.fgdc.gov/schemas/metadata/fgdc-std-001-1998.xsd"
+schema_dir = Path(__file__).parent.parent / "Resources" / "fgdc_schema"
+
+# element: children that must be present, as mp reports them
+required = {
+    "metadata": ["idinfo", "metainfo"],
+    "idinfo": ["citation", "descript", "timeperd", "status", "keywords", "accconst", "useconst"],
+    "citeinfo": ["origin", "pubdate", "title"],
+    "descript": ["abstract", "purpose"],
+    "timeperd": ["timeinfo", "current"],
+    "status": ["progress", "update"],
+    "spdom": ["bounding"],
+    "bounding": ["westbc", "eastbc", "northbc", "southbc"],
+    "keywords": ["theme"],
+    "theme": ["themekt", "themekey"],
+    "place": ["placekt", "placekey"],
+    "dataqual": ["logic", "complete", "lineage"],
+    "lineage": ["procstep"],
+    "procstep": ["procdesc", "procdate"],
+    "srcinfo": ["srccite", "typesrc", "srctime", "srccitea", "srccontr"],
+    "distinfo": ["distrib", "distliab"],
+    "metainfo": ["metd", "metc", "metstdn", "metstdv"],
+    "cntinfo": ["cntaddr", "cntvoice"],
+    "cntaddr": ["addrtype", "city", "state", "postal"],
+    "cntperp": ["cntper"],
+    "cntorgp": ["cntorg"],
+    "sngdate": ["caldate"],
+    "rngdates": ["begdate", "enddate"],
+    "detailed": ["enttyp"],
+    "enttyp": ["enttypl", "enttypd", "enttypds"],
+    "attr": ["attrlabl", "attrdef", "attrdefs", "attrdomv"],
+    "edom": ["edomv", "edomvd", "edomvds"],
+    "rdom": ["rdommin", "rdommax"],
+    "codesetd": ["codesetn", "codesets"],
+}
+
+# dates, YYYY, YYYYMM, or YYYYMMDD, and the words allowed instead
+date_words = {
+    "pubdate": ("Unknown", "Unpublished material"),
+    "caldate": ("Unknown",),
+    "begdate": ("Unknown",),
+    "enddate": ("Unknown", "Present"),
+    "procdate": ("Unknown", "Not complete"),
+    "metd": (),
+    "metrd": (),
+    "metfrd": (),
+}
+date_pattern = re.compile(r"^(\d{4})(\d{2})?(\d{2})?$")
+
+time_elements = ("time", "begtime", "endtime", "proctime")
+time_pattern = re.compile(r"^\d{2}(\d{2}(\d{2}(\d+)?)?)?(Z|[+-]\d{4})?$")
+
+enumerated = {
+    "progress": ("Complete", "In work", "Planned"),
+    "direct": ("Point", "Vector", "Raster"),
+}
+
+# bounding coordinate: (lowest, highest)
+coordinate_ranges = {
+    "westbc": (-180, 180),
+    "eastbc": (-180, 180),
+    "northbc": (-90, 90),
+    "southbc": (-90, 90),
+}
+
+# elements named by a schema error, eg, Expected is one of ( srccite, typesrc ).
+expected_pattern = re.compile(r"Expected is(?: one of)? \( ([^)]*) \)")
+
+
+@lru_cache(maxsize=None)
+def load_schema(xsd_path, mtime=None):
+    """Compiled XMLSchema. mtime is only part of the cache key so that a schema
+    that changes on disk is compiled again"""
+    return etree.XMLSchema(etree.parse(str(xsd_path)))
+
+
+def fetch_schema(url=schema_url, folder=schema_dir):
+    """Download a schema, and every schema it includes or imports by a relative
+    path, to folder. Returns the path of the main schema"""
+    import requests
+
+    folder.mkdir(parents=True, exist_ok=True)
+    todo = [url]
+    seen = set()
+    while todo:
+        u = todo.pop()
+        if u in seen:
+            continue
+        seen.add(u)
+        r = requests.get(u, timeout=30)
+        r.raise_for_status()
+        name = u.rsplit("/", 1)[-1]
+        (folder / name).write_bytes(r.content)
+        doc = etree.fromstring(r.content)
+        for el in doc.iter("{http://www.w3.org/2001/XMLSchema}*"):
+            loc = el.get("schemaLocation")
+            if loc and not "://" in loc and not "/" in loc:
+                todo.append(urljoin(u, loc))
+
+    return folder / url.rsplit("/", 1)[-1]
+
+
+def get_schema(download=True):
+    """The compiled FGDC schema, or None if it is not on disk and cannot be
+    downloaded"""
+    xsd = schema_dir / schema_url.rsplit("/", 1)[-1]
+    try:
+        if not xsd.exists():
+            if not download:
+                return None
+            xsd = fetch_schema()
+        return load_schema(xsd, xsd.stat().st_mtime_ns)
+    except Exception:
+        return None
+
+
+def local_name(el):
+    return etree.QName(el).localname
+
+
+def rule_messages(root):
+    """(level, line, message, (path, missing element)) for every rule that is
+    broken. path is the XPath of the element; missing element is None unless
+    the message is about a required child element"""
+    tree = root.getroottree()
+    msgs = []
+    for el in root.iter():
+        if not isinstance(el.tag, str):
+            continue
+        tag = local_name(el)
+        line = el.sourceline
+        path = tree.getpath(el)
+        # messages about the value of the element
+        key = (path, None)
+        text = (el.text or "").strip()
+        children = [local_name(c) for c in el if isinstance(c.tag, str)]
+
+        for req in required.get(tag, []):
+            if not req in children:
+                msgs.append(
+                    ("Error", line, f"{tag} lacks required element {req}", (path, req))
+                )
+
+        if not children and not text:
+            msgs.append(("Error", line, f"{tag} is empty", key))
+            continue
+
+        if tag in date_words and text and not text in date_words[tag]:
+            m = date_pattern.match(text)
+            valid = bool(m)
+            if m:
+                try:
+                    date(int(m.group(1)), int(m.group(2) or 1), int(m.group(3) or 1))
+                except ValueError:
+                    valid = False
+            if not valid:
+                msgs.append(("Error", line, f"improper value for {tag}: {text}", key))
+
+        if tag in time_elements and text and not text == "Unknown":
+            if not time_pattern.match(text):
+                msgs.append(("Error", line, f"improper value for {tag}: {text}", key))
+
+        if enumerated.get(tag) and not text in enumerated[tag]:
+            allowed = ", ".join(enumerated[tag])
+            msgs.append(
+                (
+                    "Error",
+                    line,
+                    f"improper value for {tag}: {text}, must be one of {allowed}",
+                    key,
+                )
+            )
+
+        if tag in coordinate_ranges:
+            low, high = coordinate_ranges[tag]
+            try:
+                value = float(text)
+                if not low <= value <= high:
+                    msgs.append(
+                        (
+                            "Error",
+                            line,
+                            f"{tag} {text} is not between {low} and {high}",
+                            key,
+                        )
+                    )
+            except ValueError:
+                msgs.append(("Error", line, f"improper value for {tag}: {text}", key))
+
+        if tag == "bounding":
+            values = {c: el.findtext(c) for c in ("northbc", "southbc")}
+            try:
+                if float(values["southbc"]) > float(values["northbc"]):
+                    msgs.append(("Error", line, "southbc is greater than northbc", key))
+            except (TypeError, ValueError):
+                pass
+
+        if tag == "rngdates":
+            beg = el.findtext("begdate") or ""
+            end = el.findtext("enddate") or ""
+            if date_pattern.match(beg) and date_pattern.match(end):
+                if beg.ljust(8, "0") > end.ljust(8, "9"):
+                    msgs.append(("Error", line, "begdate is later than enddate", key))
+
+        if tag == "rdom":
+            try:
+                if float(el.findtext("rdommin")) > float(el.findtext("rdommax")):
+                    msgs.append(
+                        ("Warning", line, "rdommin is greater than rdommax", key)
+                    )
+            except (TypeError, ValueError):
+                pass
+
+    return msgs
+
+
+def reported(entry, covered):
+    """True if a schema error is about something a rule has already reported.
+    covered holds the (path, missing element) of the rule messages"""
+    if "Missing child element(s)" in entry.message:
+        parent = entry.path
+    elif "This element is not expected" in entry.message:
+        # the element is where a missing one was expected
+        parent = entry.path.rsplit("/", 1)[0]
+    else:
+        return (entry.path, None) in covered
+
+    m = expected_pattern.search(entry.message)
+    if not m:
+        return False
+    names = [n.strip().split("}")[-1] for n in m.group(1).split(",")]
+    return any((parent, n) in covered for n in names)
+
+
+def schema_messages(schema, doc, covered=()):
+    """(level, line, message, (path, None)) for every schema error that is not
+    about something in covered, see reported. Elements that are present but not
+    where the schema expects them are warnings, since mp reports elements in the
+    wrong order as warnings"""
+    msgs = []
+    schema.validate(doc)
+    for e in schema.error_log:
+        if reported(e, covered):
+            continue
+        level = "Warning" if "This element is not expected" in e.message else "Error"
+        msgs.append((level, e.line, e.message, (e.path, None)))
+
+    return msgs
+
+
+def validate(metadata_file, download=True):
+    """Lines of the error report, ending with the summary line"""
+    parser = etree.XMLParser(resolve_entities=False, no_network=True)
+    try:
+        doc = etree.parse(str(metadata_file), parser)
+    except etree.XMLSyntaxError as e:
+        return [f"Error (line {e.lineno}): {e.msg}", "1 error"]
+
+    msgs = rule_messages(doc.getroot())
+    schema = get_schema(download)
+    if schema is not None:
+        msgs.extend(schema_messages(schema, doc, {m[3] for m in msgs}))
+    msgs.sort(key=lambda m: (m[1] or 0))
+
+    lines = [f"{level} (line {line}): {msg}" for level, line, msg, key in msgs]
+    n_errors = len([m for m in msgs if m[0] == "Error"])
+    n_warnings = len(msgs) - n_errors
+    summary = f"{n_errors} error{'s' if n_errors != 1 else ''}" if n_errors else "No errors"
+    if n_warnings:
+        summary += f", {n_warnings} warning{'s' if n_warnings != 1 else ''}"
+    if schema is None:
+        lines.append("FGDC schema not found. Only the metadata rules were checked")
+    lines.append(summary)
+
+    return lines
+
+
+def main(argv):
+    lines = validate(argv[1])
+    if len(argv) > 2:
+        with open(argv[2], "wt", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+    else:
+        print("\n".join(lines))
+
+    return 0 if lines[-1].startswith("No errors") else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,66 @@
+"""Fingerprints of tables and feature classes, used to tell whether they have
+changed since the last time they were read, and a json manifest in which to
+keep them between runs of a tool."""
+
+import hashlib
+import json
+from pathlib import Path
+
+
+def column_fingerprint(columns, oid_field=None, schema=None):
+    """Fingerprint of a table held as columns, {field: [value, value...]}
+    Returns {"rows": row count, "max_oid": largest OBJECTID, "hash": content hash}
+    The hash covers the field names, the schema (list of (name, type) pairs) if
+    supplied, and every value in every column, in order."""
+    fields = list(columns)
+    n_rows = len(columns[fields[0]]) if fields else 0
+
+    h = hashlib.sha1()
+    h.update(repr(fields).encode("utf-8"))
+    if schema:
+        h.update(repr(list(schema)).encode("utf-8"))
+    for row in zip(*[columns[f] for f in fields]):
+        h.update(repr(row).encode("utf-8"))
+
+    max_oid = None
+    if oid_field in columns and n_rows:
+        max_oid = max([i for i in columns[oid_field] if not i is None], default=None)
+
+    return {"rows": n_rows, "max_oid": max_oid, "hash": h.hexdigest()}
+
+
+def file_fingerprint(path):
+    """[size, modification time] of a file or None if it does not exist"""
+    path = Path(path)
+    if not path.exists():
+        return None
+    stat = path.stat()
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def row_hash(row):
+    """Hash of a single row, for finding which rows of a table changed"""
+    return hashlib.sha1(repr(row).encode("utf-8")).hexdigest()
+
+
+def read_manifest(path):
+    """Dictionary stored in a json manifest or an empty dictionary if the file does
+    not exist or cannot be read"""
+    path = Path(path)
+    if not path.exists():
+        return {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_manifest(path, manifest):
+    """Write the manifest dictionary to a json file, replacing the old file only
+    once the new one has been written completely"""
+    path = Path(path)
+    tmp = path.with_name(f"{path.name}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, default=str)
+    tmp.replace(path)
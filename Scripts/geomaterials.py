@@ -0,0 +1,91 @@
+"""Reference GeoMaterialDict, read from GeoMaterialDict.csv in the Scripts folder.
+
+The csv is parsed once and the index is kept in a pickle next to it, named
+GeoMaterialDict.pickle, which is used as long as the hash of the csv has not
+changed. GeoMaterials and definitions are looked up after normalize(), that is,
+in lower case and without leading or trailing spaces. Whether a GeoMaterialDict
+table is the reference table is decided on the values as they are.
+
+    ref = geomaterials.load_reference(csv_path)
+    ref["names"]        set of normalized GeoMaterials
+    ref["definitions"]  {normalized GeoMaterial: normalized Definition}
+    ref["rows"]         [(HierarchyKey, GeoMaterial, IndentedName, Definition)...]
+    ref["domain"]       {GeoMaterial: IndentedName}, the GeoMaterials domain
+"""
+
+import csv
+import hashlib
+import pickle
+from collections import Counter
+from pathlib import Path
+
+fields = ("HierarchyKey", "GeoMaterial", "IndentedName", "Definition")
+
+# change when the contents of the index change so that old pickles are not used
+index_version = 1
+
+# indexes already loaded in this process {csv path: (hash, index)}
+loaded = {}
+
+
+def normalize(s):
+    return "" if s is None else str(s).lower().strip()
+
+
+def file_hash(path):
+    return hashlib.sha1(Path(path).read_bytes()).hexdigest()
+
+
+def parse_csv(csv_path):
+    """Index built from the csv"""
+    with open(csv_path, newline="", encoding="utf-8-sig") as f:
+        rows = [tuple(r[k] for k in fields) for r in csv.DictReader(f)]
+
+    return {
+        "rows": rows,
+        "names": {normalize(r[1]) for r in rows},
+        "definitions": {normalize(r[1]): normalize(r[3]) for r in rows},
+        "domain": {r[1]: r[2] for r in rows},
+    }
+
+
+def load_reference(csv_path):
+    """Index of the reference GeoMaterialDict, from memory, the pickle, or the csv"""
+    csv_path = Path(csv_path)
+    digest = file_hash(csv_path)
+    if csv_path in loaded and loaded[csv_path][0] == digest:
+        return loaded[csv_path][1]
+
+    pickle_path = csv_path.with_suffix(".pickle")
+    index = None
+    try:
+        with open(pickle_path, "rb") as f:
+            cached = pickle.load(f)
+        if cached["hash"] == digest and cached["version"] == index_version:
+            index = cached["index"]
+    except Exception:
+        pass
+
+    if index is None:
+        index = parse_csv(csv_path)
+        # the Scripts folder may be read-only, the index is then rebuilt each time
+        try:
+            tmp = pickle_path.with_name(f"{pickle_path.name}.tmp")
+            with open(tmp, "wb") as f:
+                pickle.dump(
+                    {"hash": digest, "version": index_version, "index": index}, f
+                )
+            tmp.replace(pickle_path)
+        except OSError:
+            pass
+
+    loaded[csv_path] = (digest, index)
+    return index
+
+
+def same_rows(rows, ref):
+    """True if rows, (HierarchyKey, GeoMaterial, IndentedName, Definition) tuples
+    read from a GeoMaterialDict table, are the rows of the reference index, in any
+    order. Values are compared as they are, so that a table that differs from the
+    reference only in case or spaces is refreshed"""
+    return Counter(tuple(r) for r in rows) == Counter(tuple(r) for r in ref["rows"])
@@ -0,0 +1,112 @@
+"""Parsing and indexing of DescriptionOfMapUnits HierarchyKey values.
+
+Every key is split into fragments of letters and numbers in a single pass over
+its characters; anything else is a delimiter. The fragments of all keys go into
+a prefix tree, so that duplicates (keys with the same fragments, whatever the
+delimiter) and children without a parent (1-2-3 without 1-2) are found without
+comparing keys to each other.
+
+    index = hierarchy_keys.analyze({OBJECTID: HierarchyKey, ...})
+"""
+
+
+def tokenize(key):
+    """(fragments, delimiters) of one key, for example
+    "001-002.3" -> (["001", "002", "3"], {"-", "."})"""
+    fragments = []
+    delims = set()
+    start = None
+    for i, c in enumerate(key):
+        if c.isalnum():
+            if start is None:
+                start = i
+        else:
+            delims.add(c)
+            if start is not None:
+                fragments.append(key[start:i])
+                start = None
+    if start is not None:
+        fragments.append(key[start:])
+
+    return fragments, delims
+
+
+def new_node():
+    return {"children": {}, "ids": []}
+
+
+def analyze(hk_dict):
+    """Index of the keys in hk_dict, {id: HierarchyKey}. Returns a dictionary
+        "empty"        ids with no key
+        "delimiters"   sorted list of every delimiter found
+        "duplicates"   {id: key} of keys that have the same fragments as another key
+        "non_numeric"  [(id, key, character)] for each letter found in a key
+        "widths"       sorted list of the lengths of all fragments
+        "orphans"      {id: key} of keys with more than one fragment whose parent
+                       key is not in the table
+        "trie"         prefix tree of fragments, each node {"children": {fragment:
+                       node}, "ids": [ids of the keys that end at the node]}
+    """
+    trie = new_node()
+    empty = []
+    delims = set()
+    non_numeric = []
+    widths = set()
+    ends = {}
+
+    for k, v in hk_dict.items():
+        if v is None or not str(v).strip():
+            empty.append(k)
+            continue
+        fragments, key_delims = tokenize(str(v))
+        delims.update(key_delims)
+
+        node = trie
+        for frag in fragments:
+            widths.add(len(frag))
+            for c in dict.fromkeys(frag):
+                if not c.isdigit():
+                    non_numeric.append((k, v, c))
+            node = node["children"].setdefault(frag, new_node())
+        node["ids"].append(k)
+        ends[k] = (fragments, node)
+
+    duplicates = {}
+    orphans = {}
+    for k, (fragments, node) in ends.items():
+        if len(node["ids"]) > 1:
+            duplicates[k] = hk_dict[k]
+        if len(fragments) > 1:
+            parent = trie
+            for frag in fragments[:-1]:
+                parent = parent["children"][frag]
+            if not parent["ids"]:
+                orphans[k] = hk_dict[k]
+
+    return {
+        "empty": empty,
+        "delimiters": sorted(delims),
+        "duplicates": duplicates,
+        "non_numeric": non_numeric,
+        "widths": sorted(widths),
+        "orphans": orphans,
+        "trie": trie,
+    }
+
+
+def fragment_order(frag):
+    """Sort key that puts 2 before 10 and numbers before letters"""
+    return (0, int(frag), frag) if frag.isdigit() else (1, 0, frag)
+
+
+def ordered_ids(index):
+    """ids in the order of their keys in the hierarchy, parents before children"""
+    ids = []
+    stack = [index["trie"]]
+    while stack:
+        node = stack.pop()
+        ids.extend(node["ids"])
+        children = sorted(node["children"].items(), key=lambda i: fragment_order(i[0]))
+        stack.extend([n for f, n in reversed(children)])
+
+    return ids
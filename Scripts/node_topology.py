@@ -0,0 +1,171 @@
+"""Node building for GeMS_TopologyCheck.py, without arcpy.
+
+Arc endpoints are grouped into nodes by snapping them to a grid of square cells
+as wide as the tolerance. An endpoint joins the node, found in its own cell or one
+of the 8 cells around it, whose first endpoint is less than the tolerance away in
+both x and y. Every endpoint is looked at once, instead of comparing each one with
+its neighbours in a sorted list.
+
+    node_of_point, node_xy = node_topology.snap_points(xs, ys, tolerance)
+
+Arcs to be merged back together after planarization are grouped with a disjoint
+set, so that joining two groups does not relabel every arc already in them.
+
+    group_of_arc = node_topology.merge_groups([(oid, oid), ...])
+
+Azimuths of the arc ends and the node rules that only compare the arcs at each
+node (dangles, 2-arc nodes, counts of concealed arcs) are computed for all arcs
+and nodes at once with numpy.
+
+    rules = node_topology.node_rules(n_arcs, fault, concealed, ...)
+"""
+
+import numpy as np
+
+neighbours = [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)]
+
+
+def snap_points(xs, ys, tolerance):
+    """(node number of each point, [x, y] array of each node). Nodes are numbered
+    in order of x, then y, of their first point"""
+    xy = np.column_stack([np.asarray(xs, dtype=float), np.asarray(ys, dtype=float)])
+    if not len(xy):
+        return np.empty(0, dtype=np.intp), np.empty((0, 2))
+
+    # endpoints of planarized arcs mostly fall on exactly the same coordinates;
+    # only distinct coordinates need to be snapped
+    unique_xy, inverse = np.unique(xy, axis=0, return_inverse=True)
+    if tolerance <= 0:
+        return inverse.ravel(), unique_xy
+
+    cells = np.floor(unique_xy / tolerance).astype(np.int64).tolist()
+    grid = {}
+    anchors = []
+    labels = np.empty(len(unique_xy), dtype=np.intp)
+    for i, (x, y) in enumerate(unique_xy.tolist()):
+        cx, cy = cells[i]
+        node = None
+        nearest = tolerance
+        for dx, dy in neighbours:
+            for n in grid.get((cx + dx, cy + dy), ()):
+                ax, ay = anchors[n]
+                d = max(abs(x - ax), abs(y - ay))
+                if d < nearest:
+                    node = n
+                    nearest = d
+        if node is None:
+            node = len(anchors)
+            anchors.append((x, y))
+            grid.setdefault((cx, cy), []).append(node)
+        labels[i] = node
+
+    return labels[inverse.ravel()], np.array(anchors)
+
+
+def find(parent, i):
+    """Root of the set of i, halving the path to it on the way"""
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def merge_groups(pairs):
+    """{id: group id} of every id in pairs, a list of (id, id) that belong to the
+    same group. Groups are found with a disjoint set, union by rank with path
+    halving, and each is named after its smallest id"""
+    parent = {}
+    rank = {}
+    for a, b in pairs:
+        for i in (a, b):
+            if not i in parent:
+                parent[i] = i
+                rank[i] = 0
+        ra = find(parent, a)
+        rb = find(parent, b)
+        if ra == rb:
+            continue
+        if rank[ra] < rank[rb]:
+            ra, rb = rb, ra
+        parent[rb] = ra
+        if rank[ra] == rank[rb]:
+            rank[ra] += 1
+
+    roots = {i: find(parent, i) for i in parent}
+    names = {}
+    for i, r in roots.items():
+        if not r in names or i < names[r]:
+            names[r] = i
+
+    return {i: names[r] for i, r in roots.items()}
+
+
+def azimuths(x1, y1, x2, y2):
+    """Geographic azimuth, in degrees clockwise from north, of the direction from
+    (x1, y1) to (x2, y2), for arrays of points"""
+    azi = 90 - np.degrees(np.arctan2(np.subtract(y2, y1), np.subtract(x2, x1)))
+    return np.where(azi < 0, azi + 360, azi)
+
+
+def node_order(node_of_point, azimuth):
+    """Indexes of the points, node after node and clockwise by azimuth within
+    each node"""
+    return np.lexsort((azimuth, node_of_point))
+
+
+def codes(values):
+    """Array with the same integer for equal values"""
+    index = {}
+    return np.fromiter(
+        (index.setdefault(v, len(index)) for v in values),
+        dtype=np.intp,
+        count=len(values),
+    )
+
+
+rule_names = (
+    "dangle",
+    "type_mismatch",
+    "concealed_mismatch",
+    "same_attributes",
+    "fault_flip",
+    "same_type",
+)
+
+
+def node_rules(n_arcs, fault, concealed, conc_code, type_code, attr_code, from_end):
+    """Results, one per node, of the node rules that only compare the arcs at a
+    node. The arc arrays hold the arcs of every node, node after node, n_arcs[i]
+    arcs at node i:
+        fault      True if the arc is a fault
+        concealed  True if the arc is concealed
+        conc_code, type_code, attr_code  codes of IsConcealed, of Type, and of the
+                   attributes that must match for two arcs to be merged
+        from_end   True at the start of the arc, False at its end
+    """
+    n_arcs = np.asarray(n_arcs, dtype=np.intp)
+    if not len(n_arcs):
+        empty = {k: np.zeros(0, dtype=bool) for k in rule_names}
+        return {"n_concealed": np.zeros(0, dtype=np.intp), **empty}
+
+    starts = np.concatenate([[0], np.cumsum(n_arcs)[:-1]])
+    last = len(fault) - 1
+    # first, second, and third arc of each node, where there are that many
+    a, b, c = [np.minimum(starts + k, last) for k in range(3)]
+    two = n_arcs == 2
+    three = n_arcs == 3
+
+    return {
+        "n_concealed": np.add.reduceat(concealed.astype(np.intp), starts),
+        "dangle": (n_arcs == 1) & ~fault[a],
+        "type_mismatch": two & (type_code[a] != type_code[b]),
+        "concealed_mismatch": two & (conc_code[a] != conc_code[b]),
+        "same_attributes": two & (attr_code[a] == attr_code[b]),
+        "fault_flip": two & fault[a] & fault[b] & (from_end[a] == from_end[b]),
+        "same_type": three
+        & (
+            (type_code[a] == type_code[b])
+            | (type_code[a] == type_code[c])
+            | (type_code[b] == type_code[c])
+        ),
+    }
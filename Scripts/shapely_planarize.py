@@ -0,0 +1,158 @@
+"""Planarization of ContactsAndFaults with shapely (GEOS), in memory, in place of
+FeatureToLine and Identity with MapUnitPolys in GeMS_TopologyCheck.py.
+
+Every part of every line is split where it crosses or touches another line, or
+crosses the boundary of a polygon. Where a line shares a stretch with another
+line or a polygon boundary, as contacts share the boundaries of the polygons,
+it is only split at the ends of the shared stretch. Lines are split in tiles of
+tile_size lines, in order of x, each tile queried against one STRtree of all
+lines and polygon boundaries.
+
+The polygons to the left and right of each piece are found by testing two points,
+offset to either side of the middle of the piece, against an STRtree of the
+polygons.
+
+    pieces = shapely_planarize.planarize(lines, polys, offset)
+"""
+
+import numpy as np
+import shapely
+from shapely.ops import substring
+
+# lines per tile
+tile_size = 5000
+
+# cuts closer than this to each other or to the end of a line are ignored
+min_piece = 1e-9
+
+
+def split_points(geoms):
+    """(coordinates, index of the geometry) of the points at which intersections
+    split a line: point parts, and the ends of the stretches of line parts once
+    they are merged"""
+    parts, index = shapely.get_parts(geoms, return_index=True)
+    is_line = np.isin(shapely.get_type_id(parts), (1, 2))
+    points = parts[~is_line]
+    point_index = index[~is_line]
+    if is_line.any():
+        line_index, group = np.unique(index[is_line], return_inverse=True)
+        merged = shapely.line_merge(
+            shapely.multilinestrings(parts[is_line], indices=group)
+        )
+        points = np.concatenate([points, shapely.boundary(merged)])
+        point_index = np.concatenate([point_index, line_index])
+    coords, at = shapely.get_coordinates(points, return_index=True)
+    return coords, point_index[at]
+
+
+def self_crossings(line):
+    """Points at which a line crosses or touches itself"""
+    noded = shapely.get_parts(shapely.union_all(line))
+    ends = np.concatenate([shapely.get_point(noded, 0), shapely.get_point(noded, -1)])
+    return shapely.get_coordinates(ends)
+
+
+def cut(line, distances):
+    """Pieces of a line cut at distances along it"""
+    length = line.length
+    d = np.unique(np.concatenate([[0.0], distances, [length]]))
+    d = d[(d >= 0) & (d <= length)]
+    # drop cuts that would make pieces of no length
+    keep = np.concatenate([[True], np.diff(d) > min_piece])
+    d = d[keep]
+    d[-1] = length
+    if len(d) < 2:
+        return [line]
+    return [substring(line, a, b) for a, b in zip(d[:-1], d[1:])]
+
+
+def side_points(pieces, offset):
+    """(left, right) points offset to either side of the middle of each piece"""
+    length = shapely.length(pieces)
+    step = np.minimum(offset, length / 4)
+    mid = shapely.get_coordinates(shapely.line_interpolate_point(pieces, length / 2))
+    ahead = shapely.get_coordinates(
+        shapely.line_interpolate_point(pieces, length / 2 + step)
+    )
+    behind = shapely.get_coordinates(
+        shapely.line_interpolate_point(pieces, length / 2 - step)
+    )
+    direction = ahead - behind
+    norm = np.hypot(direction[:, 0], direction[:, 1])
+    norm[norm == 0] = 1
+    left_normal = np.column_stack([-direction[:, 1], direction[:, 0]]) / norm[:, None]
+    return (
+        shapely.points(mid + offset * left_normal),
+        shapely.points(mid - offset * left_normal),
+    )
+
+
+def containing(tree, points):
+    """Index of the polygon that holds each point, -1 where there is none"""
+    found = np.full(len(points), -1, dtype=np.intp)
+    p, poly = tree.query(points, predicate="within")
+    found[p] = poly
+    return found
+
+
+def planarize(lines, polys, offset):
+    """Split lines, an array of shapely lines, against each other and the
+    boundaries of polys, an array of shapely polygons. Returns a dictionary of
+    arrays, one item per piece:
+        "geometry"  the piece, a LineString
+        "source"    index of the line in lines the piece comes from
+        "left"      index of the polygon in polys to the left, -1 if none
+        "right"     index of the polygon in polys to the right, -1 if none
+    offset is how far to either side of a piece the polygons are looked for; about
+    the XY tolerance
+    """
+    parts, source = shapely.get_parts(lines, return_index=True)
+    n = len(parts)
+    everything = np.concatenate([parts, shapely.boundary(polys)])
+    tree = shapely.STRtree(everything)
+
+    bounds = shapely.bounds(parts)
+    order = np.argsort((bounds[:, 0] + bounds[:, 2]) / 2, kind="stable")
+    cuts = [[] for i in range(n)]
+    for start in range(0, n, tile_size):
+        tile = order[start : start + tile_size]
+        a, b = tree.query(parts[tile], predicate="intersects")
+        a = tile[a]
+        keep = a != b
+        a, b = a[keep], b[keep]
+        coords, at = split_points(shapely.intersection(parts[a], everything[b]))
+        own = a[at]
+        dist = shapely.line_locate_point(parts[own], shapely.points(coords))
+        srt = np.argsort(own, kind="stable")
+        own, dist = own[srt], dist[srt]
+        lines_cut, firsts = np.unique(own, return_index=True)
+        for i, d in zip(lines_cut.tolist(), np.split(dist, firsts[1:])):
+            cuts[i].append(d)
+
+    pieces = []
+    piece_source = []
+    simple = shapely.is_simple(parts)
+    for i in range(n):
+        d = cuts[i]
+        if not simple[i]:
+            crossings = self_crossings(parts[i])
+            d = d + [shapely.line_locate_point(parts[i], shapely.points(crossings))]
+        split = cut(parts[i], np.concatenate(d)) if d else [parts[i]]
+        pieces.extend(split)
+        piece_source.extend([source[i]] * len(split))
+
+    pieces = np.array(pieces, dtype=object)
+    if len(polys) and len(pieces):
+        left_pts, right_pts = side_points(pieces, offset)
+        poly_tree = shapely.STRtree(polys)
+        left = containing(poly_tree, left_pts)
+        right = containing(poly_tree, right_pts)
+    else:
+        left = right = np.full(len(pieces), -1, dtype=np.intp)
+
+    return {
+        "geometry": pieces,
+        "source": np.array(piece_source, dtype=np.intp),
+        "left": left,
+        "right": right,
+    }
@@ -0,0 +1,206 @@
+"""Topology rules 2.3 and 3.2 checked with shapely (GEOS) instead of an
+ArcGIS topology. Geometries are read with OGR, so neither arcpy nor a Topology.gdb
+is needed.
+
+MapUnitPolys rules
+    1 Must Not Have Gaps (Area)
+    3 Must Not Overlap (Area)
+    37 Boundary Must Be Covered By (Area-Line)
+ContactsAndFaults rules
+    19 Must Not Overlap (Line)
+    39 Must Not Self-Overlap (Line)
+    40 Must Not Self-Intersect (Line)
+
+Errors are counted the way an ArcGIS topology creates error features: one
+error for each exterior and interior ring of the union of the polygons (the
+outer boundary of the map counts as one), one for each pair of overlapping
+features, one for each polygon with boundary not covered by lines, one for each
+line that overlaps itself, and one for each point at which a line crosses itself.
+
+The extent is split into tiles which are checked in worker processes. Each feature
+belongs to the tile that contains the center of its bounding box and pairs of
+features are counted by the tile to which the first of the pair belongs.
+"""
+
+import math
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import numpy as np
+import shapely
+from osgeo import ogr
+
+# default XY tolerance of a file geodatabase feature class in meters, used when
+# the XY tolerance of the feature classes is not given to check_pair. Overlaps,
+# gaps, and uncovered boundaries smaller than the tolerance are ignored
+tolerance = 0.001
+
+# features per tile
+tile_size = 5000
+
+
+def database_path(catalog_path):
+    """Path to the file geodatabase or geopackage that holds a feature class"""
+    catalog_path = Path(catalog_path)
+    for p in [catalog_path] + list(catalog_path.parents):
+        if p.suffix.lower() in (".gdb", ".gpkg"):
+            return p
+
+
+def read_geometries(db_path, layer_name):
+    """Array of shapely geometries from a feature class or geopackage layer"""
+    ds = ogr.Open(str(db_path))
+    layer = ds.GetLayerByName(layer_name)
+    wkbs = []
+    for feat in layer:
+        geom = feat.GetGeometryRef()
+        if not geom is None:
+            wkbs.append(bytes(geom.ExportToIsoWkb()))
+
+    return shapely.from_wkb(wkbs) if wkbs else np.array([], dtype=object)
+
+
+def make_tiles(polys, lines, workers):
+    """Split the features into tiles. Returns a list of (polys, lines, owned
+    polygon indexes, owned line indexes, polygon ids, line ids) where polys and
+    lines are every feature that might touch a feature owned by the tile"""
+    n = len(polys) + len(lines)
+    n_tiles = max(workers, math.ceil(n / tile_size))
+    side = max(1, math.ceil(math.sqrt(n_tiles)))
+
+    all_geoms = np.concatenate([polys, lines])
+    xmin, ymin, xmax, ymax = shapely.total_bounds(all_geoms)
+    bounds = shapely.bounds(all_geoms)
+    cx = (bounds[:, 0] + bounds[:, 2]) / 2
+    cy = (bounds[:, 1] + bounds[:, 3]) / 2
+    col = np.minimum(((cx - xmin) / ((xmax - xmin) or 1) * side).astype(int), side - 1)
+    row = np.minimum(((cy - ymin) / ((ymax - ymin) or 1) * side).astype(int), side - 1)
+    tile_of = row * side + col
+
+    poly_tree = shapely.STRtree(shapely.envelope(polys))
+    line_tree = shapely.STRtree(shapely.envelope(lines))
+
+    tiles = []
+    for t in np.unique(tile_of):
+        owned = np.nonzero(tile_of == t)[0]
+        own_polys = owned[owned < len(polys)]
+        own_lines = owned[owned >= len(polys)] - len(polys)
+
+        # every feature that touches the extent of the owned features
+        extent = shapely.box(*shapely.total_bounds(all_geoms[owned]))
+        near_polys = poly_tree.query(extent)
+        near_lines = line_tree.query(extent)
+
+        tiles.append(
+            (
+                shapely.to_wkb(polys[near_polys]),
+                shapely.to_wkb(lines[near_lines]),
+                np.isin(near_polys, own_polys),
+                np.isin(near_lines, own_lines),
+                near_polys,
+                near_lines,
+            )
+        )
+
+    return tiles
+
+
+def pairs(tree, geoms, owned, ids, predicate):
+    """Pairs (i, j) of intersecting geometries where i is owned by this tile and
+    i < j in the whole feature class, so that every pair is found by one tile only"""
+    left, right = tree.query(geoms, predicate=predicate)
+    keep = owned[left] & (ids[left] < ids[right])
+    return left[keep], right[keep]
+
+
+def self_intersections(line):
+    """Number of points at which a line crosses or touches itself"""
+    parts = shapely.get_parts(line)
+    noded = shapely.get_parts(shapely.union_all(parts))
+    ends = shapely.get_coordinates(
+        np.concatenate(
+            [shapely.get_point(noded, 0), shapely.get_point(noded, -1)]
+        )
+    )
+    degree = Counter(map(tuple, ends))
+    return sum(1 for d in degree.values() if d > 2)
+
+
+def check_tile(poly_wkb, line_wkb, own_polys, own_lines, poly_ids, line_ids, tolerance):
+    """Error counts and the union of the owned polygons for one tile"""
+    polys = shapely.from_wkb(poly_wkb)
+    lines = shapely.from_wkb(line_wkb)
+    counts = dict.fromkeys([3, 37, 19, 39, 40], 0)
+
+    if len(polys):
+        # Must Not Overlap (Area)
+        poly_tree = shapely.STRtree(polys)
+        a, b = pairs(poly_tree, polys, own_polys, poly_ids, "intersects")
+        overlap = shapely.area(shapely.intersection(polys[a], polys[b]))
+        counts[3] = int(np.count_nonzero(overlap > tolerance**2))
+
+        # Boundary Must Be Covered By (Area-Line)
+        if len(lines):
+            line_tree = shapely.STRtree(lines)
+        for i in np.nonzero(own_polys)[0]:
+            boundary = shapely.boundary(polys[i])
+            if len(lines):
+                near = line_tree.query(boundary)
+                boundary = shapely.difference(boundary, shapely.union_all(lines[near]))
+            if shapely.length(boundary) > tolerance:
+                counts[37] += 1
+
+    if len(lines):
+        # Must Not Overlap (Line)
+        line_tree = shapely.STRtree(lines)
+        a, b = pairs(line_tree, lines, own_lines, line_ids, "intersects")
+        shared = shapely.length(shapely.intersection(lines[a], lines[b]))
+        counts[19] = int(np.count_nonzero(shared > tolerance))
+
+        for line in lines[own_lines]:
+            # Must Not Self-Overlap (Line): the line is longer than its
+            # dissolved self
+            if shapely.length(line) - shapely.length(shapely.union_all(line)) > tolerance:
+                counts[39] += 1
+            # Must Not Self-Intersect (Line)
+            elif not shapely.is_simple(line):
+                counts[40] += self_intersections(line)
+
+    union = shapely.union_all(polys[own_polys]) if len(polys) else None
+    return counts, shapely.to_wkb(union) if union is not None else None
+
+
+def check_pair(db_path, mup, caf, workers=1, tolerance=tolerance):
+    """Error counts {rule id: count} for a MapUnitPolys and ContactsAndFaults pair.
+    tolerance is the XY tolerance of the feature classes, in their units"""
+    polys = read_geometries(db_path, mup)
+    lines = read_geometries(db_path, caf)
+    counts = dict.fromkeys([1, 3, 37, 19, 39, 40], 0)
+    if not len(polys) and not len(lines):
+        return counts
+
+    tiles = [t + (tolerance,) for t in make_tiles(polys, lines, workers)]
+    if workers > 1 and len(tiles) > 1:
+        # imported here so that reading and checking on one core needs no arcpy
+        import GeMS_utilityFunctions as guf
+
+        guf.set_pool_executable()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(check_tile, *zip(*tiles)))
+    else:
+        results = [check_tile(*tile) for tile in tiles]
+
+    unions = []
+    for tile_counts, union in results:
+        for k, v in tile_counts.items():
+            counts[k] += v
+        if union:
+            unions.append(shapely.from_wkb(union))
+
+    # Must Not Have Gaps (Area): every ring of the union of all polygons
+    if unions:
+        for part in shapely.get_parts(shapely.union_all(unions)):
+            rings = shapely.polygons(shapely.get_rings(part))
+            counts[1] += int(np.count_nonzero(shapely.area(rings) > tolerance**2))
+
+    return counts
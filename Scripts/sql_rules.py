@@ -0,0 +1,557 @@
+"""SQL Rules
+
+Checks the GeMS rules that compare values between tables as SQL queries run
+inside the database, without arcpy and without reading rows into Python.
+Rules 2.4, 2.5, 2.6, 2.7, 2.8, 2.9, 3.3, 3.4, 3.6, 3.8, 3.9, and 3.12 become
+anti-joins, GROUP BY ... HAVING COUNT(*) > 1, and IS NULL queries.
+
+Works on geopackages through the sqlite3 module and on file geodatabases
+through the GDAL OpenFileGDB driver and the OGR SQLite SQL dialect. Neither
+needs an ArcGIS license, so it can be run on any machine with python (and GDAL
+for file geodatabases), for instance a Linux continuous integration server.
+
+This is a separate command line tool. GeMS_ValidateDatabase.py does not call it;
+the validator checks the same rules from its table cache, and those rules also
+collect the map units, terms, and sources that later rules use. A database that
+passes here can still fail the other rules of the validator.
+
+Usage:
+    python sql_rules.py <path to gpkg or gdb> [<path to output file>]
+
+Args:
+    db_path (str) : Path to the geopackage or file geodatabase. Required.
+    out_file (str) : Path to a text file in which to write the errors. Optional.
+      Errors are printed if not supplied.
+
+Returns:
+    Exit code 1 if any errors were found, 0 if not.
+"""
+
+import re
+import sqlite3
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+import GeMS_Definition as gdef
+from catalog import gems_equivalent, sqlite_types, sqlite_shapes
+
+try:
+    from osgeo import ogr
+    from catalog import ogr_types, ogr_shapes
+
+    use_gdal = True
+except ImportError:
+    use_gdal = False
+
+versionString = "sql_rules.py, version of 10/17/2026"
+
+# whitespace characters trimmed when looking for empty strings
+whitespace = "' ' || char(9) || char(10) || char(13)"
+
+
+def q(name):
+    """Quote a table or field name for SQL"""
+    return '"' + name.replace('"', '""') + '"'
+
+
+def gpkg_catalog(conn):
+    """Dictionary of the tables and feature classes in a geopackage with the same
+    keys used by GeMS_ValidateDatabase.py from gdb_object_dict"""
+    shapes = {
+        r[0]: (r[1], r[2])
+        for r in conn.execute(
+            "SELECT table_name, column_name, geometry_type_name FROM gpkg_geometry_columns"
+        )
+    }
+    db_dict = {}
+    for name, data_type in conn.execute(
+        "SELECT table_name, data_type FROM gpkg_contents ORDER BY table_name"
+    ):
+        if data_type == "features" and name in shapes:
+            shape_type = sqlite_shapes.get(shapes[name][1].upper(), "")
+            d = {
+                "dataType": "FeatureClass",
+                "shapeType": shape_type,
+                "concat_type": f"Simple {shape_type} Feature Class",
+            }
+        elif data_type == "attributes":
+            d = {"dataType": "Table", "concat_type": "Nonspatial Table"}
+        else:
+            continue
+
+        fields = []
+        for cid, f_name, decl, notnull, default, pk in conn.execute(
+            f"PRAGMA table_info({q(name)})"
+        ):
+            if pk:
+                f_type = "OID"
+            elif name in shapes and f_name == shapes[name][0]:
+                f_type = "Geometry"
+            else:
+                f_type = sqlite_types.get(re.split(r"\W", decl.upper())[0], "String")
+            fields.append(SimpleNamespace(name=f_name, type=f_type, domain=""))
+
+        d["name"] = name
+        d["catalogPath"] = name
+        d["feature_dataset"] = ""
+        d["fields"] = fields
+        d["gems_equivalent"] = gems_equivalent(name, d["concat_type"])
+        db_dict[name] = d
+
+    return db_dict
+
+
+def gdb_catalog(ds):
+    """Dictionary of the tables and feature classes in a file geodatabase opened
+    with the OpenFileGDB driver with the same keys used by GeMS_ValidateDatabase.py
+    from gdb_object_dict"""
+    # feature datasets from the paths in GDB_Items, eg, \GeologicMap\MapUnitPolys
+    fds = {}
+    for name, path in ogr_rows(ds, "SELECT Name, Path FROM GDB_Items", ""):
+        parts = (path or "").strip("\\").split("\\")
+        if len(parts) > 1:
+            fds[name] = parts[-2]
+
+    db_dict = {}
+    for i in range(ds.GetLayerCount()):
+        layer = ds.GetLayerByIndex(i)
+        name = layer.GetName()
+        geom_type = ogr.GT_Flatten(layer.GetGeomType())
+        if geom_type == ogr.wkbNone:
+            d = {"dataType": "Table", "concat_type": "Nonspatial Table"}
+        elif geom_type in ogr_shapes:
+            shape_type = ogr_shapes[geom_type]
+            d = {
+                "dataType": "FeatureClass",
+                "shapeType": shape_type,
+                "concat_type": f"Simple {shape_type} Feature Class",
+            }
+        else:
+            continue
+
+        fields = [SimpleNamespace(name=layer.GetFIDColumn(), type="OID", domain="")]
+        defn = layer.GetLayerDefn()
+        for j in range(defn.GetFieldCount()):
+            f = defn.GetFieldDefn(j)
+            f_type = ogr_types.get(f.GetType(), "String")
+            if f.GetSubType() == ogr.OFSTInt16:
+                f_type = "SmallInteger"
+            elif f.GetSubType() == ogr.OFSTFloat32:
+                f_type = "Single"
+            fields.append(
+                SimpleNamespace(name=f.GetName(), type=f_type, domain=f.GetDomainName())
+            )
+
+        d["name"] = name
+        d["catalogPath"] = name
+        d["feature_dataset"] = fds.get(name, "")
+        d["fields"] = fields
+        d["gems_equivalent"] = gems_equivalent(name, d["concat_type"])
+        db_dict[name] = d
+
+    return db_dict
+
+
+def ogr_rows(ds, sql, dialect="SQLite"):
+    """Rows of a SQL query run by OGR. Only the result set is read into python"""
+    # OGR returns None instead of raising when a query fails
+    layer = ds.ExecuteSQL(sql, dialect=dialect)
+    if layer is None:
+        raise RuntimeError(f"OGR could not run the query {' '.join(sql.split())}")
+    n = layer.GetLayerDefn().GetFieldCount()
+    rows = [tuple(feat.GetField(i) for i in range(n)) for feat in layer]
+    ds.ReleaseResultSet(layer)
+
+    return rows
+
+
+def open_db(db_path):
+    """Namespace with the catalog of the database and a function that returns
+    the rows of a SQL query"""
+    db_path = Path(db_path)
+    if db_path.suffix == ".gdb":
+        if not use_gdal:
+            raise ValueError("GDAL is required to check file geodatabases")
+        driver = ogr.GetDriverByName("OpenFileGDB")
+        ds = driver.Open(str(db_path)) if driver else None
+        if ds is None:
+            raise ValueError(f"{db_path.name} cannot be opened with OpenFileGDB")
+        return SimpleNamespace(
+            query=lambda sql: ogr_rows(ds, sql),
+            catalog=gdb_catalog(ds),
+            close=lambda: None,
+        )
+
+    if not db_path.suffix == ".gpkg":
+        raise ValueError(f"{db_path.name} is not a geopackage or file geodatabase")
+
+    conn = sqlite3.connect(f"{db_path.resolve().as_uri()}?mode=ro", uri=True)
+    return SimpleNamespace(
+        query=lambda sql: conn.execute(sql).fetchall(),
+        catalog=gpkg_catalog(conn),
+        close=conn.close,
+    )
+
+
+def field_names(db, table, test):
+    """Names of the fields in a table for which test(field) is True"""
+    return [f.name for f in db.catalog[table]["fields"] if test(f)]
+
+
+def not_empty(field):
+    """SQL condition for a value that is not null and not an empty string"""
+    return f"{q(field)} IS NOT NULL AND {q(field)} <> ''"
+
+
+def missing_values(db, tables, fields, ref_table, ref_field, where=None):
+    """Anti-join of the values in each table and field against the values of the
+    reference field. fields is a function that returns the fields to check in a
+    table. Returns a sorted list of (table, field, value)"""
+    findings = []
+    for table in tables:
+        for field in fields(table):
+            conditions = [not_empty(field)]
+            if where and where(table, field):
+                conditions.append(where(table, field))
+            sql = f"""
+                SELECT DISTINCT {q(field)} FROM {q(table)}
+                WHERE {" AND ".join(conditions)}
+                AND {q(field)} NOT IN (
+                    SELECT {q(ref_field)} FROM {q(ref_table)}
+                    WHERE {q(ref_field)} IS NOT NULL
+                )
+                ORDER BY {q(field)}
+            """
+            findings.extend([(table, field, r[0]) for r in db.query(sql)])
+
+    return findings
+
+
+def rule2_4_tables(db):
+    return [
+        k for k, v in db.catalog.items() if v["gems_equivalent"] == "MapUnitPolys"
+    ]
+
+
+def rule2_4(db):
+    """MapUnits in MapUnitPolys missing from DescriptionOfMapUnits"""
+    return missing_values(
+        db,
+        rule2_4_tables(db),
+        lambda t: field_names(db, t, lambda f: f.name.lower() == "mapunit"),
+        "DescriptionOfMapUnits",
+        "MapUnit",
+    )
+
+
+def map_unit_tables(db):
+    """Tables other than DescriptionOfMapUnits and MapUnitPolys with a MapUnit field,
+    checked by rules 3.8 and 3.9"""
+    return [
+        k
+        for k, v in db.catalog.items()
+        if not k in ("DescriptionOfMapUnits", "MapUnitPolys")
+        and field_names(db, k, lambda f: f.name.lower() == "mapunit")
+    ]
+
+
+def rule3_8(db):
+    """MapUnits in all other tables missing from DescriptionOfMapUnits"""
+    return missing_values(
+        db,
+        map_unit_tables(db),
+        lambda t: field_names(db, t, lambda f: f.name.lower() == "mapunit"),
+        "DescriptionOfMapUnits",
+        "MapUnit",
+    )
+
+
+def rule3_9(db):
+    """MapUnits in DescriptionOfMapUnits not used in any other table"""
+    mu_tables = rule2_4_tables(db) + map_unit_tables(db)
+    selects = [
+        f"SELECT {q(f)} FROM {q(t)} WHERE {not_empty(f)}"
+        for t in mu_tables
+        for f in field_names(db, t, lambda f: f.name.lower() == "mapunit")
+    ]
+    used = f"AND MapUnit NOT IN ({' UNION '.join(selects)})" if selects else ""
+    sql = f"""
+        SELECT DISTINCT MapUnit FROM DescriptionOfMapUnits
+        WHERE MapUnit IS NOT NULL {used}
+        ORDER BY MapUnit
+    """
+    return [("DescriptionOfMapUnits", "MapUnit", r[0]) for r in db.query(sql)]
+
+
+def term_fields(db, table):
+    """Fields whose values must be defined in Glossary"""
+    return field_names(
+        db,
+        table,
+        lambda f: f.name in gdef.defined_term_fields_list and f.type == "String",
+    )
+
+
+def glossary_where(table, field):
+    if field == "GeoMaterialConfidence":
+        return "GeoMaterial IS NOT NULL"
+
+
+def glossary_tables(db, level):
+    """Tables checked by rules 2.6 and 3.4"""
+    req = [el for el in gdef.rule2_1_elements if not el in ("GeologicMap", "Glossary")]
+    if level == 2:
+        return [k for k, v in db.catalog.items() if v["gems_equivalent"] in req]
+
+    return [
+        k
+        for k, v in db.catalog.items()
+        if not k == "GeoMaterialDict" and not v["gems_equivalent"] in req
+    ]
+
+
+def rule2_6(db):
+    """Terms in required elements missing from Glossary"""
+    return missing_values(
+        db,
+        glossary_tables(db, 2),
+        lambda t: term_fields(db, t),
+        "Glossary",
+        "Term",
+        glossary_where,
+    )
+
+
+def rule3_4(db):
+    """Terms in all other tables missing from Glossary"""
+    return missing_values(
+        db,
+        glossary_tables(db, 3),
+        lambda t: term_fields(db, t),
+        "Glossary",
+        "Term",
+        glossary_where,
+    )
+
+
+def sources_check(db, level):
+    """Rule 2.8 SourceIDs in required elements missing from DataSources
+    Rule 3.6 SourceIDs in all other tables missing from DataSources
+    Values that are pipe-delimited lists of sources are split into their parts
+    with a recursive common table expression"""
+    if not "DataSources" in db.catalog:
+        return []
+
+    if level == 2:
+        req = [t for t in gdef.rule2_1_elements if not t == "GeologicMap"]
+        tables = [k for k, v in db.catalog.items() if v["gems_equivalent"] in req]
+    else:
+        tables = [k for k in db.catalog if not k in gdef.rule2_1_elements]
+
+    findings = []
+    for table in tables:
+        where = "MapUnit IS NOT NULL" if table == "DescriptionOfMapUnits" else "1"
+        for field in field_names(
+            db, table, lambda f: f.name.lower().endswith("sourceid")
+        ):
+            sql = f"""
+                WITH RECURSIVE parts(el, rest) AS (
+                    SELECT NULL, {q(field)} || '|' FROM {q(table)}
+                    WHERE {not_empty(field)} AND {where}
+                    UNION ALL
+                    SELECT trim(substr(rest, 1, instr(rest, '|') - 1), {whitespace}),
+                    substr(rest, instr(rest, '|') + 1)
+                    FROM parts WHERE rest <> ''
+                )
+                SELECT DISTINCT el FROM parts
+                WHERE el IS NOT NULL AND el NOT IN (
+                    SELECT DataSources_ID FROM DataSources
+                    WHERE DataSources_ID IS NOT NULL
+                )
+                ORDER BY el
+            """
+            for r in db.query(sql):
+                el = r[0]
+                if el.strip() == "" or el.lower() == "<null>":
+                    el = "NULL value or empty string (see Rule 3.13)"
+                findings.append((table, field, el))
+
+    return findings
+
+
+def duplicates(db, table, field):
+    """Values that occur more than once in a field, with the OBJECTIDs of
+    the rows in which they are found. Returns a list of (table, field, value, ids)"""
+    if not table in db.catalog:
+        return []
+
+    # rowid is the OBJECTID in a file geodatabase and the fid in a geopackage
+    sql = f"""
+        SELECT {q(field)}, group_concat(rowid, ', ') FROM {q(table)}
+        WHERE {q(field)} IS NOT NULL
+        GROUP BY {q(field)} HAVING COUNT(*) > 1
+        ORDER BY {q(field)}
+    """
+    return [(table, field, r[0], r[1]) for r in db.query(sql)]
+
+
+def rule3_3(db):
+    """NULL values in critical NoNulls fields of GeMS tables. Returns a list of
+    (table, field, number of rows)"""
+    tables = [
+        k
+        for k, v in db.catalog.items()
+        if v["gems_equivalent"] and not v["gems_equivalent"] == "GeoMaterialDict"
+    ]
+
+    findings = []
+    for table in tables:
+        def_fields = gdef.startDict[db.catalog[table]["gems_equivalent"]]
+        no_nulls = [n[0] for n in def_fields if n[2] == "NoNulls"]
+        for f in db.catalog[table]["fields"]:
+            if not f.name in no_nulls or f.name.lower() == "fieldid":
+                continue
+            empty = f"""{q(f.name)} IS NULL OR (typeof({q(f.name)}) = 'text'
+                AND (trim({q(f.name)}, {whitespace}) = '' OR lower({q(f.name)}) = '<null>'))"""
+            n = db.query(f"SELECT COUNT(*) FROM {q(table)} WHERE {empty}")[0][0]
+            if n:
+                findings.append((table, f.name, n))
+
+    return findings
+
+
+def rule3_12(db):
+    """_ID values found more than once across all tables. Returns a list of
+    (table, field, value)"""
+    selects = [
+        f"SELECT {q(f'{k}_ID')} AS id, '{k}' AS tbl FROM {q(k)}"
+        for k in db.catalog
+        if f"{k}_ID" in field_names(db, k, lambda f: True)
+    ]
+    if not selects:
+        return []
+
+    sql = f"""
+        WITH ids AS ({" UNION ALL ".join(selects)})
+        SELECT tbl, id FROM ids
+        WHERE id IN (
+            SELECT id FROM ids WHERE id IS NOT NULL
+            GROUP BY id HAVING COUNT(*) > 1
+        )
+        GROUP BY id, tbl ORDER BY id, tbl
+    """
+    return [(r[0], f"{r[0]}_ID", r[1]) for r in db.query(sql)]
+
+
+# rule name: (message, required table, function)
+rules = {
+    "2.4": (
+        "map unit(s) missing in DMU",
+        "DescriptionOfMapUnits",
+        rule2_4,
+    ),
+    "2.5": (
+        "duplicated MapUnit(s) in DMU",
+        "DescriptionOfMapUnits",
+        lambda db: duplicates(db, "DescriptionOfMapUnits", "MapUnit"),
+    ),
+    "2.6": (
+        "term(s) missing in Glossary",
+        "Glossary",
+        rule2_6,
+    ),
+    "2.7": (
+        "duplicated terms in Glossary",
+        "Glossary",
+        lambda db: duplicates(db, "Glossary", "Term"),
+    ),
+    "2.8": (
+        "entry(ies) missing in DataSources",
+        "DataSources",
+        lambda db: sources_check(db, 2),
+    ),
+    "2.9": (
+        "duplicated source IDs in DataSources",
+        "DataSources",
+        lambda db: duplicates(db, "DataSources", "DataSources_ID"),
+    ),
+    "3.3": (
+        "missing required value(s)",
+        None,
+        rule3_3,
+    ),
+    "3.4": (
+        "term(s) missing in Glossary",
+        "Glossary",
+        rule3_4,
+    ),
+    "3.6": (
+        "entry(ies) missing in DataSources",
+        "DataSources",
+        lambda db: sources_check(db, 3),
+    ),
+    "3.8": (
+        "map unit(s) missing in DMU",
+        "DescriptionOfMapUnits",
+        rule3_8,
+    ),
+    "3.9": (
+        "unused map unit(s) in DMU",
+        "DescriptionOfMapUnits",
+        rule3_9,
+    ),
+    "3.12": (
+        "duplicated _ID value(s)",
+        None,
+        rule3_12,
+    ),
+}
+
+
+def check_rules(db, names=None):
+    """Check each rule, all of them if names is None.
+    Returns {rule name: list of findings} or None for rules whose required
+    table is missing"""
+    results = {}
+    for name, rule in rules.items():
+        if names and not name in names:
+            continue
+        if rule[1] and not rule[1] in db.catalog:
+            results[name] = None
+        else:
+            results[name] = rule[2](db)
+
+    return results
+
+
+def main(argv):
+    db_path = Path(argv[1])
+    out_file = Path(argv[2]) if len(argv) > 2 and not argv[2] in ("#", "") else None
+
+    db = open_db(db_path)
+    try:
+        results = check_rules(db)
+    finally:
+        db.close()
+
+    lines = [f"{versionString}", f"{db_path}"]
+    n_errors = 0
+    for name, findings in results.items():
+        if findings is None:
+            lines.append(f"Rule {name}: {rules[name][1]} cannot be found. Rule not checked")
+            continue
+        lines.append(f"Rule {name}: {len(findings)} {rules[name][0]}")
+        for finding in findings:
+            lines.append("\t" + ", ".join([str(n) for n in finding]))
+        n_errors += len(findings)
+
+    if out_file:
+        out_file.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    else:
+        print("\n".join(lines))
+
+    return 1 if n_errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,97 @@
+"""Checks of text values made on whole columns at once with numpy, instead of
+one value at a time in python.
+
+Most text columns of a GeMS database repeat a few values (MapUnit, DataSourceID,
+IdentityConfidence...), so when a sample of a column shows that it is repetitive
+only its distinct values are checked and the flags are spread back to the rows.
+Other columns are checked in chunks of chunk_size values so that the fixed-width
+string arrays of numpy 1 stay small even for long text fields. With numpy 2 the
+variable-width StringDType is used.
+
+    bad, padded = string_checks.column_flags(values)
+    bad     zero-length, whitespace-only, or "<null>" strings
+    padded  strings with leading or trailing whitespace
+"""
+
+import numpy as np
+
+try:
+    strings = np.strings
+    string_dtype = np.dtypes.StringDType()
+except AttributeError:
+    strings = np.char
+    string_dtype = str
+
+# text entered in place of a system null, compared in lower case
+null_words = ("<null>", "&ltnull&gt")
+null_lengths = [len(w) for w in null_words]
+
+chunk_size = 1 << 16
+
+# a column is repetitive if no more than a quarter of a sample of this many
+# values are distinct
+sample_size = 4096
+
+
+def array_flags(s):
+    """(bad, padded) of a numpy string array without nulls"""
+    stripped = strings.strip(s)
+    length = strings.str_len(s)
+    stripped_length = strings.str_len(stripped)
+
+    bad = stripped_length == 0
+    # only values as long as one of the null words can be one
+    maybe = np.flatnonzero(np.isin(stripped_length, null_lengths))
+    if len(maybe):
+        lower = strings.lower(stripped[maybe])
+        for word in null_words:
+            bad[maybe[lower == word]] = True
+
+    return bad, stripped_length != length
+
+
+def chunked_flags(values):
+    """(bad, padded) of a sequence of strings and None, a chunk at a time"""
+    n = len(values)
+    bad = np.zeros(n, dtype=bool)
+    padded = np.zeros(n, dtype=bool)
+    for start in range(0, n, chunk_size):
+        chunk = np.asarray(values[start : start + chunk_size], dtype=object)
+        present = np.flatnonzero(np.not_equal(chunk, None))
+        if not len(present):
+            continue
+        s = np.asarray(chunk[present].tolist(), dtype=string_dtype)
+        bad[start + present], padded[start + present] = array_flags(s)
+
+    return bad, padded
+
+
+def column_flags(values):
+    """(bad, padded), boolean arrays the length of values. None is neither.
+    values is a list of strings and None or a numpy string array"""
+    if isinstance(values, np.ndarray) and values.dtype != object:
+        return array_flags(values)
+
+    sample = values[:sample_size]
+    if len(set(sample)) * 4 > len(sample):
+        return chunked_flags(values)
+
+    index = {v: i for i, v in enumerate(dict.fromkeys(values))}
+    codes = np.fromiter(map(index.__getitem__, values), dtype=np.intp, count=len(values))
+    bad, padded = chunked_flags(list(index))
+    return bad[codes], padded[codes]
+
+
+def flagged(ids, mask):
+    """Items of ids where mask is True"""
+    return [ids[i] for i in np.flatnonzero(mask)]
+
+
+def fixes(values):
+    """{index: new value} of the values that have to change: bad values become
+    None and padded values are stripped"""
+    bad, padded = column_flags(values)
+    return {
+        int(i): None if bad[i] else values[i].strip()
+        for i in np.flatnonzero(bad | padded)
+    }
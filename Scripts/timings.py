@@ -0,0 +1,106 @@
+"""Timing of the phases of a tool, for finding out where the time goes.
+
+Each phase records wall time, the number of rows it read or looked at, the
+number of cursors it opened, and the peak memory of the process at the end of
+the phase. Code that reads rows calls count() so that the rows and cursors are
+charged to the phase that is running.
+
+    with timings.phase("Reading tables"):
+        ...
+        timings.count(rows=n, cursors=1)
+"""
+
+import ctypes
+import json
+import sys
+import time
+from contextlib import contextmanager
+
+# list of dictionaries, one per finished phase, in the order they finished
+records = []
+
+# running totals, read at the start and end of each phase
+counters = {"rows": 0, "cursors": 0}
+
+# when timing started, see reset()
+start_time = time.perf_counter()
+
+
+def reset():
+    """Forget earlier records and start timing again"""
+    global start_time
+    records.clear()
+    counters.update(rows=0, cursors=0)
+    start_time = time.perf_counter()
+
+
+def count(rows=0, cursors=0):
+    counters["rows"] += rows
+    counters["cursors"] += cursors
+
+
+def peak_memory():
+    """Largest amount of memory, in MB, used by this process so far or None if it
+    cannot be found"""
+    try:
+        if sys.platform == "win32":
+
+            class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+                _fields_ = [
+                    ("cb", ctypes.c_ulong),
+                    ("PageFaultCount", ctypes.c_ulong),
+                    ("PeakWorkingSetSize", ctypes.c_size_t),
+                    ("WorkingSetSize", ctypes.c_size_t),
+                    ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                    ("PagefileUsage", ctypes.c_size_t),
+                    ("PeakPagefileUsage", ctypes.c_size_t),
+                ]
+
+            pmc = PROCESS_MEMORY_COUNTERS()
+            pmc.cb = ctypes.sizeof(pmc)
+            process = ctypes.windll.kernel32.GetCurrentProcess()
+            ctypes.windll.psapi.GetProcessMemoryInfo(
+                process, ctypes.byref(pmc), pmc.cb
+            )
+            return round(pmc.PeakWorkingSetSize / 1048576, 1)
+        else:
+            import resource
+
+            # kilobytes on Linux, bytes on macOS
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            divisor = 1048576 if sys.platform == "darwin" else 1024
+            return round(peak / divisor, 1)
+    except Exception:
+        return None
+
+
+@contextmanager
+def phase(name):
+    """Time the code in a with block and add a record of it to records.
+    The record is yielded so that it can be sent back from a worker process"""
+    record = {"phase": name}
+    rows = counters["rows"]
+    cursors = counters["cursors"]
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record["seconds"] = round(time.perf_counter() - start, 3)
+        record["rows"] = counters["rows"] - rows
+        record["cursors"] = counters["cursors"] - cursors
+        record["peak_mb"] = peak_memory()
+        records.append(record)
+
+
+def write_json(path, **info):
+    """Write the records, along with any other information, to a json file.
+    Phases that ran at the same time overlap, so total_seconds is the wall time
+    since reset() and not the sum of the phases"""
+    doc = dict(info)
+    doc["total_seconds"] = round(time.perf_counter() - start_time, 3)
+    doc["phases"] = records
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(doc, f, indent=2, default=str)
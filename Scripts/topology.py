@@ -1,13 +1,10 @@
 import arcpy
+import re
 from osgeo import ogr
 from lxml import etree
 from pathlib import Path
 from GeMS_utilityFunctions import addMsgAndPrint as ap
-
-# find the version of Pro being used
-# we have at least one 3+ only method - ExportFeatures
-# may have to test for others
-pro = arcpy.GetInstallInfo()["Version"]
+import fingerprints as fp
 
 top_rules = [
     "esriTRTLineNoOverlap",
@@ -39,6 +36,14 @@ rules_dict = {
 }
 
 
+# if more than this fraction of the features in a pair have changed since
+# Topology.gdb was made, the copies are made again instead of edited
+max_edit_fraction = 0.1
+
+# field of the copies in Topology.gdb that holds the OBJECTID of the source feature
+source_oid = "Source_OID"
+
+
 def n_or_missing(n, l):
     if n in l:
         return n
@@ -99,16 +104,27 @@ def find_topology_pairs(fcs, is_gpkg, db_dict):
     return pairs
 
 
-def export(source, dest, pro):
-    # Try to use ExportFeatures first but if the version is not 3 or above
-    # try the deprecated method FeatureClassToFeatureClass
-    ver = int(pro.split(".")[0])
-    if ver == 3:
-        arcpy.ExportFeatures_conversion(str(source), str(dest))
-    else:
-        arcpy.FeatureClassToFeatureClass_conversion(
-            source, str(dest.parent), str(dest.stem)
-        )
+def copy_features(source, dest):
+    """Copy a feature class into a feature dataset, with the OBJECTID of each
+    source feature in the Source_OID field of its copy, so that the copies can be
+    matched to their sources whatever order they are written in"""
+    desc = arcpy.Describe(str(source))
+    arcpy.CreateFeatureclass_management(
+        str(dest.parent),
+        dest.name,
+        desc.shapeType.upper(),
+        str(source),
+        "SAME_AS_TEMPLATE",
+        "SAME_AS_TEMPLATE",
+    )
+    arcpy.AddField_management(str(dest), source_oid, "LONG")
+
+    dest_fields = set(edit_fields(str(dest)))
+    fields = [f for f in edit_fields(source) if f in dest_fields] + ["SHAPE@"]
+    with arcpy.da.SearchCursor(str(source), fields + ["OID@"]) as s_cursor:
+        with arcpy.da.InsertCursor(str(dest), fields + [source_oid]) as i_cursor:
+            for row in s_cursor:
+                i_cursor.insertRow(row)
 
 
 def create_fd(work_dir, gmap, sr, topo_pair, db_dict):
@@ -132,8 +148,8 @@ def create_fd(work_dir, gmap, sr, topo_pair, db_dict):
     copy_caf = fd_path / topo_pair[3]
 
     ap("\t\tCopying feature classes")
-    export(source_mup, copy_mup, pro)
-    export(source_caf, copy_caf, pro)
+    copy_features(source_mup, copy_mup)
+    copy_features(source_caf, copy_caf)
 
     return gdb_path, str(copy_mup), str(copy_caf)
 
@@ -171,10 +187,118 @@ def add_rules(topology, caf, mup, db_dict):
     arcpy.AddRuleToTopology_management(topology, rules_dict[37], mup, None, caf)
 
 
+def source_rows(source):
+    """{OBJECTID: hash of geometry and attributes} of every feature in a feature class"""
+    fields = ["OID@", "SHAPE@WKB"] + edit_fields(source)
+    with arcpy.da.SearchCursor(source, fields) as cursor:
+        return {r[0]: fp.row_hash(r[1:]) for r in cursor}
+
+
+def edit_fields(fc):
+    """Attribute fields copied between a feature class and its copy in Topology.gdb"""
+    return [
+        f.name
+        for f in arcpy.ListFields(fc)
+        if f.editable
+        and not f.type in ("OID", "Geometry", "GlobalID")
+        and not f.name.lower().startswith("shape_")
+    ]
+
+
+def apply_edits(gdb_path, source, copy, old_rows, new_rows):
+    """Make the copy of a feature class in Topology.gdb match the source by
+    updating, deleting, and inserting only the features that changed. Editing
+    features in a topology marks the area around them as dirty, so the next
+    ValidateTopology only looks at those areas. Copies are matched to their
+    sources by Source_OID"""
+    changed = {o for o, h in new_rows.items() if o in old_rows and h != old_rows[o]}
+    added = {o for o in new_rows if not o in old_rows}
+    deleted = {o for o in old_rows if not o in new_rows}
+
+    copy_fields = set(edit_fields(copy))
+    fields = [f for f in edit_fields(source) if f in copy_fields] + ["SHAPE@"]
+    needed = changed | added
+    with arcpy.da.SearchCursor(source, ["OID@"] + fields) as cursor:
+        rows = {r[0]: list(r[1:]) for r in cursor if r[0] in needed}
+
+    with arcpy.da.Editor(str(gdb_path)):
+        with arcpy.da.UpdateCursor(copy, [source_oid] + fields) as cursor:
+            for row in cursor:
+                src = row[0]
+                if src in deleted:
+                    cursor.deleteRow()
+                elif src in changed:
+                    cursor.updateRow([src] + rows[src])
+        with arcpy.da.InsertCursor(copy, fields + [source_oid]) as cursor:
+            for src in sorted(added):
+                cursor.insertRow(rows[src] + [src])
+
+    ap(f"\t\t{Path(copy).name}: {len(changed)} changed, {len(added)} added, {len(deleted)} deleted")
+
+
+def reuse_topology(work_dir, gmap, topo_pair, db_dict):
+    """Bring an existing topology in Topology.gdb up to date with its source
+    feature classes, using the manifest written the last time it was made.
+    Returns (topology path, has_been_validated) or None if the topology has to be
+    made again"""
+    work_dir = Path(work_dir)
+    gdb_path = work_dir / "Topology.gdb"
+    fd_path = gdb_path / gmap
+    top_path = fd_path / f"{gmap}_Topology"
+    manifest_path = work_dir / "Topology.json"
+
+    manifest = fp.read_manifest(manifest_path)
+    entry = manifest.get(gmap)
+    sources = [db_dict[fc]["catalogPath"] for fc in topo_pair[2:4]]
+    copies = [str(fd_path / fc) for fc in topo_pair[2:4]]
+    if (
+        not entry
+        or not entry["sources"] == sources
+        or not all(arcpy.Exists(str(p)) for p in [top_path] + copies)
+        # copies made before Source_OID was added cannot be matched to sources
+        or not all(source_oid in [f.name for f in arcpy.ListFields(c)] for c in copies)
+    ):
+        return None
+
+    old = [{r[0]: r[1] for r in entry[fc]["rows"]} for fc in topo_pair[2:4]]
+    new = [source_rows(src) for src in sources]
+    if old == new:
+        ap(f"\t\t{gmap} has not changed since Topology.gdb was made")
+        return str(top_path), has_been_validated(str(top_path))
+
+    n_changed = sum(
+        [len([k for k in {**o, **n} if o.get(k) != n.get(k)]) for o, n in zip(old, new)]
+    )
+    if n_changed > max_edit_fraction * sum([len(n) for n in new]):
+        return None
+
+    ap("\t\tUpdating the changed features in Topology.gdb")
+    for i, fc in enumerate(topo_pair[2:4]):
+        apply_edits(gdb_path, sources[i], copies[i], old[i], new[i])
+        entry[fc]["rows"] = [[k, v] for k, v in new[i].items()]
+    fp.write_manifest(manifest_path, manifest)
+
+    return str(top_path), False
+
+
+def save_manifest(work_dir, gmap, topo_pair, db_dict):
+    """Record the rows of the source feature classes copied to Topology.gdb"""
+    manifest_path = Path(work_dir) / "Topology.json"
+    manifest = fp.read_manifest(manifest_path)
+    entry = {"sources": [db_dict[fc]["catalogPath"] for fc in topo_pair[2:4]]}
+    for fc, source in zip(topo_pair[2:4], entry["sources"]):
+        rows = source_rows(source)
+        entry[fc] = {"rows": [[k, v] for k, v in rows.items()]}
+    manifest[gmap] = entry
+    fp.write_manifest(manifest_path, manifest)
+
+
 def make_topology(work_dir, topo_pair, db_dict):
     """make a topology in a scratch gdb. Called in the case of no topology
     in input gdb or geopackage
     topo_pair  = [GeologicMap feature dataset(if gdb), fd_tag_name, mapunitpolys, contactsandfaults]
+    A topology made on an earlier run is reused if the feature classes have not
+    changed, or updated if only a few features have changed
     """
 
     if topo_pair[0]:
@@ -216,10 +340,20 @@ def make_topology(work_dir, topo_pair, db_dict):
 
             gmap = f"{prefix}{gmap}{suffix}"
 
+    reused = reuse_topology(work_dir, gmap, topo_pair, db_dict)
+    if reused:
+        return reused
+
+    # start over with a new feature dataset and copies of the feature classes
+    fd_path = Path(work_dir) / "Topology.gdb" / gmap
+    if arcpy.Exists(str(fd_path)):
+        arcpy.Delete_management(str(fd_path))
+
     gdb_path, topo_mup, topo_caf = create_fd(work_dir, gmap, sr, topo_pair, db_dict)
     top_path = add_topology(gdb_path, gmap, topo_caf, topo_mup)
     add_rules(top_path, topo_caf, topo_mup, db_dict)
     arcpy.ValidateTopology_management(top_path)
+    save_manifest(work_dir, gmap, topo_pair, db_dict)
 
     # return full path to topology and has_been_validated
     return top_path, True
@@ -235,13 +369,26 @@ def get_gdb_item(ds, sql):
         return None
 
 
-def make_topology_dict(ds, root, db_dict):
+def load_gdb_items(ds):
+    """{Name: ObjectID} of every item in GDB_Items, read with one query"""
+    l = ds.ExecuteSQL("SELECT ObjectID, Name FROM GDB_Items")
+    items = {}
+    if not l is None:
+        items = {feat.GetField(1): feat.GetField(0) for feat in l}
+        ds.ReleaseResultSet(l)
+
+    return items
+
+
+def make_topology_dict(ds, root, db_dict, items=None):
+    if items is None:
+        items = load_gdb_items(ds)
+    item_names = {v: k for k, v in items.items()}
     rules = root.findall(".//TopologyRule")
     top_dict = {}
     for rule in rules:
-        origin_id = rule.find("OriginClassID").text
-        sql = f"SELECT Name from GDB_Items WHERE ObjectID = {origin_id}"
-        origin_class = get_gdb_item(ds, sql)
+        origin_id = int(rule.find("OriginClassID").text)
+        origin_class = item_names.get(origin_id)
         rule_type = rule.find("TopologyRuleType").text
         if not origin_class in top_dict:
             top_dict[origin_class] = [rule_type]
@@ -253,8 +400,7 @@ def make_topology_dict(ds, root, db_dict):
             rule_type == "esriTRTAreaBoundaryCoveredByLine"
             and db_dict[origin_class]["gems_equivalent"] == "MapUnitPolys"
         ):
-            sql = f"SELECT Name from GDB_Items WHERE ObjectID = {rule.find('DestinationClassID').text}"
-            dest_class = get_gdb_item(ds, sql)
+            dest_class = item_names.get(int(rule.find("DestinationClassID").text))
             top_dict["mup_dest"] = dest_class
         else:
             top_dict["mup_dest"] = None
@@ -262,20 +408,29 @@ def make_topology_dict(ds, root, db_dict):
     return top_dict
 
 
-def check_errors_table(ds, table, origin_id, rule_ids, dest_id=None):
-    """select rows from the T_errors table where the rule and the class ids match
-    a valid topology will return no rows"""
+def error_counts(ds, table):
+    """{(TopoRuleType, OriginClassID): number of errors} in a T_errors table,
+    counted for all rules and feature classes with one query"""
+    sql = f"""SELECT TopoRuleType, OriginClassID, COUNT(*) FROM {table}
+        WHERE IsException = 0 GROUP BY TopoRuleType, OriginClassID"""
+    l = ds.ExecuteSQL(sql, dialect="SQLite")
+    counts = {}
+    if not l is None:
+        counts = {(feat.GetField(0), feat.GetField(1)): feat.GetField(2) for feat in l}
+        ds.ReleaseResultSet(l)
+
+    return counts
+
+
+def check_errors_table(counts, origin_id, rule_ids):
+    """look up the number of errors in a T_errors table, as counted by error_counts(),
+    where the rule and the class ids match. a valid topology has no errors"""
     errors = []
     errors_pass = True
 
     for n in rule_ids:
-        # if n != 37:
-        sql = f"""SELECT * from {table} WHERE TopoRuleType = {n} 
-            and OriginClassID = {origin_id}
-            and IsException = 0"""
-        l = ds.ExecuteSQL(sql)
-        if l.GetFeatureCount() > 0:
-            i = l.GetFeatureCount()
+        i = counts.get((n, origin_id), 0)
+        if i > 0:
             if i == 1:
                 errors.append(f"Rule '{rules_dict[n]}' has {i} error")
             else:
@@ -315,18 +470,55 @@ def has_been_validated(top_path):
     return has_been_validated
 
 
-def eval_topology(db, top, db_dict, gmap, level_2_errors, level_3_errors):
+def export_errors(ds, counts, gmap, errors_gpkg):
+    """Copy the error features of each rule in each T_errors table to a layer
+    in a geopackage named for the feature dataset, rule, and error geometry, eg,
+    GeologicMap_Must_Not_Overlap_Area_poly"""
+    driver = ogr.GetDriverByName("GPKG")
+    if Path(errors_gpkg).exists():
+        out_ds = driver.Open(str(errors_gpkg), 1)
+    else:
+        out_ds = driver.CreateDataSource(str(errors_gpkg))
+
+    for table, table_counts in counts.items():
+        kind = table.split("_")[-1].replace("Errors", "").lower()
+        for n in sorted(set([k[0] for k in table_counts])):
+            if not n in rules_dict:
+                continue
+            sql = f"SELECT * FROM {table} WHERE TopoRuleType = {n} AND IsException = 0"
+            l = ds.ExecuteSQL(sql)
+            if not l is None:
+                rule_name = re.sub(r"\W+", "_", rules_dict[n]).strip("_")
+                out_ds.CopyLayer(l, f"{gmap}_{rule_name}_{kind}", ["OVERWRITE=YES"])
+                ds.ReleaseResultSet(l)
+    out_ds = None
+
+
+def eval_topology(
+    db, top, db_dict, gmap, level_2_errors, level_3_errors, errors_gpkg=None
+):
+    """Count the errors of each rule in a validated topology. If errors_gpkg is
+    supplied, the error features are also copied to that geopackage"""
     ds = ogr.GetDriverByName("OpenFileGDB").Open(db)
     top_def = get_gdb_item(ds, f"SELECT Definition FROM GDB_Items WHERE name = '{top}'")
 
     # make a dictionary of d[FeatureClass] = [rule1, rule2, rule3] from the Definition in XML
     root = etree.fromstring(top_def)
-    top_dict = make_topology_dict(ds, root, db_dict)
+    items = load_gdb_items(ds)
+    top_dict = make_topology_dict(ds, root, db_dict, items)
     top_id = root.find("TopologyID").text
     point_errors = f"T_{top_id}_PointErrors"
     line_errors = f"T_{top_id}_LineErrors"
     poly_errors = f"T_{top_id}_PolyErrors"
 
+    # one GROUP BY query per error table
+    counts = {
+        table: error_counts(ds, table)
+        for table in (point_errors, line_errors, poly_errors)
+    }
+    if errors_gpkg:
+        export_errors(ds, counts, gmap, errors_gpkg)
+
     found_caf = False
     found_mup = False
 
@@ -359,17 +551,10 @@ def eval_topology(db, top, db_dict, gmap, level_2_errors, level_3_errors):
                 )
 
         # now, check the T_<top_id>_errors tables
-        origin_id = get_gdb_item(
-            ds, f"SELECT ObjectID FROM GDB_Items WHERE Name = '{mup}'"
-        )
-        dest_id = None
-        if mup_dest:
-            dest_id = get_gdb_item(
-                ds, f"SELECT ObjectID FROM GDB_Items WHERE Name = '{mup_dest}'"
-            )
+        origin_id = items.get(mup)
 
         for table in [line_errors, poly_errors]:
-            results = check_errors_table(ds, table, origin_id, level_2_ids, dest_id)
+            results = check_errors_table(counts[table], origin_id, level_2_ids)
             if not results[0]:
                 level_2_errors.extend([f"&emsp;{res}" for res in results[1]])
 
@@ -384,9 +569,7 @@ def eval_topology(db, top, db_dict, gmap, level_2_errors, level_3_errors):
         found_caf = True
         caf_rules = top_dict[caf]
         # now, check the T_<top_id>_errors tables
-        origin_id = get_gdb_item(
-            ds, f"SELECT ObjectID FROM GDB_Items WHERE Name = '{caf}'"
-        )
+        origin_id = items.get(caf)
 
         level_3_errors.extend(
             [
@@ -397,7 +580,7 @@ def eval_topology(db, top, db_dict, gmap, level_2_errors, level_3_errors):
         )
 
         for table in [point_errors, line_errors, poly_errors]:
-            results = check_errors_table(ds, table, origin_id, level_3_ids)
+            results = check_errors_table(counts[table], origin_id, level_3_ids)
             if not results[0]:
                 level_3_errors.extend([f"&emsp;{r}" for r in results[1]])
 
@@ -423,3 +606,72 @@ def eval_topology(db, top, db_dict, gmap, level_2_errors, level_3_errors):
         level_3_errors.insert(3, f'<span class="table">{gmap}</span>')
 
     return level_2_errors, level_3_errors
+
+
+def rule_counts(db, top, db_dict):
+    """{rule id: number of errors} of the MapUnitPolys and ContactsAndFaults rules
+    in a validated topology, in the form returned by shapely_topology.check_pair"""
+    ds = ogr.GetDriverByName("OpenFileGDB").Open(db)
+    top_def = get_gdb_item(ds, f"SELECT Definition FROM GDB_Items WHERE name = '{top}'")
+    root = etree.fromstring(top_def)
+    items = load_gdb_items(ds)
+    top_dict = make_topology_dict(ds, root, db_dict, items)
+    top_id = root.find("TopologyID").text
+    tables = [
+        error_counts(ds, f"T_{top_id}_{kind}Errors") for kind in ("Point", "Line", "Poly")
+    ]
+
+    counts = {}
+    for gems_eq, ids in (("MapUnitPolys", level_2_ids), ("ContactsAndFaults", level_3_ids)):
+        fcs = [
+            k
+            for k in top_dict
+            if k != "mup_dest" and db_dict[k]["gems_equivalent"] == gems_eq
+        ]
+        if fcs:
+            origin_id = items.get(fcs[0])
+            for n in ids:
+                counts[n] = sum(t.get((n, origin_id), 0) for t in tables)
+
+    return counts
+
+
+def compare_counts(gmap, esri_counts, geos_counts):
+    """Print the error counts of each rule found by the ArcGIS topology and by
+    shapely_topology side by side. Returns the ids of the rules that differ"""
+    ap(f"\t\tTopology error counts in {gmap}, ArcGIS topology | shapely")
+    differ = []
+    for n in level_2_ids + level_3_ids:
+        esri = esri_counts.get(n)
+        geos = geos_counts.get(n, 0)
+        same = esri is None or esri == geos
+        if not same:
+            differ.append(n)
+        flag = "" if same else "  <-- differs"
+        ap(f"\t\t\t{rules_dict[n]}: {'-' if esri is None else esri} | {geos}{flag}")
+
+    return differ
+
+
+def report_counts(counts, gmap, level_2_errors, level_3_errors):
+    """Add error counts {rule id: count}, as found by shapely_topology.check_pair,
+    to the lists of errors in the same words used by eval_topology"""
+    for ids, errors in ((level_2_ids, level_2_errors), (level_3_ids, level_3_errors)):
+        for n in ids:
+            i = counts.get(n, 0)
+            if i == 1:
+                errors.append(f"&emsp;Rule '{rules_dict[n]}' has {i} error")
+            elif i > 1:
+                errors.append(f"&emsp;Rule '{rules_dict[n]}' has {i} errors")
+
+    # the outer boundary of the map is always one gap error
+    if "&emsp;Rule 'Must Not Have Gaps (Area)' has 1 error" in level_2_errors:
+        level_2_errors.remove("&emsp;Rule 'Must Not Have Gaps (Area)' has 1 error")
+
+    if len(level_2_errors) > 3:
+        level_2_errors.insert(3, f'<span class="table">{gmap}</span>')
+
+    if len(level_3_errors) > 3:
+        level_3_errors.insert(3, f'<span class="table">{gmap}</span>')
+
+    return level_2_errors, level_3_errors
@@ -0,0 +1,209 @@
+"""Machine-readable results of GeMS_ValidateDatabase.py, for collecting the results
+of many validations without reading the html reports.
+
+<gdb name>-ValidationFindings.ndjson
+    One json object per line for every error and warning, written from the lists
+    each rule returns as soon as the rule finishes:
+    {"database", "rule", "level", "table", "field", "id_field", "id", "value", "message"}
+    The lists are still kept for the html reports, so the validator holds every
+    finding in memory as before; the file lets other programs read the findings
+    one line at a time instead of loading a whole report.
+    level is "error" or "warning". table, field, id_field, id, and value are null
+    when the finding does not name them. message is the finding as plain text.
+
+<gdb name>-Validation.json
+    One json document with the level of compliance, the parameters, and the
+    number of errors and warnings of each rule. Rules that could not be checked
+    have a note and null errors.
+
+The rules return their errors and warnings as html lists (see the notes at the top
+of GeMS_ValidateDatabase.py). Each item that is about a table, field, row, or value
+is a Finding, the html string that also carries those names, so that they do not
+have to be read back out of the html.
+"""
+
+import html
+import json
+import re
+from pathlib import Path
+
+tag = re.compile(r"<[^>]*>")
+spaces = re.compile(r"\s+")
+
+# lists of warnings returned by the rules and the rule that returns each
+warning_outputs = {
+    "sr_warnings": "2.1",
+    "missing_warnings": "3.3",
+    "term_warnings": "3.4",
+    "mu_warnings": "3.8",
+    "hkey_warnings": "3.10",
+    "end_spaces": "3.13",
+    "fld_warnings": "3.1",
+    "et_warnings": "",
+}
+
+rule_output = re.compile(r"rule(\d)_(\d+)$")
+
+
+def plain_text(s):
+    """html as a single line of plain text"""
+    return spaces.sub(" ", html.unescape(tag.sub("", str(s)))).strip()
+
+
+class Finding(str):
+    """html of one error or warning, as it appears in the reports, that also names
+    the table, field, id field and id of the row, and value it is about. Names
+    that do not apply are None"""
+
+    names = ("table", "field", "id_field", "id", "value")
+
+    def __new__(cls, html, table=None, field=None, id_field=None, id=None, value=None):
+        f = super().__new__(cls, html)
+        f.table = table
+        f.field = field
+        f.id_field = id_field
+        f.id = id
+        f.value = value
+        return f
+
+    def named(self):
+        return {k: getattr(self, k) for k in self.names}
+
+
+def rule_lines(result):
+    """Errors of a rule. The result is [message, header, anchor, error, error...]
+    or a note, [note], [note, None], or just a string, if the rule could not be
+    checked. Returns (checked, errors) where errors is empty if the rule was not
+    checked"""
+    if isinstance(result, str):
+        return False, []
+    if len(result) >= 3:
+        return True, result[3:]
+    return False, []
+
+
+def rule_note(result):
+    """The note of a rule that could not be checked"""
+    return plain_text(result if isinstance(result, str) else result[0])
+
+
+def finding(line):
+    """Dictionary of the table, field, id, and value of one error or warning, as
+    given by the rule that found it. Lines that are not a Finding name none"""
+    if isinstance(line, Finding):
+        f = line.named()
+    else:
+        f = dict.fromkeys(Finding.names)
+    f["message"] = plain_text(line)
+    return f
+
+
+def to_json(result):
+    """Result of a rule with each Finding in it as a dictionary, to be stored as
+    json"""
+    if isinstance(result, Finding):
+        return {"__finding__": str(result), **result.named()}
+    if isinstance(result, (list, tuple)):
+        return [to_json(r) for r in result]
+    if isinstance(result, dict):
+        return {k: to_json(v) for k, v in result.items()}
+    return result
+
+
+def from_json(result):
+    """Result of a rule stored by to_json"""
+    if isinstance(result, dict):
+        if "__finding__" in result:
+            return Finding(
+                result["__finding__"], **{k: result.get(k) for k in Finding.names}
+            )
+        return {k: from_json(v) for k, v in result.items()}
+    if isinstance(result, list):
+        return [from_json(r) for r in result]
+    return result
+
+
+class FindingsWriter:
+    """Writes the findings of each rule to an ndjson file as they arrive and keeps
+    only the number of errors and warnings of each rule"""
+
+    def __init__(self, path, database):
+        self.path = Path(path)
+        self.database = database
+        self.errors = {}
+        self.warnings = {}
+        self.written = set()
+        self.file = open(self.path, "w", encoding="utf-8")
+
+    def write_line(self, rule, level, html_line):
+        row = {"database": self.database, "rule": rule, "level": level}
+        row.update(finding(html_line))
+        self.file.write(json.dumps(row, default=str) + "\n")
+
+    def write(self, output, result, rule=None):
+        """Write the findings of one output of a rule, for example "rule2_4" or
+        "mu_warnings". Outputs that are not lists of errors or warnings are ignored
+        and each output is only written once"""
+        if output in self.written:
+            return
+        m = rule_output.match(output)
+        if m:
+            rule = f"{m.group(1)}.{m.group(2)}"
+            # the note of a rule that was not checked is not an error
+            checked, lines = rule_lines(result)
+            self.errors[rule] = len(lines) if checked else None
+            level = "error"
+        elif output in warning_outputs and isinstance(result, list):
+            rule = rule or warning_outputs[output]
+            # [description, warning, warning...]
+            lines = result[1:]
+            self.warnings[output] = len(lines)
+            level = "warning"
+        else:
+            return
+
+        self.written.add(output)
+        for line in lines:
+            self.write_line(rule, level, line)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def write_summary(path, val, writer, level, **info):
+    """Write the json document of one validation. level is 1, 2, or 3"""
+    rules = []
+    for lev, n in ((2, 10), (3, 14)):
+        for i in range(1, n):
+            result = val.get(f"rule{lev}_{i}")
+            if result is None:
+                continue
+            rule = f"{lev}.{i}"
+            checked, lines = rule_lines(result)
+            rules.append(
+                {
+                    "rule": rule,
+                    "title": plain_text(result[1]) if checked else None,
+                    "checked": checked,
+                    "note": None if checked else rule_note(result),
+                    "errors": writer.errors.get(rule, len(lines)) if checked else None,
+                }
+            )
+
+    doc = {
+        "database": writer.database,
+        "version": val.get("version_string"),
+        "datetime": val.get("datetime"),
+        "level": level,
+        "compliance": plain_text(val.get("level", "")),
+        "parameters": val.get("parameters", [])[1:],
+        "rules": rules,
+        "warnings": writer.warnings,
+        "metadata": plain_text(val.get("metadata_summary", "")),
+        "findings": writer.path.name,
+    }
+    doc.update(info)
+
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(doc, f, indent=2, default=str)